@@ -0,0 +1,403 @@
+"""
+Micro-benchmarks run by ``manage.py loadtest --bench NAME``.
+
+Each one times a single code path in-process against the ``generate_data``
+rows and yields one row per case; times are the best of ``--repeat`` runs
+in milliseconds, so background noise only ever makes a case look slower.
+"""
+import itertools
+import time
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+def best_ms(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+@benchmark('serializers')
+def serializers(command, repeat):
+    """DRF serializers against their compiled read serializers, at 1k and 10k rows"""
+    from cart.models import CartItem
+    from cart.serializers import CartItemSerializer
+    from common.fastread import read_serializer
+    from common.queryplan import eager_load
+    from menu.models import MenuItem
+    from menu.serializers import MenuItemSerializer
+    from orders.models import Order, OrderItem
+    from orders.serializers import OrderItemSerializer, OrderSerializer
+    from restaurants.models import Restaurant
+    from restaurants.serializers import RestaurantSerializer
+
+    cases = [
+        (MenuItemSerializer, MenuItem.objects.all()),
+        (OrderItemSerializer, OrderItem.objects.all()),
+        (CartItemSerializer, CartItem.objects.all()),
+        (RestaurantSerializer, Restaurant.objects.all()),
+        (OrderSerializer, Order.objects.all()),
+    ]
+    for serializer_class, queryset in cases:
+        loaded = list(eager_load(queryset, serializer_class)[:1000])
+        if not loaded:
+            continue
+        compiled = read_serializer(serializer_class)
+        for size in (1000, 10000):
+            rows = list(itertools.islice(itertools.cycle(loaded), size))
+            drf = best_ms(lambda: serializer_class(rows, many=True).data, repeat)
+            fast = best_ms(lambda: compiled(rows, many=True).data, repeat)
+            yield {
+                'case': f'{serializer_class.__name__} x{size}',
+                'drf_ms': drf,
+                'compiled_ms': fast,
+                'speedup': drf / fast,
+            }
+
+
+@benchmark('checkout')
+def checkout(command, repeat):
+    """create_order latency and queries by cart size, with lines from the largest menu"""
+    from django.test import Client
+
+    from cart.models import Cart, CartItem
+    from common.querycheck import record_queries
+    from menu.models import MenuItem
+
+    client = Client()
+    user = command.users['customer'][0]
+    headers = {'Authorization': f'Bearer {command.tokens[user.pk]}'}
+    restaurant_id = max(command.restaurant_ids, key=lambda pk: len(command.menus[pk]))
+    menu = list(MenuItem.objects.filter(pk__in=command.menus[restaurant_id]))
+    cart, _ = Cart.objects.get_or_create(user=user)
+
+    def fill_cart(size):
+        CartItem.objects.filter(cart=cart).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, menu_item=item, quantity=1, price_snapshot=item.price) for item in menu[:size]
+        ])
+
+    def place_order():
+        started = time.perf_counter()
+        response = client.post(
+            '/api/orders/create_order/',
+            {'payment_method': 'cod', 'delivery_address': '1 Benchmark Lane'},
+            content_type='application/json',
+            headers=headers,
+        )
+        elapsed = time.perf_counter() - started
+        if response.status_code != 201:
+            raise RuntimeError(f'create_order answered {response.status_code}: {response.content[:200]!r}')
+        return elapsed * 1000
+
+    # Warm the user and token caches so every size counts the same queries
+    fill_cart(1)
+    place_order()
+    for size in (1, 5, 15, 50):
+        if size > len(menu):
+            break
+        fill_cart(size)
+        with record_queries() as queries:
+            place_order()
+        timings = []
+        for _ in range(repeat):
+            fill_cart(size)
+            timings.append(place_order())
+        timings.sort()
+        yield {
+            'case': f'{size} lines',
+            'best_ms': timings[0],
+            'median_ms': timings[len(timings) // 2],
+            'max_ms': timings[-1],
+            'queries': len(queries),
+        }
+
+
+@benchmark('auth')
+def auth(command, repeat):
+    """A role-gated read (the admin user list) with the user loaded per request vs read from token claims"""
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    from adminpanel.views import AdminUserViewSet
+    from common.querycheck import record_queries
+    from users.authentication import CachedJWTAuthentication, invalidate_user
+
+    factory = RequestFactory()
+    user = command.users['admin'][0]
+    headers = {'Authorization': f'Bearer {command.tokens[user.pk]}'}
+    requests = 200
+
+    def serve(view):
+        response = view(factory.get('/api/admin/users/', headers=headers)).render()
+        if response.status_code != 200:
+            raise RuntimeError(f'The admin user list answered {response.status_code}')
+
+    cases = [
+        ('user row per request (simplejwt)', JWTAuthentication, None),
+        ('token claims', CachedJWTAuthentication, None),
+        # A token minted before the user last changed falls back to the user cache
+        ('user cache (stale claims)', CachedJWTAuthentication, invalidate_user),
+    ]
+    for case, authentication, before in cases:
+        if before is not None:
+            before(user.pk)
+        view = AdminUserViewSet.as_view({'get': 'list'}, authentication_classes=[authentication])
+        serve(view)
+        with record_queries() as queries:
+            serve(view)
+        ms = best_ms(lambda: [serve(view) for _ in range(requests)], repeat)
+        yield {
+            'case': case,
+            'req_per_s': requests / ms * 1000,
+            'ms_per_req': ms / requests,
+            'queries': len(queries),
+        }
+
+
+@benchmark('throttling')
+def throttling(command, repeat):
+    """Cost of each token-bucket check, and of the cart view with and without its throttles"""
+    from django.test import RequestFactory
+    from rest_framework.request import Request
+    from rest_framework.settings import api_settings
+
+    from cart.views import CartViewSet
+    from common.throttling import IPTokenBucketThrottle, ScopedTokenBucketThrottle, UserTokenBucketThrottle
+
+    factory = RequestFactory()
+    user = command.users['customer'][0]
+    headers = {'Authorization': f'Bearer {command.tokens[user.pk]}'}
+    checks = 10000
+
+    request = Request(factory.get('/api/cart/'))
+    request.user = user
+    view = CartViewSet()
+    for throttle_class in (UserTokenBucketThrottle, IPTokenBucketThrottle, ScopedTokenBucketThrottle):
+        throttle = throttle_class()
+        ms = best_ms(lambda: [throttle.allow_request(request, view) for _ in range(checks)], repeat)
+        yield {'case': throttle_class.__name__, 'us_per_request': ms * 1000 / checks}
+
+    requests = 500
+    for case, throttle_classes in (
+        ('GET /api/cart/ throttled', api_settings.DEFAULT_THROTTLE_CLASSES),
+        ('GET /api/cart/ unthrottled', []),
+    ):
+        cart_view = CartViewSet.as_view({'get': 'list'}, throttle_classes=throttle_classes)
+
+        def serve():
+            for _ in range(requests):
+                response = cart_view(factory.get('/api/cart/', headers=headers)).render()
+                if response.status_code != 200:
+                    raise RuntimeError(f'The cart answered {response.status_code}')
+
+        yield {'case': case, 'us_per_request': best_ms(serve, repeat) * 1000 / requests}
+
+
+@benchmark('asgi')
+def asgi(command, repeat):
+    """The async read routes through the WSGI handler (a thread per client) vs the ASGI one (one event loop)"""
+    # In-process, so it compares the handlers rather than servers; for those,
+    # run loadtest --url against a WSGI and an ASGI server side by side
+    import asyncio
+    import threading
+
+    from django.db import connections
+    from django.test import AsyncClient, Client
+
+    from adminpanel.management.commands.loadtest import percentile
+
+    user = command.users['customer'][0]
+    headers = {'Authorization': f'Bearer {command.tokens[user.pk]}'}
+    restaurant_id = command.restaurant_ids[0]
+    paths = [
+        '/api/restaurants/',
+        f'/api/restaurants/{restaurant_id}/',
+        f'/api/restaurants/{restaurant_id}/menu/',
+        f'/api/menu/?restaurant={restaurant_id}',
+        '/api/menu/categories/',
+        '/api/orders/',
+    ]
+    requests = 600
+
+    def check(response, path):
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} answered {response.status_code}')
+
+    def run_wsgi(concurrency):
+        latencies = []
+
+        def client_thread(offset):
+            client = Client()
+            try:
+                for index in range(offset, requests, concurrency):
+                    path = paths[index % len(paths)]
+                    started = time.perf_counter()
+                    check(client.get(path, headers=headers), path)
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client_thread, args=(offset,)) for offset in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies
+
+    async def run_asgi(concurrency):
+        latencies = []
+        client = AsyncClient()
+
+        async def client_task(offset):
+            for index in range(offset, requests, concurrency):
+                path = paths[index % len(paths)]
+                started = time.perf_counter()
+                check(await client.get(path, headers=headers), path)
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(client_task(offset) for offset in range(concurrency)))
+        return latencies
+
+    for concurrency in (1, 16):
+        for handler, run in (('WSGI', run_wsgi), ('ASGI', lambda concurrency: asyncio.run(run_asgi(concurrency)))):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                latencies = sorted(run(concurrency))
+                elapsed = time.perf_counter() - started
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, latencies)
+            elapsed, latencies = best
+            yield {
+                'case': f'{handler}, {concurrency} clients',
+                'req_per_s': requests / elapsed,
+                'p50_ms': percentile(latencies, 0.50) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+            }
+
+
+@benchmark('json')
+def json_rendering(command, repeat):
+    """OrderSerializer(many=True) output rendered by DRF's JSONRenderer vs orjson, then compressed"""
+    from rest_framework.renderers import JSONRenderer
+
+    from common import compression
+    from common.queryplan import eager_load
+    from common.renderers import ORJSONRenderer
+    from orders.models import Order
+    from orders.serializers import OrderSerializer
+
+    encodings = ['gzip'] + (['br'] if compression.brotli is not None else [])
+    for size in (100, 1000):
+        data = OrderSerializer(eager_load(Order.objects.all()[:size], OrderSerializer), many=True).data
+        if len(data) < size:
+            break
+        for case, renderer in (('JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer())):
+            content = renderer.render(data)
+            yield {
+                'case': f'{case} x{size}',
+                'ms': best_ms(lambda: renderer.render(data), repeat),
+                'kb': len(content) / 1024,
+            }
+        for encoding in encodings:
+            yield {
+                'case': f'ORJSONRenderer + {encoding} x{size}',
+                'ms': best_ms(lambda: compression._compress(renderer.render(data), encoding), repeat),
+                'kb': len(compression._compress(content, encoding)) / 1024,
+            }
+
+
+@benchmark('middleware')
+def middleware(command, repeat):
+    """Per-request cost of a trivial API read under the API-exempt middleware, Django's stock stack and none"""
+    from django.conf import settings
+    from django.test import Client, override_settings
+    from django.utils.module_loading import import_string
+
+    from common.querycheck import record_queries
+
+    def stock(path):
+        # common.middleware classes wrap the Django original they subclass
+        if not path.startswith('common.middleware.'):
+            return path
+        original = import_string(path).__bases__[-1]
+        return f'{original.__module__}.{original.__qualname__}'
+
+    stacks = [
+        ('API-exempt stack', settings.MIDDLEWARE),
+        ('stock Django stack', [stock(path) for path in settings.MIDDLEWARE]),
+        ('no middleware', []),
+    ]
+    requests = 1000
+    # A browser that once used the admin sends these with every API call
+    cookies = 'sessionid=expired0session0key0000000000000000; csrftoken=' + 'x' * 32
+    for case, stack in stacks:
+        with override_settings(MIDDLEWARE=stack):
+            client = Client(HTTP_COOKIE=cookies)
+
+            def serve():
+                response = client.get('/api/menu/categories/')
+                if response.status_code != 200:
+                    raise RuntimeError(f'The category list answered {response.status_code}')
+
+            serve()
+            with record_queries() as queries:
+                serve()
+            ms = best_ms(lambda: [serve() for _ in range(requests)], repeat)
+        yield {'case': case, 'us_per_request': ms * 1000 / requests, 'queries': len(queries)}
+
+
+@benchmark('pricing')
+def pricing(command, repeat):
+    """Pricing and rendering a large cart's lines and totals in Decimal rupees vs integer paise"""
+    import random
+    from decimal import Decimal
+
+    from rest_framework import serializers
+
+    from common import money
+    from menu.models import MenuItem
+
+    cent = Decimal('0.01')
+    decimal_field = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    money_field = money.MoneyField()
+
+    def in_rupees(lines):
+        # The per-line quantize() arithmetic common.money replaced
+        subtotals = [(price * quantity).quantize(cent) for price, quantity in lines]
+        subtotal = sum(subtotals, Decimal('0.00'))
+        tax = (subtotal * money.TAX_RATE).quantize(cent)
+        total = (subtotal + tax + money.DELIVERY_FEE).quantize(cent)
+        return [decimal_field.to_representation(amount) for amount in [*subtotals, subtotal, tax, total]]
+
+    def in_paise(lines):
+        subtotals = [money.line_subtotal(price, quantity) for price, quantity in lines]
+        return [money_field.to_representation(amount) for amount in [*subtotals, *money.totals(sum(subtotals))]]
+
+    rng = random.Random(25)
+    prices = list(MenuItem.objects.values_list('price', flat=True)[:500])
+    if not prices:
+        return
+    for size in (100, 1000, 10000):
+        lines = [(rng.choice(prices), rng.randint(1, 5)) for _ in range(size)]
+        if in_rupees(lines) != in_paise(lines):
+            raise RuntimeError('Paise and Decimal pricing disagree')
+        decimal_ms = best_ms(lambda: in_rupees(lines), repeat)
+        paise_ms = best_ms(lambda: in_paise(lines), repeat)
+        yield {
+            'case': f'{size} lines',
+            'decimal_ms': decimal_ms,
+            'paise_ms': paise_ms,
+            'speedup': decimal_ms / paise_ms,
+        }
@@ -0,0 +1,239 @@
+"""
+Synthetic dataset generator.
+
+Builds the same kinds of rows as ``data.json`` (users by role, restaurants,
+categories, menu items, carts, orders with items, reviews) at any size,
+with bulk inserts in fixed-size batches so memory stays flat up to millions
+of orders. The same ``--seed`` always produces the same data.
+
+Primary keys are assigned here (continuing from the current maximum) so
+child rows can be built without reading parents back; MySQL and SQLite
+both carry their auto-increment counters past explicit ids. Every
+generated user shares one password (hashed once) and an email of the form
+``<prefix>-<role>-<n>@example.com``, which ``manage.py loadtest`` uses.
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from cart.models import Cart, CartItem
+from common import money
+from menu.models import Category, MenuItem
+from orders.models import Order, OrderItem
+from restaurants.models import Restaurant, Review
+from restaurants.ratings import rebuild_rating_aggregates
+from users.models import User
+
+CATEGORY_NAMES = [
+    'Biryani', 'Pizza', 'Burgers', 'Starters', 'Desserts', 'Drinks',
+    'North Indian', 'South Indian', 'Chinese', 'Rolls', 'Salads', 'Breakfast',
+]
+
+# Share of generated orders in each status (roughly a day's steady state)
+ORDER_STATUSES = {
+    'delivered': 70,
+    'cancelled': 5,
+    'placed': 8,
+    'accepted': 5,
+    'cooking': 5,
+    'out_for_delivery': 7,
+}
+
+REVIEW_STARS = {5: 40, 4: 30, 3: 15, 2: 8, 1: 7}
+
+
+def _next_id(model):
+    return (model.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset shaped like data.json at a configurable size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--owners', type=int, default=50)
+        parser.add_argument('--agents', type=int, default=100)
+        parser.add_argument('--admins', type=int, default=2)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--categories', type=int, default=len(CATEGORY_NAMES))
+        parser.add_argument('--items-per-restaurant', type=int, default=15)
+        parser.add_argument('--carts', type=int, default=300, help='Customers with a non-empty cart')
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--reviews', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='bench', help='Email prefix for generated users')
+        parser.add_argument('--password', default='benchpass123')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+
+        if User.objects.filter(email__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users with the '{prefix}-' prefix already exist; pass another --prefix")
+        if options['customers'] < 1 or options['restaurants'] < 1 or options['owners'] < 1:
+            raise CommandError('Need at least one customer, owner and restaurant')
+
+        started = time.monotonic()
+        users = self.create_users(prefix, make_password(options['password']))
+        categories = self.create_categories()
+        restaurants = self.create_restaurants(prefix, users['owner'])
+        menus = self.create_menu_items(restaurants, categories)
+        self.create_carts(users['customer'], menus)
+        self.create_orders(users['customer'], users['agent'], menus)
+        self.create_reviews(users['customer'], restaurants)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated dataset in {time.monotonic() - started:.1f}s'
+        ))
+
+    def log(self, label, count, started):
+        self.stdout.write(f'  {label:<12} {count:>10,}  ({time.monotonic() - started:.1f}s)')
+
+    def bulk_create(self, model, rows):
+        for start in range(0, len(rows), self.batch_size):
+            model.objects.bulk_create(rows[start:start + self.batch_size])
+
+    def create_users(self, prefix, password_hash):
+        started = time.monotonic()
+        next_id = _next_id(User)
+        users = {}
+        rows = []
+        for role in ('customer', 'owner', 'agent', 'admin'):
+            users[role] = []
+            for n in range(1, self.options[f'{role}s'] + 1):
+                email = f'{prefix}-{role}-{n}@example.com'
+                rows.append(User(
+                    id=next_id, email=email, username=email, password=password_hash,
+                    name=f'{role.title()} {n}', role=role,
+                    is_staff=role == 'admin', is_superuser=role == 'admin',
+                ))
+                users[role].append(next_id)
+                next_id += 1
+        self.bulk_create(User, rows)
+        self.log('users', len(rows), started)
+        return users
+
+    def create_categories(self):
+        started = time.monotonic()
+        names = CATEGORY_NAMES[:self.options['categories']]
+        names += [f'Category {n}' for n in range(len(names) + 1, self.options['categories'] + 1)]
+        # Category names are unique and shared with any existing data
+        Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+        ids = list(Category.objects.filter(name__in=names).values_list('id', flat=True))
+        self.log('categories', len(ids), started)
+        return ids
+
+    def create_restaurants(self, prefix, owners):
+        started = time.monotonic()
+        next_id = _next_id(Restaurant)
+        rows = [
+            Restaurant(
+                id=next_id + n, owner_id=owners[n % len(owners)],
+                name=f'{prefix.title()} Kitchen {n + 1}', address=f'{n + 1} Benchmark Road',
+                is_active=self.rng.random() < 0.95,
+            )
+            for n in range(self.options['restaurants'])
+        ]
+        self.bulk_create(Restaurant, rows)
+        self.log('restaurants', len(rows), started)
+        return [row.id for row in rows]
+
+    def create_menu_items(self, restaurants, categories):
+        """Returns ``{restaurant_id: [(menu_item_id, price), ...]}`` of available items"""
+        started = time.monotonic()
+        next_id = _next_id(MenuItem)
+        menus = {}
+        rows = []
+        for restaurant_id in restaurants:
+            menus[restaurant_id] = []
+            for n in range(self.options['items_per_restaurant']):
+                price = Decimal(self.rng.randrange(40, 600, 10))
+                available = self.rng.random() < 0.95
+                rows.append(MenuItem(
+                    id=next_id, restaurant_id=restaurant_id, category_id=self.rng.choice(categories),
+                    name=f'Dish {n + 1}', price=price, description='Synthetic menu item',
+                    is_available=available,
+                ))
+                if available:
+                    menus[restaurant_id].append((next_id, price))
+                next_id += 1
+        self.bulk_create(MenuItem, rows)
+        self.log('menu items', len(rows), started)
+        return {restaurant_id: items for restaurant_id, items in menus.items() if items}
+
+    def pick_lines(self, menu):
+        """1-4 distinct menu items with quantities, all from one restaurant"""
+        count = min(self.rng.randint(1, 4), len(menu))
+        return [(item, self.rng.randint(1, 3)) for item in self.rng.sample(menu, count)]
+
+    def create_carts(self, customers, menus):
+        started = time.monotonic()
+        next_id = _next_id(Cart)
+        carts, lines = [], []
+        restaurant_ids = list(menus)
+        for user_id in self.rng.sample(customers, min(self.options['carts'], len(customers))):
+            carts.append(Cart(id=next_id, user_id=user_id))
+            for (menu_item_id, price), quantity in self.pick_lines(menus[self.rng.choice(restaurant_ids)]):
+                lines.append(CartItem(
+                    cart_id=next_id, menu_item_id=menu_item_id, quantity=quantity, price_snapshot=price,
+                ))
+            next_id += 1
+        self.bulk_create(Cart, carts)
+        self.bulk_create(CartItem, lines)
+        self.log('carts', len(carts), started)
+
+    def create_orders(self, customers, agents, menus):
+        started = time.monotonic()
+        next_id = _next_id(Order)
+        restaurant_ids = list(menus)
+        # A few popular restaurants take most of the orders
+        weights = [1 / (rank + 1) for rank in range(len(restaurant_ids))]
+        statuses, status_weights = zip(*ORDER_STATUSES.items())
+
+        remaining = self.options['orders']
+        while remaining > 0:
+            size = min(self.batch_size, remaining)
+            orders, lines = [], []
+            chosen = self.rng.choices(restaurant_ids, weights=weights, k=size)
+            for restaurant_id, order_status in zip(chosen, self.rng.choices(statuses, status_weights, k=size)):
+                subtotal = 0
+                for (menu_item_id, price), quantity in self.pick_lines(menus[restaurant_id]):
+                    lines.append(OrderItem(order_id=next_id, menu_item_id=menu_item_id, quantity=quantity, price=price))
+                    subtotal += money.line_subtotal(price, quantity)
+                # Placed orders, and some accepted ones, still wait for an agent
+                unassigned = order_status == 'placed' or (order_status == 'accepted' and self.rng.random() < 0.5)
+                orders.append(Order(
+                    id=next_id, user_id=self.rng.choice(customers), restaurant_id=restaurant_id,
+                    total_amount=money.from_paise(money.totals(subtotal)[2]),
+                    payment_method=self.rng.choice(('cod', 'online')), status=order_status,
+                    assigned_agent_id=None if unassigned or not agents else self.rng.choice(agents),
+                    delivery_address=f'{self.rng.randint(1, 999)} Customer Street',
+                ))
+                next_id += 1
+            Order.objects.bulk_create(orders)
+            self.bulk_create(OrderItem, lines)
+            remaining -= size
+        self.log('orders', self.options['orders'], started)
+
+    def create_reviews(self, customers, restaurants):
+        started = time.monotonic()
+        wanted = min(self.options['reviews'], len(customers) * len(restaurants))
+        pairs = set()
+        while len(pairs) < wanted:
+            pairs.add((self.rng.choice(customers), self.rng.choice(restaurants)))
+        stars, star_weights = zip(*REVIEW_STARS.items())
+        rows = [
+            Review(user_id=user_id, restaurant_id=restaurant_id, rating=rating, comment='Synthetic review')
+            for (user_id, restaurant_id), rating in zip(sorted(pairs), self.rng.choices(stars, star_weights, k=wanted))
+        ]
+        self.bulk_create(Review, rows)
+        # bulk_create skips the review signals, so rebuild the aggregates
+        rebuild_rating_aggregates(Restaurant, Review, batch_size=self.batch_size)
+        self.log('reviews', len(rows), started)
@@ -0,0 +1,478 @@
+"""
+Load benchmark for the API.
+
+Runs ``--concurrency`` worker threads, each repeatedly picking a scenario
+from the ``--mix`` weights and playing it against the API as one of the
+users made by ``manage.py generate_data``:
+
+* browse: restaurant list (two pages), detail, menu, reviews, categories
+  and menu items, anonymously or as a customer;
+* cart: view the cart, add an item, change its quantity, remove it;
+* checkout: empty the cart, add items from one restaurant, place the
+  order and list the customer's orders;
+* owner: list the restaurant's orders and move a new one along
+  (placed -> accepted -> cooking);
+* agent: claim the next available order and deliver it, now and then
+  listing assigned and available orders;
+* admin: page through the admin users, restaurants and orders lists;
+* auth: log in, refresh the token and, occasionally, register.
+
+Requests are reported per route (ids in the path become ``{id}``) with
+their count, 4xx and error (5xx or transport failure) counts, latency
+percentiles and overall throughput.
+
+By default requests go through Django in this process, against whatever
+``DATABASES`` points at (SQLite works, so does a local MySQL), with the
+API throttles lifted. SQLite allows one writer at a time, so write-heavy
+mixes above ``--concurrency 1`` report its "database is locked" errors.
+``--url`` sends the requests over HTTP to a running server instead; that
+server must share this ``SECRET_KEY`` since access tokens are minted here,
+and its throttles stay in force.
+
+``--bench NAME`` runs one of the micro-benchmarks in
+``adminpanel.benchmarks`` instead of the traffic mix and prints a row per
+case (``--bench list`` names them all).
+"""
+import http.client
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+
+from adminpanel.benchmarks import BENCHMARKS
+from menu.models import MenuItem
+from users.models import User
+from users.tokens import RoleRefreshToken
+
+SCENARIOS = ('browse', 'cart', 'checkout', 'owner', 'agent', 'admin', 'auth')
+DEFAULT_MIX = 'browse=50,cart=15,checkout=10,owner=8,agent=8,admin=4,auth=5'
+
+# Every throttle scope effectively unlimited for in-process runs
+UNTHROTTLED_RATE = '1000000/s'
+
+NEXT_STATUS = {'placed': 'accepted', 'accepted': 'cooking'}
+
+_ID = re.compile(r'/\d+(?=/)')
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise CommandError(f"Unknown scenario '{name}'; choose from {', '.join(SCENARIOS)}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for '{name}': {weight}")
+    if not any(mix.values()):
+        raise CommandError('The mix needs at least one positive weight')
+    return mix
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def results_of(data):
+    """List of objects from a paginated or plain list response"""
+    if isinstance(data, dict):
+        return data.get('results') or []
+    return data if isinstance(data, list) else []
+
+
+class InProcessTransport:
+    """Sends requests through Django's test client (one per thread)"""
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+
+    def request(self, method, path, headers, body):
+        response = self.client.generic(
+            method, path, data=body or '', content_type='application/json', headers=headers,
+        )
+        content = b'' if response.streaming else response.content
+        return response.status_code, response.get('Content-Type', ''), content
+
+    def close(self):
+        # Worker threads open their own database connections
+        connections.close_all()
+
+
+class HTTPTransport:
+    """Sends requests over one keep-alive connection (one per thread)"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=30)
+        self.base = parts.path.rstrip('/')
+
+    def request(self, method, path, headers, body):
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json', **headers}
+        try:
+            self.connection.request(method, self.base + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.getheader('Content-Type', ''), response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self.connection.close()
+            raise
+
+    def close(self):
+        self.connection.close()
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, command, index, transport, rng, deadline, warmup_until):
+        super().__init__(name=f'loadtest-{index}', daemon=True)
+        self.command = command
+        self.index = index
+        self.transport = transport
+        self.rng = rng
+        self.deadline = deadline
+        self.warmup_until = warmup_until
+        # route -> [latencies]; route -> {'4xx': n, 'errors': n}
+        self.latencies = defaultdict(list)
+        self.counts = defaultdict(lambda: {'4xx': 0, 'errors': 0})
+        self.scenarios_run = 0
+
+    def users(self, role):
+        """This worker's share of a role, so no two threads share a cart or an order queue"""
+        users = self.command.users[role]
+        mine = users[self.index::self.command.concurrency]
+        return mine or users
+
+    def call(self, method, path, user=None, data=None):
+        headers = {}
+        if user is not None:
+            headers['Authorization'] = f'Bearer {self.command.tokens[user.pk]}'
+        body = json.dumps(data) if data is not None else None
+        route = f'{method} {_ID.sub("/{id}", path.split("?", 1)[0])}'
+
+        started = time.perf_counter()
+        try:
+            status_code, content_type, content = self.transport.request(method, path, headers, body)
+        except Exception:
+            status_code, content_type, content = None, '', b''
+        elapsed = time.perf_counter() - started
+
+        if started >= self.warmup_until:
+            self.latencies[route].append(elapsed)
+            if status_code is None or status_code >= 500:
+                self.counts[route]['errors'] += 1
+            elif status_code >= 400:
+                self.counts[route]['4xx'] += 1
+
+        if status_code is None or 'json' not in content_type or not content:
+            return status_code, None
+        try:
+            return status_code, json.loads(content)
+        except ValueError:
+            return status_code, None
+
+    def run(self):
+        names, weights = zip(*self.command.mix.items())
+        try:
+            while time.monotonic() < self.deadline and self.command.take_iteration():
+                scenario = self.rng.choices(names, weights)[0]
+                getattr(self, f'scenario_{scenario}')()
+                self.scenarios_run += 1
+        finally:
+            self.transport.close()
+
+    def scenario_browse(self):
+        user = self.rng.choice(self.users('customer')) if self.rng.random() < 0.5 else None
+        status_code, data = self.call('GET', '/api/restaurants/', user)
+        next_url = data.get('next') if isinstance(data, dict) else None
+        if next_url:
+            parts = urlsplit(next_url)
+            self.call('GET', f'{parts.path}?{parts.query}', user)
+
+        restaurant_id = self.rng.choice(self.command.restaurant_ids)
+        self.call('GET', f'/api/restaurants/{restaurant_id}/', user)
+        self.call('GET', f'/api/restaurants/{restaurant_id}/menu/', user or self.rng.choice(self.users('customer')))
+        self.call('GET', f'/api/restaurants/reviews/?restaurant={restaurant_id}', user)
+        self.call('GET', '/api/menu/categories/', user)
+        self.call('GET', f'/api/menu/?restaurant={restaurant_id}', user)
+
+    def scenario_cart(self):
+        user = self.rng.choice(self.users('customer'))
+        self.call('GET', '/api/cart/', user)
+        menu_item_id = self.rng.choice(self.command.menus[self.rng.choice(self.command.restaurant_ids)])
+        status_code, cart = self.call('POST', '/api/cart/add/', user, {'menu_item_id': menu_item_id, 'quantity': 1})
+        line = next(
+            (item for item in (cart or {}).get('items', []) if item.get('menu_item') == menu_item_id), None
+        )
+        if line is None:
+            return
+        self.call('POST', '/api/cart/update_quantity/', user, {'cart_item_id': line['id'], 'quantity': 2})
+        self.call('POST', '/api/cart/remove/', user, {'cart_item_id': line['id']})
+
+    def scenario_checkout(self):
+        user = self.rng.choice(self.users('customer'))
+        status_code, cart = self.call('GET', '/api/cart/', user)
+        for item in (cart or {}).get('items', []):
+            self.call('POST', '/api/cart/remove/', user, {'cart_item_id': item['id']})
+        menu = self.command.menus[self.rng.choice(self.command.restaurant_ids)]
+        for menu_item_id in self.rng.sample(menu, min(len(menu), self.rng.randint(1, 3))):
+            self.call('POST', '/api/cart/add/', user, {
+                'menu_item_id': menu_item_id,
+                'quantity': self.rng.randint(1, 3),
+            })
+        self.call('POST', '/api/orders/create_order/', user, {
+            'payment_method': self.rng.choice(('cod', 'online')),
+            'delivery_address': f'{self.rng.randint(1, 999)} Load Test Lane',
+        })
+        self.call('GET', '/api/orders/', user)
+
+    def scenario_owner(self):
+        user = self.rng.choice(self.users('owner'))
+        status_code, data = self.call('GET', '/api/orders/', user)
+        for order in results_of(data):
+            next_status = NEXT_STATUS.get(order.get('status'))
+            if next_status:
+                self.call('POST', f'/api/orders/{order["id"]}/update_status/', user, {'status': next_status})
+                break
+
+    def scenario_agent(self):
+        user = self.rng.choice(self.users('agent'))
+        if self.rng.random() < 0.1:
+            self.call('GET', '/api/agent/orders/', user)
+            self.call('GET', '/api/agent/orders/available_orders/', user)
+        status_code, claimed = self.call('POST', '/api/agent/orders/claim_next/', user, {'count': 1})
+        for order in results_of(claimed):
+            path = f'/api/agent/orders/{order["id"]}/update_delivery_status/'
+            self.call('POST', path, user, {'status': 'out_for_delivery'})
+            self.call('POST', path, user, {'status': 'delivered'})
+
+    def scenario_admin(self):
+        user = self.rng.choice(self.users('admin'))
+        for resource in ('orders', 'users', 'restaurants'):
+            status_code, data = self.call('GET', f'/api/admin/{resource}/', user)
+            items = results_of(data)
+            if items:
+                self.call('GET', f'/api/admin/{resource}/{items[0]["id"]}/', user)
+
+    def scenario_auth(self):
+        user = self.rng.choice(self.users('customer'))
+        status_code, data = self.call('POST', '/api/auth/login/', None, {
+            'email': user.email, 'password': self.command.password,
+        })
+        if data and data.get('refresh'):
+            self.call('POST', '/api/auth/refresh/', None, {'refresh': data['refresh']})
+        if self.rng.random() < 0.1:
+            password = uuid.uuid4().hex
+            self.call('POST', '/api/auth/register/', None, {
+                'name': 'Load Test', 'email': f'{self.command.prefix}-load-{uuid.uuid4().hex[:12]}@example.com',
+                'password': password, 'password2': password, 'role': 'customer',
+            })
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the API with a mix of customer, owner, agent and admin traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run (after warmup)')
+        parser.add_argument('--iterations', type=int, default=0, help='Stop after this many scenarios in total')
+        parser.add_argument('--warmup', type=float, default=2, help='Seconds of traffic left out of the report')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Scenario weights, e.g. browse=80,checkout=20')
+        parser.add_argument('--url', help='Base URL of a running server; by default requests run in-process')
+        parser.add_argument('--prefix', default='bench', help='Email prefix used by generate_data')
+        parser.add_argument('--password', default='benchpass123')
+        parser.add_argument('--users', type=int, default=500, help='Users of each role to load')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this file')
+        parser.add_argument('--bench', help='Run this micro-benchmark instead of the traffic mix')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per --bench case')
+
+    def handle(self, *args, **options):
+        if options['bench'] == 'list':
+            for name, function in sorted(BENCHMARKS.items()):
+                self.stdout.write(f'{name:<14} {function.__doc__}')
+            return
+        if options['bench'] and options['bench'] not in BENCHMARKS:
+            raise CommandError(f"Unknown benchmark '{options['bench']}'; choose from {', '.join(sorted(BENCHMARKS))}")
+        if options['bench'] and options['url']:
+            raise CommandError('--bench runs in-process; drop --url')
+
+        self.mix = parse_mix(options['mix'])
+        self.concurrency = max(1, options['concurrency'])
+        self.prefix = options['prefix']
+        self.password = options['password']
+        self.load_fixtures(options['users'])
+
+        self._iterations_left = options['iterations'] or None
+        self._iterations_lock = threading.Lock()
+
+        if options['url']:
+            return self.run(options, lambda: HTTPTransport(options['url']))
+
+        rest_framework = getattr(settings, 'REST_FRAMEWORK', {})
+        rates = {scope: UNTHROTTLED_RATE for scope in rest_framework.get('DEFAULT_THROTTLE_RATES', {})}
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            REST_FRAMEWORK={**rest_framework, 'DEFAULT_THROTTLE_RATES': rates},
+        ):
+            if options['bench']:
+                self.bench(options)
+            else:
+                self.run(options, InProcessTransport)
+
+    def bench(self, options):
+        name = options['bench']
+        repeat = max(1, options['repeat'])
+        self.stdout.write(f'{name}: {BENCHMARKS[name].__doc__} ({repeat} runs per case)')
+        rows = list(BENCHMARKS[name](self, repeat))
+        if not rows:
+            raise CommandError("Nothing to benchmark; run manage.py generate_data first")
+
+        columns = list(rows[0])
+        cells = [
+            [str(row[columns[0]]), *(f'{row[column]:.2f}' if isinstance(row[column], float) else str(row[column])
+                                     for column in columns[1:])]
+            for row in rows
+        ]
+        widths = [max(len(column), *(len(line[index]) for line in cells)) for index, column in enumerate(columns)]
+        for line in [columns, *cells]:
+            self.stdout.write(' '.join(
+                [f'{line[0]:<{widths[0]}}', *(f'{cell:>{width}}' for cell, width in zip(line[1:], widths[1:]))]
+            ))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump({'benchmark': name, 'repeat': repeat, 'rows': rows}, handle, indent=2)
+
+    def load_fixtures(self, per_role):
+        self.users = {}
+        for role in ('customer', 'owner', 'agent', 'admin'):
+            self.users[role] = list(
+                User.objects.filter(email__startswith=f'{self.prefix}-{role}-', role=role).order_by('id')[:per_role]
+            )
+        missing = [role for role, users in self.users.items() if not users]
+        if missing:
+            raise CommandError(
+                f"No '{self.prefix}' users with role {', '.join(missing)}; run manage.py generate_data first"
+            )
+        self.tokens = {
+            user.pk: str(RoleRefreshToken.for_user(user).access_token)
+            for users in self.users.values() for user in users
+        }
+
+        self.menus = defaultdict(list)
+        available = MenuItem.objects.filter(is_available=True, restaurant__is_active=True)
+        for restaurant_id, menu_item_id in available.values_list('restaurant_id', 'id').iterator():
+            self.menus[restaurant_id].append(menu_item_id)
+        self.restaurant_ids = sorted(self.menus)
+        if not self.restaurant_ids:
+            raise CommandError('No active restaurants with available menu items')
+
+    def take_iteration(self):
+        if self._iterations_left is None:
+            return True
+        with self._iterations_lock:
+            if self._iterations_left <= 0:
+                return False
+            self._iterations_left -= 1
+            return True
+
+    def run(self, options, transport_factory):
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        started = time.monotonic()
+        warmup_until = time.perf_counter() + options['warmup']
+        deadline = started + options['warmup'] + options['duration']
+        workers = [
+            Worker(self, index, transport_factory(), random.Random(seed + index), deadline, warmup_until)
+            for index in range(self.concurrency)
+        ]
+        self.stdout.write(
+            f"Running {self.concurrency} workers for {options['warmup'] + options['duration']:.0f}s "
+            f"({options['warmup']:.0f}s warmup, seed {seed}) "
+            f"{'against ' + options['url'] if options['url'] else 'in-process'}"
+        )
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = max(time.monotonic() - started - options['warmup'], 1e-9)
+        self.report(workers, elapsed, seed, options)
+
+    def report(self, workers, elapsed, seed, options):
+        latencies = defaultdict(list)
+        counts = defaultdict(lambda: {'4xx': 0, 'errors': 0})
+        for worker in workers:
+            for route, values in worker.latencies.items():
+                latencies[route].extend(values)
+            for route, values in worker.counts.items():
+                counts[route]['4xx'] += values['4xx']
+                counts[route]['errors'] += values['errors']
+
+        routes = {}
+        for route, values in latencies.items():
+            values.sort()
+            routes[route] = {
+                'count': len(values),
+                '4xx': counts[route]['4xx'],
+                'errors': counts[route]['errors'],
+                'rps': len(values) / elapsed,
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+        every = sorted(value for values in latencies.values() for value in values)
+        total = {
+            'count': len(every),
+            '4xx': sum(route['4xx'] for route in routes.values()),
+            'errors': sum(route['errors'] for route in routes.values()),
+            'rps': len(every) / elapsed,
+            'p50_ms': percentile(every, 0.50) * 1000,
+            'p95_ms': percentile(every, 0.95) * 1000,
+            'p99_ms': percentile(every, 0.99) * 1000,
+            'max_ms': every[-1] * 1000 if every else 0.0,
+        }
+
+        header = (
+            f"{'route':<58} {'count':>8} {'4xx':>6} {'errors':>6} {'req/s':>8} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for route, row in sorted(routes.items(), key=lambda item: -item[1]['count']) + [('TOTAL', total)]:
+            self.stdout.write(
+                f"{route:<58} {row['count']:>8} {row['4xx']:>6} {row['errors']:>6} {row['rps']:>8.1f} "
+                f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}"
+            )
+        scenarios = sum(worker.scenarios_run for worker in workers)
+        self.stdout.write(f'Latencies in ms; {scenarios} scenarios in {elapsed:.1f}s')
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump({
+                    'seed': seed,
+                    'concurrency': self.concurrency,
+                    'seconds': elapsed,
+                    'mix': self.mix,
+                    'target': options['url'] or 'in-process',
+                    'total': total,
+                    'routes': routes,
+                }, handle, indent=2)
+
+        if total['errors']:
+            self.stdout.write(self.style.WARNING(f"{total['errors']} requests failed"))
+        else:
+            self.stdout.write(self.style.SUCCESS('Done'))
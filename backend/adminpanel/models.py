@@ -0,0 +1,48 @@
+from django.db import models
+from django.conf import settings
+
+
+class RequestProfile(models.Model):
+    """One profiled request; see common.profiling"""
+    TRIGGER_CHOICES = [
+        ('header', 'Admin header'),
+        ('sample', 'Random sample'),
+    ]
+    MODE_CHOICES = [
+        ('cprofile', 'cProfile'),
+        ('sample', 'Stack sampling'),
+    ]
+
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    route = models.CharField(max_length=200)
+    status_code = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    duration_ms = models.FloatField()
+    # Milliseconds per DRF phase, each excluding the phases nested in it
+    phases = models.JSONField(default=dict)
+    db_queries = models.PositiveIntegerField(default=0)
+    db_ms = models.FloatField(default=0)
+    # Human-readable top functions or stacks
+    summary = models.TextField(blank=True)
+    # pstats dump (cprofile) or folded stacks (sample), for download
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    class Meta:
+        db_table = "request_profiles"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='request_profiles_created_idx'),
+        ]
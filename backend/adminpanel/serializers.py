@@ -0,0 +1,22 @@
+from rest_framework import serializers
+from .models import RequestProfile
+
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    """Request Profile Serializer (the raw profile is downloaded separately)"""
+
+    class Meta:
+        model = RequestProfile
+        fields = [
+            'id', 'method', 'path', 'route', 'status_code', 'user', 'trigger', 'mode',
+            'duration_ms', 'phases', 'db_queries', 'db_ms', 'created_at'
+        ]
+        read_only_fields = fields
+
+
+class RequestProfileDetailSerializer(RequestProfileSerializer):
+    """Request Profile Serializer with the text summary"""
+
+    class Meta(RequestProfileSerializer.Meta):
+        fields = RequestProfileSerializer.Meta.fields + ['summary']
+        read_only_fields = fields
@@ -0,0 +1,88 @@
+from common.testing import APITest, make_order, make_restaurant, make_user
+
+from .models import RequestProfile
+
+
+def make_profile(mode='cprofile', **fields):
+    return RequestProfile.objects.create(
+        method='GET',
+        path='/api/restaurants/',
+        route='restaurant-list',
+        status_code=200,
+        trigger='header',
+        mode=mode,
+        duration_ms=12.5,
+        summary='10 function calls',
+        data=b'stacks 1' if mode == 'sample' else b'pstats',
+        **fields,
+    )
+
+
+class AdminRouteTests(APITest):
+    """Every admin route, over several rows of each kind"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin')
+        customers = [make_user() for _ in range(3)]
+        cls.restaurants = [make_restaurant(items=2) for _ in range(3)]
+        cls.orders = [
+            make_order(customer, restaurant)
+            for customer in customers
+            for restaurant in cls.restaurants[:2]
+        ]
+        cls.profiles = [make_profile(user=cls.admin), make_profile('sample'), make_profile()]
+
+    def setUp(self):
+        self.login_as(self.admin)
+
+    def results(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_users(self):
+        self.assertEqual(len(self.results('/api/admin/users/')), 1 + 3 + 3)  # admin, customers, owners
+        customer = self.orders[0].user
+        data = self.client.get(f'/api/admin/users/{customer.pk}/').json()
+        self.assertEqual(data['email'], customer.email)
+
+    def test_restaurants(self):
+        self.assertCountEqual(
+            [restaurant['id'] for restaurant in self.results('/api/admin/restaurants/')],
+            [restaurant.pk for restaurant in self.restaurants],
+        )
+        restaurant = self.restaurants[2]
+        data = self.client.get(f'/api/admin/restaurants/{restaurant.pk}/').json()
+        self.assertEqual(data['name'], restaurant.name)
+
+    def test_orders(self):
+        self.assertCountEqual(
+            [order['id'] for order in self.results('/api/admin/orders/')],
+            [order.pk for order in self.orders],
+        )
+        order = self.orders[3]
+        data = self.client.get(f'/api/admin/orders/{order.pk}/').json()
+        self.assertEqual((data['user'], data['restaurant']), (order.user_id, order.restaurant_id))
+
+    def test_profiles(self):
+        listed = self.results('/api/admin/profiles/')
+        self.assertCountEqual([profile['id'] for profile in listed], [profile.pk for profile in self.profiles])
+        self.assertNotIn('summary', listed[0])
+        profile = self.profiles[1]
+        data = self.client.get(f'/api/admin/profiles/{profile.pk}/').json()
+        self.assertEqual(data['summary'], '10 function calls')
+
+    def test_profile_download(self):
+        for profile, body, filename in [
+            (self.profiles[0], b'pstats', f'profile-{self.profiles[0].pk}.prof'),
+            (self.profiles[1], b'stacks 1', f'profile-{self.profiles[1].pk}.folded'),
+        ]:
+            response = self.client.get(f'/api/admin/profiles/{profile.pk}/download/')
+            self.assertEqual(response.content, body)
+            self.assertIn(filename, response['Content-Disposition'])
+
+    def test_other_roles_are_refused(self):
+        self.login_as(self.orders[0].user)
+        for url in ('/api/admin/users/', '/api/admin/orders/', '/api/admin/profiles/'):
+            self.assertEqual(self.client.get(url).status_code, 403, url)
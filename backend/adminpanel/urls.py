@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AdminUserViewSet, AdminRestaurantViewSet, AdminOrderViewSet
+from .views import AdminUserViewSet, AdminRestaurantViewSet, AdminOrderViewSet, AdminProfileViewSet
 
 router = DefaultRouter()
 router.register(r'users', AdminUserViewSet, basename='admin-users')
 router.register(r'restaurants', AdminRestaurantViewSet, basename='admin-restaurants')
 router.register(r'orders', AdminOrderViewSet, basename='admin-orders')
+router.register(r'profiles', AdminProfileViewSet, basename='admin-profiles')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,12 +1,19 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse
 from restaurants.models import Restaurant
 from orders.models import Order
 from users.serializers import UserSerializer
 from restaurants.serializers import RestaurantSerializer
 from orders.serializers import OrderSerializer
+from .models import RequestProfile
+from .serializers import RequestProfileSerializer, RequestProfileDetailSerializer
+from common.queryplan import eager_load
+from common.pagination import AdminPagination
+from common.fastread import FastReadMixin
 
 User = get_user_model()
 
@@ -18,22 +25,63 @@ class IsAdmin(IsAuthenticated):
         return super().has_permission(request, view) and request.user.role == 'admin'
 
 
-class AdminUserViewSet(viewsets.ReadOnlyModelViewSet):
+class AdminUserViewSet(FastReadMixin, viewsets.ReadOnlyModelViewSet):
     """Admin User Management ViewSet"""
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdmin]
 
 
-class AdminRestaurantViewSet(viewsets.ModelViewSet):
+class AdminRestaurantViewSet(FastReadMixin, viewsets.ModelViewSet):
     """Admin Restaurant Management ViewSet"""
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
     permission_classes = [IsAdmin]
+    pagination_class = AdminPagination
+    
+    def get_queryset(self):
+        return eager_load(super().get_queryset(), self.get_serializer_class())
 
 
-class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
+class AdminOrderViewSet(FastReadMixin, viewsets.ReadOnlyModelViewSet):
     """Admin Order Management ViewSet"""
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAdmin]
+    pagination_class = AdminPagination
+    
+    def get_queryset(self):
+        return eager_load(super().get_queryset(), self.get_serializer_class())
+
+
+class AdminProfileViewSet(FastReadMixin, viewsets.ReadOnlyModelViewSet):
+    """Request profiles captured by common.profiling"""
+    queryset = RequestProfile.objects.all()
+    serializer_class = RequestProfileSerializer
+    permission_classes = [IsAdmin]
+    pagination_class = AdminPagination
+    
+    def get_queryset(self):
+        # The raw profile is only read by download
+        if self.action == 'list':
+            return super().get_queryset().defer('summary', 'data')
+        if self.action == 'retrieve':
+            return super().get_queryset().defer('data')
+        return super().get_queryset()
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return RequestProfileSerializer
+        return RequestProfileDetailSerializer
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Raw profile: a pstats file (cprofile) or folded stacks (sample)"""
+        profile = self.get_object()
+        if profile.mode == 'cprofile':
+            filename, content_type = f'profile-{profile.pk}.prof', 'application/octet-stream'
+        else:
+            filename, content_type = f'profile-{profile.pk}.folded', 'text/plain; charset=utf-8'
+        response = HttpResponse(bytes(profile.data), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
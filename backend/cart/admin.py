@@ -13,6 +13,9 @@ class CartAdmin(admin.ModelAdmin):
     list_display = ["user", "created_at", "updated_at", "subtotal", "tax_amount", "total_amount"]
     inlines = [CartItemInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
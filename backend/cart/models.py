@@ -1,10 +1,20 @@
 from django.db import models
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from menu.models import MenuItem
 from decimal import Decimal
+from common import money
 
-TAX_RATE = Decimal("0.05")  # 5% tax
-DELIVERY_FEE = Decimal("40.00")  # fixed delivery fee
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate each cart with its item subtotal, summed in SQL"""
+        return self.annotate(items_subtotal=Coalesce(
+            Sum(F('items__price_snapshot') * F('items__quantity')),
+            Value(Decimal("0.00")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
 
 
 class Cart(models.Model):
@@ -12,17 +22,41 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
+    @property
+    def subtotal_paise(self):
+        # Prefer the with_totals() annotation, then prefetched items, and only
+        # fall back to an aggregate query when neither is loaded
+        if hasattr(self, 'items_subtotal'):
+            return money.to_paise(self.items_subtotal)
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum(item.subtotal_paise for item in self.items.all())
+        return money.to_paise(Cart.objects.with_totals().get(pk=self.pk).items_subtotal)
+
+    def totals_paise(self):
+        """Return ``(subtotal, tax_amount, total_amount)`` in paise from a single subtotal"""
+        return money.totals(self.subtotal_paise)
+
+    def totals(self):
+        """Return ``(subtotal, tax_amount, total_amount)`` in rupees"""
+        return tuple(money.from_paise(amount) for amount in self.totals_paise())
+
     @property
     def subtotal(self):
-        return sum(item.subtotal for item in self.items.all())
+        return money.from_paise(self.subtotal_paise)
 
     @property
     def tax_amount(self):
-        return (self.subtotal * TAX_RATE).quantize(Decimal("0.01"))
+        return self.totals()[1]
+
+    @property
+    def total_amount_paise(self):
+        return self.totals_paise()[2]
 
     @property
     def total_amount(self):
-        return (self.subtotal + self.tax_amount + DELIVERY_FEE).quantize(Decimal("0.01"))
+        return money.from_paise(self.total_amount_paise)
 
     def __str__(self):
         return f"Cart - {self.user.name}"
@@ -37,9 +71,13 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price_snapshot = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @property
+    def subtotal_paise(self):
+        return money.line_subtotal(self.price_snapshot, self.quantity)
+
     @property
     def subtotal(self):
-        return (self.price_snapshot * self.quantity).quantize(Decimal("0.01"))
+        return money.from_paise(self.subtotal_paise)
 
     def save(self, *args, **kwargs):
         if not self.price_snapshot:
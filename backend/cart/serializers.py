@@ -1,12 +1,13 @@
 from rest_framework import serializers
 from .models import Cart, CartItem
 from menu.serializers import MenuItemSerializer
+from common.money import MoneyField
 
 
 class CartItemSerializer(serializers.ModelSerializer):
     """Cart Item Serializer"""
     menu_item_details = MenuItemSerializer(source='menu_item', read_only=True)
-    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    subtotal = MoneyField(source='subtotal_paise')
     
     class Meta:
         model = CartItem
@@ -17,7 +18,7 @@ class CartItemSerializer(serializers.ModelSerializer):
 class CartSerializer(serializers.ModelSerializer):
     """Cart Serializer"""
     items = CartItemSerializer(many=True, read_only=True)
-    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_amount = MoneyField(source='total_amount_paise')
     
     class Meta:
         model = Cart
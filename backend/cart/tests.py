@@ -0,0 +1,54 @@
+from django.core.cache import cache
+
+from cart.models import Cart
+from common.testing import APITest, fill_cart, make_restaurant, make_user
+
+
+class CartRouteTests(APITest):
+    """Every cart route, on a cart holding several lines"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant(items=4)
+        cls.items = list(cls.restaurant.menu_items.order_by('id'))
+
+    def setUp(self):
+        cache.clear()  # cart throttle
+        self.customer = self.login_as(make_user())
+        self.cart = fill_cart(self.customer, self.items[:3])
+
+    def lines(self, data):
+        return {line['menu_item']: line['quantity'] for line in data['items']}
+
+    def test_list_and_detail(self):
+        response = self.client.get('/api/cart/')
+        # 99.50 x 1 + 109.50 x 2 + 119.50 x 3 = 677.00; 5% tax 33.85; delivery 40.00
+        self.assertEqual(response.json()['total_amount'], '750.85')
+        self.assertEqual(self.lines(response.json()), {item.id: n for n, item in enumerate(self.items[:3], 1)})
+        self.assertEqual(self.client.get(f'/api/cart/{self.cart.pk}/').json(), response.json())
+
+    def test_list_creates_a_missing_cart(self):
+        customer = self.login_as(make_user())
+        response = self.client.get('/api/cart/')
+        self.assertEqual((response.json()['items'], response.json()['total_amount']), ([], '40.00'))
+        self.assertTrue(Cart.objects.filter(user=customer).exists())
+
+    def test_add(self):
+        response = self.client.post('/api/cart/add/', {'menu_item_id': self.items[3].pk, 'quantity': 2}, format='json')
+        self.assertEqual(self.lines(response.json())[self.items[3].pk], 2)
+        response = self.client.post('/api/cart/add/', {'menu_item_id': self.items[0].pk}, format='json')
+        self.assertEqual(self.lines(response.json())[self.items[0].pk], 2)
+
+    def test_update_quantity_and_remove(self):
+        line = self.cart.items.get(menu_item=self.items[1])
+        response = self.client.post(
+            '/api/cart/update_quantity/', {'cart_item_id': line.pk, 'quantity': 5}, format='json',
+        )
+        self.assertEqual(self.lines(response.json())[self.items[1].pk], 5)
+        response = self.client.post('/api/cart/remove/', {'cart_item_id': line.pk}, format='json')
+        self.assertNotIn(self.items[1].pk, self.lines(response.json()))
+
+    def test_other_users_lines_are_not_found(self):
+        other = fill_cart(make_user(), self.items[:1]).items.get()
+        response = self.client.post('/api/cart/remove/', {'cart_item_id': other.pk}, format='json')
+        self.assertEqual((response.status_code, response.json()), (404, {'error': 'Cart item not found'}))
@@ -2,25 +2,52 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from .models import Cart, CartItem
 from .serializers import CartSerializer, CartItemSerializer
 from menu.models import MenuItem
+from common.queryplan import eager_load
+from common.fastread import FastReadMixin, read_serializer, renders_json
 
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(FastReadMixin, viewsets.ModelViewSet):
     """Cart ViewSet"""
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'cart'
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        # Totals in one aggregate query, items in one prefetch
+        return eager_load(
+            Cart.objects.with_totals().filter(user=self.request.user),
+            CartSerializer
+        )
+
+    def _cart_data(self):
+        serializer_class = read_serializer(CartSerializer) if renders_json(self.request) else CartSerializer
+        return serializer_class(self.get_queryset().get()).data
 
     def list(self, request):
         """Get or create cart for current user"""
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        try:
+            cart = self.get_queryset().get()
+        except Cart.DoesNotExist:
+            cart = self._create_cart()
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
 
+    def _create_cart(self):
+        try:
+            with transaction.atomic():
+                cart = Cart.objects.create(user=self.request.user)
+        except IntegrityError:
+            # Created by a concurrent request
+            return self.get_queryset().get()
+        # A new cart has no lines, so serializing it needs no queries
+        prefetch_related_objects([cart], Prefetch('items', queryset=CartItem.objects.none()))
+        return cart
+
     @action(detail=False, methods=['post'])
     def add(self, request):
         """Add item to cart"""
@@ -54,7 +81,7 @@ class CartViewSet(viewsets.ModelViewSet):
             cart_item.save()
 
         return Response(
-            CartSerializer(cart).data,
+            self._cart_data(),
             status=status.HTTP_200_OK
         )
 
@@ -75,7 +102,7 @@ class CartViewSet(viewsets.ModelViewSet):
             cart_item.delete()
 
             return Response(
-                CartSerializer(cart).data,
+                self._cart_data(),
                 status=status.HTTP_200_OK
             )
         except (Cart.DoesNotExist, CartItem.DoesNotExist):
@@ -103,7 +130,7 @@ class CartViewSet(viewsets.ModelViewSet):
             cart_item.save()
 
             return Response(
-                CartSerializer(cart).data,
+                self._cart_data(),
                 status=status.HTTP_200_OK
             )
         except (Cart.DoesNotExist, CartItem.DoesNotExist):
@@ -0,0 +1,173 @@
+"""
+Async endpoints.
+
+DRF views are synchronous, so under ASGI each request to them holds a worker
+thread from start to finish. ``AsyncAPIView`` subclasses run authentication,
+permissions and throttles exactly as DRF would run them, then await their
+handler on the event loop.
+
+The busiest read paths are also served by ``AsyncReadView`` subclasses:
+queries go through Django's async ORM, and serialization happens on the
+event loop over eager-loaded rows.
+
+``async_read_routes`` mounts them over a router's routes. Anything they
+don't handle themselves (writes, the browsable API, ``.json`` style format
+suffixes) is passed through to the router's DRF view, so a URL keeps one
+name and one set of semantics whichever view answers it.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.urls import re_path
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from common.fastread import read_serializer
+
+
+class AsyncAPIView(View):
+    """
+    Base class for async handlers.
+
+    Subclasses implement ``async def get(self, request, *args, **kwargs)``
+    (or ``post`` and so on) returning a DRF ``Response``; ``request`` is a
+    DRF ``Request``. Responses are always rendered as JSON.
+    """
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = [AllowAny]
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = None
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    renderer_class = api_settings.DEFAULT_RENDERER_CLASSES[0]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token auth only, like APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        self.request = request
+        try:
+            # A user-cache miss reads the users table, so authenticate off the loop
+            await sync_to_async(self.initial)(request)
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(request, response)
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        raise exceptions.MethodNotAllowed(request.method)
+
+    def initial(self, request):
+        request.user
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    def check_permissions(self, request):
+        for permission in self.permission_classes:
+            if not permission().has_permission(request, self):
+                if request.authenticators and not request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+
+    def check_throttles(self, request):
+        waits = []
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, self):
+                waits.append(throttle.wait())
+        if waits:
+            waits = [wait for wait in waits if wait is not None]
+            raise exceptions.Throttled(max(waits, default=None))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            auth_header = self.authentication_classes[0]().authenticate_header(self.request)
+            if auth_header:
+                exc.auth_header = auth_header
+            else:
+                exc.status_code = 403
+        response = exception_handler(exc, {'view': self, 'request': self.request})
+        if response is None:
+            raise exc
+        return response
+
+    def finalize_response(self, request, response):
+        if not isinstance(response, Response):
+            # Django's own OPTIONS answer
+            return response
+        response.accepted_renderer = self.renderer_class()
+        response.accepted_media_type = response.accepted_renderer.media_type
+        response.renderer_context = {'view': self, 'request': request, 'response': response}
+        patch_vary_headers(response, ['Accept'])
+        # JSON rendering never queries, so do it here rather than in a thread
+        return response.render()
+
+
+class AsyncReadView(AsyncAPIView):
+    """
+    Base class for async GET handlers mounted over a router's DRF view
+    (see ``async_read_routes``).
+    """
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+    # The router's DRF view for the same URL
+    sync_view = None
+
+    def wants_sync_view(self, request, kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return True
+        if 'format' in kwargs or api_settings.URL_FORMAT_OVERRIDE in request.GET:
+            return True
+        return 'text/html' in request.headers.get('Accept', '')
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.sync_view is not None and self.wants_sync_view(request, kwargs):
+            return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def paginate(self, queryset, serializer_class):
+        """Return the paginated response for an eager-loaded queryset"""
+        paginator = self.pagination_class()
+        # DRF's paginators evaluate the page synchronously
+        page = await sync_to_async(paginator.paginate_queryset)(queryset, self.request, self)
+        # Always rendered as JSON, so the compiled serializer can be used
+        return paginator.get_paginated_response(read_serializer(serializer_class)(page, many=True).data)
+
+    async def get_object_or_404(self, queryset, **lookup):
+        try:
+            return await queryset.aget(**lookup)
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+
+
+def async_read_routes(router, views):
+    """
+    URL patterns routing ``router``'s routes named in ``views`` to the given
+    ``AsyncReadView`` classes; include them ahead of ``router.urls``.
+    """
+    urlpatterns = []
+    for pattern in router.urls:
+        view_class = views.get(pattern.name)
+        if view_class is None or 'format' in pattern.pattern.regex.groupindex:
+            continue
+        urlpatterns.append(re_path(
+            pattern.pattern.regex.pattern,
+            view_class.as_view(sync_view=pattern.callback),
+            name=pattern.name,
+        ))
+    return urlpatterns
@@ -0,0 +1,93 @@
+"""
+Response compression.
+
+Compresses JSON (and other text) responses larger than
+``COMPRESSION_MIN_SIZE`` bytes with brotli when the client accepts it and
+the ``brotli`` package is installed, otherwise with gzip. Streaming
+responses (order event streams) are left alone so events aren't held back
+in a compressor's buffer, and HTML is skipped because admin pages carry
+CSRF tokens (BREACH).
+"""
+import gzip
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/plain', 'text/csv', 'text/css')
+
+
+def _accepted_encodings(header):
+    """Codings the client accepts, i.e. listed without ``q=0``"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        quality = params.strip().partition('q=')[2] if 'q=' in params else '1'
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.strip().lower())
+        except ValueError:
+            pass
+    return accepted
+
+
+def _choose_encoding(request):
+    accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    if brotli is not None and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    return gzip.compress(content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+def compress_response(request, response):
+    if response.streaming or response.has_header('Content-Encoding'):
+        return response
+    content_type = response.get('Content-Type', '').partition(';')[0].strip()
+    if content_type not in COMPRESSIBLE_TYPES:
+        return response
+    if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+        return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = _choose_encoding(request)
+    if encoding is None:
+        return response
+
+    compressed = _compress(response.content, encoding)
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response.headers['Content-Length'] = str(len(compressed))
+    response.headers['Content-Encoding'] = encoding
+    # Compressed bytes differ, so a strong ETag no longer holds
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response.headers['ETag'] = 'W/' + etag
+    return response
+
+
+@sync_and_async_middleware
+def compression_middleware(get_response):
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return compress_response(request, await get_response(request))
+
+    else:
+        def middleware(request):
+            return compress_response(request, get_response(request))
+
+    return middleware
@@ -0,0 +1,263 @@
+"""
+Per-process database connection pool.
+
+Django opens a fresh connection for every request unless ``CONN_MAX_AGE``
+keeps one pinned to each thread; with MySQL that handshake costs several
+milliseconds, and pinned connections scale with thread count rather than
+load. The pooled backends (``common.dbpool.mysql``) hand connections back
+to a shared pool when Django closes them, so requests on any thread reuse
+warm connections:
+
+* at most ``MAX_SIZE`` connections are open; callers beyond that wait up
+  to ``TIMEOUT`` seconds and then get ``PoolTimeout``;
+* connections idle for longer than ``PING_INTERVAL`` are health-checked
+  before reuse, and ones idle longer than ``MAX_IDLE`` (keep this below
+  the server's ``wait_timeout``) or older than ``MAX_LIFETIME`` are closed
+  instead of reused;
+* connections returned mid-transaction are rolled back; ones closed inside
+  ``atomic()`` or that raised errors and fail a health check are dropped.
+
+Pools are configured with a ``POOL`` dict in the ``DATABASES`` entry and
+``stats()`` reports their usage.
+"""
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from django.db import OperationalError
+
+DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5,
+    'MAX_LIFETIME': 60 * 30,
+    'MAX_IDLE': 60 * 5,
+    'PING_INTERVAL': 30,
+}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+
+    def __init__(self, max_size, timeout, max_lifetime, max_idle, ping_interval):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.ping_interval = ping_interval
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # (connection, opened at, returned at), most recently returned last
+        self._idle = deque()
+        self._opened_at = {}
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._counts = dict.fromkeys(('created', 'recycled', 'failed_checks', 'timeouts', 'waits'), 0)
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def _expired(self, now, opened_at, returned_at):
+        return now - opened_at > self.max_lifetime or now - returned_at > self.max_idle
+
+    def _take(self, started):
+        """
+        Reserve a slot: an idle ``(connection, opened_at, returned_at)``, or
+        ``(None, now, now)`` when the caller should open a new connection.
+        Also returns the expired connections it dropped, to close unlocked.
+        """
+        stale = []
+        with self._condition:
+            waited = False
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    entry = self._idle.pop()
+                    if not self._expired(now, entry[1], entry[2]):
+                        break
+                    stale.append(entry[0])
+                    self._size -= 1
+                    self._counts['recycled'] += 1
+                else:
+                    entry = None
+                    if self._size < self.max_size:
+                        self._size += 1
+                        entry = (None, now, now)
+
+                if entry is not None:
+                    self._in_use += 1
+                    if waited:
+                        self._record_wait(now - started)
+                    return entry, stale
+
+                remaining = started + self.timeout - now
+                if remaining <= 0:
+                    self._counts['timeouts'] += 1
+                    self._record_wait(now - started)
+                    raise PoolTimeout(
+                        f'No database connection became free within {self.timeout}s '
+                        f'({self.max_size} in use)'
+                    )
+                waited = True
+                self._waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _record_wait(self, seconds):
+        self._counts['waits'] += 1
+        self._wait_seconds += seconds
+        self._max_wait_seconds = max(self._max_wait_seconds, seconds)
+
+    def _forget(self, connection):
+        """Give up a reserved slot whose connection is gone"""
+        with self._condition:
+            self._size -= 1
+            self._in_use -= 1
+            self._condition.notify()
+        if connection is not None:
+            _close_quietly(connection)
+
+    def acquire(self, connect, check):
+        """
+        Return a pooled connection, opening one with ``connect()`` if none
+        is idle. ``check(connection)`` must return False for dead ones.
+        """
+        started = time.monotonic()
+        while True:
+            (connection, opened_at, returned_at), stale = self._take(started)
+            for stale_connection in stale:
+                _close_quietly(stale_connection)
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    self._forget(None)
+                    raise
+                with self._condition:
+                    self._counts['created'] += 1
+            elif time.monotonic() - returned_at > self.ping_interval and not check(connection):
+                with self._condition:
+                    self._counts['failed_checks'] += 1
+                self._forget(connection)
+                continue
+
+            with self._condition:
+                self._opened_at[id(connection)] = opened_at
+            return connection
+
+    def release(self, connection, discard=False):
+        """Return a connection from ``acquire()``; ``discard`` closes it instead"""
+        now = time.monotonic()
+        with self._condition:
+            opened_at = self._opened_at.pop(id(connection), now)
+            if not discard and now - opened_at > self.max_lifetime:
+                self._counts['recycled'] += 1
+                discard = True
+            if not discard:
+                self._in_use -= 1
+                self._idle.append((connection, opened_at, now))
+                self._condition.notify()
+                return
+        self._forget(connection)
+
+    def close_idle(self):
+        """Close every idle connection, e.g. at shutdown"""
+        with self._condition:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+        for connection, _, _ in idle:
+            _close_quietly(connection)
+
+    def stats(self):
+        with self._condition:
+            waits = self._counts['waits']
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                **self._counts,
+                'avg_wait_seconds': self._wait_seconds / waits if waits else 0.0,
+                'max_wait_seconds': self._max_wait_seconds,
+            }
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    # Keyed by database name too, so the test database gets its own pool
+    key = (alias, settings_dict['NAME'])
+    pool = _pools.get(key)
+    # A forked worker must not share its parent's sockets
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                options = {**DEFAULTS, **settings_dict.get('POOL', {})}
+                pool = ConnectionPool(**{name.lower(): value for name, value in options.items()})
+                _pools[key] = pool
+    return pool
+
+
+def stats():
+    """Usage of this process's pools, keyed by database alias"""
+    return {
+        alias: pool.stats()
+        for (alias, _), pool in list(_pools.items())
+        if pool.pid == os.getpid()
+    }
+
+
+class PooledDatabaseWrapperMixin:
+    """Borrow connections from the pool instead of opening them; see module docs"""
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def check_pooled_connection(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except self.Database.Error:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        connect = partial(super().get_new_connection, conn_params)
+        return self.pool.acquire(connect, self.check_pooled_connection)
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection = self.connection
+        # Django keeps using a connection closed inside atomic() until the
+        # block exits, so that one can't go back to the pool
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+        if not discard and not self.get_autocommit():
+            # Never hand the next borrower someone else's open transaction
+            try:
+                connection.rollback()
+            except self.Database.Error:
+                discard = True
+        self.pool.release(connection, discard=discard)
@@ -0,0 +1,20 @@
+"""
+MySQL backend whose connections come from ``common.dbpool``.
+
+Use ``'ENGINE': 'common.dbpool.mysql'`` in place of
+``django.db.backends.mysql``.
+"""
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from common.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, MySQLDatabaseWrapper):
+
+    def check_pooled_connection(self, connection):
+        # mysqlclient's ping() is a protocol-level round trip, cheaper than a query
+        try:
+            connection.ping()
+        except self.Database.Error:
+            return False
+        return True
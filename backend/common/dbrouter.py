@@ -0,0 +1,154 @@
+"""
+Read-replica routing.
+
+Safe-method requests read the public catalog apps (``REPLICA_APPS``) from
+the ``REPLICA_DATABASE`` alias, and requests under ``REPLICA_PATHS`` (admin
+reporting) read every model from it. Everything else goes to ``default``:
+writes, requests under ``PRIMARY_PATHS`` (the Django admin, which edits
+what it reads), reads inside ``transaction.atomic()``, and code running
+outside a request (management commands, signal handlers' follow-up work).
+
+A client that just sent a write reads from ``default`` for the next
+``REPLICA_STICKY_SECONDS``, so it never sees replica lag hide its own
+change. Clients are told apart by user id, or by address when anonymous,
+so refreshing a token keeps the pin; the pin lives in the shared cache so
+it holds across workers.
+
+Nothing is routed unless ``REPLICA_DATABASE`` is in ``DATABASES``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import jwt
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+# None: primary only; 'apps': replica for REPLICA_APPS; 'all': replica for every model
+_replica_reads = ContextVar('replica_reads', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db:primary-pin:{}'
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def use_primary():
+    """Read from ``default`` for the duration of the block"""
+    token = _replica_reads.set(None)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        scope = _replica_reads.get()
+        if scope is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if scope == 'all' or model._meta.app_label in getattr(settings, 'REPLICA_APPS', ()):
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == replica_alias():
+            return False
+        return None
+
+
+def _token_user_id(request):
+    """The user id claimed by the request's bearer token, if any"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme not in jwt_settings.AUTH_HEADER_TYPES or not token:
+        return None
+    try:
+        # Unverified: the claim only decides where this request reads from.
+        # Pins are only ever set for users authentication has verified.
+        return jwt.decode(token, options={'verify_signature': False}).get(jwt_settings.USER_ID_CLAIM)
+    except jwt.InvalidTokenError:
+        return None
+
+
+def _pin_key(request, user_id=None):
+    if user_id is not None:
+        return PIN_KEY.format(f'user:{user_id}')
+    return PIN_KEY.format(f"addr:{request.META.get('REMOTE_ADDR', '')}")
+
+
+def _read_pin_key(request):
+    return _pin_key(request, _token_user_id(request))
+
+
+def _write_pin_key(request):
+    # DRF sets request.user once a view authenticates the request
+    user = getattr(request, 'user', None)
+    return _pin_key(request, user.pk if user is not None and user.is_authenticated else None)
+
+
+def _sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def _scope_for(request):
+    """The replica scope a request may use, before checking its pin"""
+    if replica_alias() is None or request.method not in SAFE_METHODS:
+        return None
+    if any(request.path.startswith(path) for path in getattr(settings, 'PRIMARY_PATHS', ())):
+        return None
+    if any(request.path.startswith(path) for path in getattr(settings, 'REPLICA_PATHS', ())):
+        return 'all'
+    return 'apps'
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """Scope replica reads to the request and pin writers to the primary"""
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            scope = _scope_for(request)
+            if scope is not None and await cache.aget(_read_pin_key(request)):
+                scope = None
+            token = _replica_reads.set(scope)
+            try:
+                response = await get_response(request)
+            finally:
+                _replica_reads.reset(token)
+            if replica_alias() is not None and request.method not in SAFE_METHODS:
+                await cache.aset(_write_pin_key(request), 1, timeout=_sticky_seconds())
+            return response
+
+    else:
+        def middleware(request):
+            scope = _scope_for(request)
+            if scope is not None and cache.get(_read_pin_key(request)):
+                scope = None
+            token = _replica_reads.set(scope)
+            try:
+                response = get_response(request)
+            finally:
+                _replica_reads.reset(token)
+            if replica_alias() is not None and request.method not in SAFE_METHODS:
+                cache.set(_write_pin_key(request), 1, timeout=_sticky_seconds())
+            return response
+
+    return middleware
@@ -0,0 +1,363 @@
+"""
+Compiled read serializers.
+
+DRF renders an instance by walking the serializer's fields and calling each
+one's ``get_attribute`` and ``to_representation``; on long lists that
+per-field dispatch is most of the CPU once the queries are eager-loaded.
+``compile_serializer`` turns a serializer's field set into one generated
+function per serializer class that reads the attributes directly and
+converts the common field types inline, producing exactly what
+``serializer.data`` would:
+
+* model columns and forward foreign keys are read straight off the instance,
+  primary key fields from the local ``<fk>_id`` column;
+* ``CharField``, ``IntegerField``, ``BigIntegerField``, ``FloatField``,
+  ``BooleanField``, ``ChoiceField``, ``DecimalField``, ``MoneyField`` and
+  ISO 8601 ``DateTimeField`` are converted inline, and nested serializers
+  (``many`` or not) call their own compiled function;
+* dotted sources that hit a null relation, and any value the inline code
+  doesn't recognise, go back through the DRF field, so ``allow_null``,
+  defaults and omitted keys behave as before;
+* fields the compiler doesn't know (images, dicts, method fields, custom
+  fields) are rendered by the DRF field itself.
+
+``read_serializer(SerializerClass)`` wraps the compiled function in a
+read-only stand-in with the serializer's call signature, and
+``FastReadMixin`` makes a viewset's list and retrieve actions use it for
+JSON responses. Writes, and the browsable API, keep the DRF serializer.
+"""
+import decimal
+import keyword
+from datetime import datetime
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.core.signals import setting_changed
+from django.db.models.manager import BaseManager
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import fields as drf_fields, relations, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from common.money import MoneyField, format_paise
+
+_SKIP = object()
+# Errors DRF's get_attribute turns into None, a default or an omitted key
+_LOOKUP_ERRORS = (AttributeError, KeyError, ObjectDoesNotExist)
+
+
+def _drf_attribute(field, instance):
+    """``field.get_attribute(instance)``, or ``_SKIP`` if the key is omitted"""
+    try:
+        return field.get_attribute(instance)
+    except drf_fields.SkipField:
+        return _SKIP
+
+
+def _drf_value(field, instance):
+    """One field rendered the way ``Serializer.to_representation`` does it"""
+    attribute = _drf_attribute(field, instance)
+    if attribute is _SKIP:
+        return _SKIP
+    check_for_none = attribute.pk if isinstance(attribute, relations.PKOnlyObject) else attribute
+    return None if check_for_none is None else field.to_representation(attribute)
+
+
+def _isoformat(value):
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _many(render, data, child, tz):
+    iterable = data.all() if isinstance(data, BaseManager) else data
+    return [render(item, child, tz) for item in iterable]
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _access(model, attrs):
+    """
+    ``(expression, safe)`` reading a dotted source off ``instance``, or
+    ``(None, False)`` if only DRF's lookup (callables, mappings) will do.
+    """
+    expression = 'instance'
+    safe = True
+    for index, attr in enumerate(attrs):
+        if model is None or not attr.isidentifier() or keyword.iskeyword(attr):
+            return None, False
+        is_last = index == len(attrs) - 1
+        expression = f'{expression}.{attr}'
+        model_field = _model_field(model, attr)
+
+        if model_field is None:
+            # Properties are plain reads, but may raise
+            if not isinstance(getattr(model, attr, None), (property, cached_property)):
+                return None, False
+            safe = False
+            model = None
+        elif not model_field.is_relation or attr == getattr(model_field, 'attname', None):
+            if not is_last:
+                return None, False
+        elif model_field.concrete and (model_field.many_to_one or model_field.one_to_one):
+            # The related row may be null or missing
+            safe = False
+            model = model_field.related_model
+        elif is_last and (model_field.one_to_many or model_field.many_to_many):
+            pass  # a related manager
+        else:
+            return None, False
+    return expression, safe
+
+
+def _pk_column(model, field):
+    """The local column a primary key field renders, if it's that simple"""
+    if not (
+        field.source != '*'
+        and type(field).get_attribute is relations.RelatedField.get_attribute
+        and field.use_pk_only_optimization()
+        and type(field).to_representation is relations.PrimaryKeyRelatedField.to_representation
+        and field.pk_field is None
+        and model is not None
+        and len(field.source_attrs) == 1
+    ):
+        return None
+    model_field = _model_field(model, field.source_attrs[0])
+    if model_field is None or not model_field.concrete or not model_field.many_to_one:
+        return None
+    return model_field.attname
+
+
+def _converter(name, field, constants, index):
+    """
+    Expression turning a non-null ``value`` into ``name``'s output, or None
+    if the field has no inline form.
+    """
+    field_class = type(field)
+    delegate = f'fields[{name!r}].to_representation(value)'
+    to_representation = field_class.to_representation
+
+    if to_representation is drf_fields.CharField.to_representation:
+        return 'value if value.__class__ is str else str(value)'
+    if to_representation is drf_fields.IntegerField.to_representation:
+        return 'value if value.__class__ is int else int(value)'
+    if to_representation is drf_fields.BigIntegerField.to_representation:
+        if getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING):
+            return 'str(value)'
+        return 'value if value.__class__ is int else int(value)'
+    if to_representation is drf_fields.FloatField.to_representation:
+        return 'float(value)'
+    if to_representation is drf_fields.BooleanField.to_representation:
+        return f'value if value.__class__ is bool else {delegate}'
+    if to_representation is drf_fields.ChoiceField.to_representation:
+        constants[f'choices_{index}'] = field.choice_strings_to_values
+        return (
+            f'choices_{index}.get(value, value) if value.__class__ is str else '
+            f'choices_{index}.get(str(value), value) if value.__class__ is int else {delegate}'
+        )
+    if to_representation is MoneyField.to_representation:
+        if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            return None
+        return f'format_paise(value) if value.__class__ is int else {delegate}'
+    if to_representation is drf_fields.DecimalField.to_representation:
+        if (
+            not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            or field.localize or field.normalize_output or field.decimal_places is None
+        ):
+            return None
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        constants[f'exponent_{index}'] = decimal.Decimal('.1') ** field.decimal_places
+        constants[f'rounding_{index}'] = field.rounding
+        constants[f'context_{index}'] = context
+        return (
+            f"format(value.quantize(exponent_{index}, rounding_{index}, context_{index}), 'f') "
+            f'if value.__class__ is Decimal else {delegate}'
+        )
+    if to_representation is drf_fields.DateTimeField.to_representation:
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if (
+            not isinstance(output_format, str) or output_format.lower() != drf_fields.ISO_8601
+            or hasattr(field, 'timezone')
+            or field_class.enforce_timezone is not drf_fields.DateTimeField.enforce_timezone
+            or field_class.default_timezone is not drf_fields.DateTimeField.default_timezone
+        ):
+            return None
+        # ``tz`` is the current timezone, as enforce_timezone() would use
+        return (
+            '_isoformat(value.astimezone(tz)) if value.__class__ is datetime '
+            f'and tz is not None and value.utcoffset() is not None else {delegate}'
+        )
+    return None
+
+
+def _nested(name, field, constants, index):
+    """Expression rendering a non-null related ``value`` with a nested serializer"""
+    if isinstance(field, serializers.ListSerializer):
+        if (
+            type(field).to_representation is not serializers.ListSerializer.to_representation
+            or not _compilable(type(field.child))
+        ):
+            return None
+        constants[f'render_{index}'] = compile_serializer(type(field.child))
+        return f'_many(render_{index}, value, fields[{name!r}].child, tz)'
+    if not _compilable(type(field)):
+        return None
+    constants[f'render_{index}'] = compile_serializer(type(field))
+    return f'render_{index}(value, fields[{name!r}], tz)'
+
+
+def _compilable(serializer_class):
+    return (
+        issubclass(serializer_class, serializers.Serializer)
+        and serializer_class.to_representation is serializers.Serializer.to_representation
+    )
+
+
+def _emit(lines, name, field, model, constants, index):
+    key = repr(name)
+
+    pk_column = _pk_column(model, field)
+    if pk_column is not None:
+        lines.append(f'    ret[{key}] = instance.{pk_column}')
+        return
+
+    expression, safe = None, False
+    if field.source != '*' and (
+        isinstance(field, serializers.BaseSerializer)
+        or type(field).get_attribute is drf_fields.Field.get_attribute
+    ):
+        expression, safe = _access(model, field.source_attrs)
+    if expression is None:
+        lines.append(f'    value = _drf_value(fields[{key}], instance)')
+        lines.append('    if value is not _SKIP:')
+        lines.append(f'        ret[{key}] = value')
+        return
+
+    if isinstance(field, serializers.BaseSerializer):
+        converter = _nested(name, field, constants, index)
+    else:
+        converter = _converter(name, field, constants, index)
+    if converter is None:
+        converter = f'fields[{key}].to_representation(value)'
+
+    indent = '    '
+    if safe:
+        lines.append(f'    value = {expression}')
+    else:
+        lines.append('    try:')
+        lines.append(f'        value = {expression}')
+        lines.append('    except _LOOKUP_ERRORS:')
+        lines.append(f'        value = _drf_attribute(fields[{key}], instance)')
+        lines.append('    if value is not _SKIP:')
+        indent = '        '
+    lines.append(f'{indent}ret[{key}] = None if value is None else {converter}')
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    """
+    Return ``render(instance, serializer, tz)`` for ``serializer_class``:
+    ``serializer`` is a bound instance of it (fields that are rendered by
+    DRF are taken from there, with its context) and ``tz`` the timezone
+    datetimes are shown in.
+    """
+    model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    constants = {
+        'Decimal': decimal.Decimal,
+        'datetime': datetime,
+        '_SKIP': _SKIP,
+        '_LOOKUP_ERRORS': _LOOKUP_ERRORS,
+        '_drf_attribute': _drf_attribute,
+        '_drf_value': _drf_value,
+        '_isoformat': _isoformat,
+        '_many': _many,
+        'format_paise': format_paise,
+    }
+    lines = ['def render(instance, serializer, tz):', '    fields = serializer.fields', '    ret = {}']
+    for index, (name, field) in enumerate(serializer_class().fields.items()):
+        if not field.write_only:
+            _emit(lines, name, field, model, constants, index)
+    lines.append('    return ret')
+
+    namespace = {}
+    source = '\n'.join(lines)
+    exec(compile(source, f'<compiled {serializer_class.__qualname__}>', 'exec'), constants, namespace)
+    render = namespace['render']
+    render.source = source
+    return render
+
+
+@receiver(setting_changed)
+def _recompile_on_settings_change(*, setting, **kwargs):
+    # Compiled code bakes in REST_FRAMEWORK defaults such as
+    # COERCE_DECIMAL_TO_STRING, as DRF's fields do when they're built
+    if setting == 'REST_FRAMEWORK':
+        compile_serializer.cache_clear()
+
+
+def _current_timezone():
+    return timezone.get_current_timezone() if settings.USE_TZ else None
+
+
+class ReadSerializer:
+    """
+    Read-only stand-in for ``serializer_class(instance, many=..., context=...)``
+    whose ``.data`` comes from the compiled renderer.
+    """
+    serializer_class = None
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self._context = context or {}
+
+    @property
+    def context(self):
+        return self._context
+
+    @property
+    def data(self):
+        if not hasattr(self, '_data'):
+            serializer = self.serializer_class(context=self._context)
+            render = compile_serializer(self.serializer_class)
+            tz = _current_timezone()
+            if self.many:
+                self._data = ReturnList(_many(render, self.instance, serializer, tz), serializer=self)
+            else:
+                self._data = ReturnDict(render(self.instance, serializer, tz), serializer=self)
+        return self._data
+
+
+@lru_cache(maxsize=None)
+def read_serializer(serializer_class):
+    """The ``ReadSerializer`` for ``serializer_class``; DRF's own if it can't be compiled"""
+    if not _compilable(serializer_class):
+        return serializer_class
+    return type(f'Read{serializer_class.__name__}', (ReadSerializer,), {'serializer_class': serializer_class})
+
+
+def renders_json(request):
+    """Whether content negotiation picked a JSON renderer for ``request``"""
+    return isinstance(getattr(request, 'accepted_renderer', None), JSONRenderer)
+
+
+class FastReadMixin:
+    """Serve a generic viewset's read actions from ``read_serializer``"""
+    fast_read_actions = ('list', 'retrieve')
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.fast_read_actions and renders_json(self.request):
+            serializer_class = read_serializer(self.get_serializer_class())
+            kwargs.setdefault('context', self.get_serializer_context())
+            return serializer_class(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,312 @@
+"""
+Request metrics in the Prometheus text format.
+
+``metrics_middleware`` times every request and labels it with its URL name
+(for DRF routes that is ``<basename>-<action>``, e.g. ``order-create-order``)
+and method. A sampled share of requests (``METRICS_SAMPLE_RATE``) also
+records database queries and time, across every database alias, and time
+spent building ``serializer.data``. ``metrics_view`` serves the totals at
+``/metrics``.
+
+Each thread accumulates into its own shard, so the request path never takes
+a lock; a scrape sums the shards. Totals are per process, so scrape every
+worker (or run one worker per target).
+"""
+import bisect
+import functools
+import random
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.module_loading import import_string
+from rest_framework.serializers import BaseSerializer
+
+PREFIX = 'foodie'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Process-wide stats() functions, exported as untyped samples
+STATS_SOURCES = {
+    'menu_cache': 'menu.cache.stats',
+    'auth_user_cache': 'users.authentication.stats',
+    'password_hashing': 'users.hashing.stats',
+}
+
+_sample = ContextVar('metrics_sample', default=None)
+
+
+class Sample:
+    __slots__ = ('queries', 'db_seconds', 'serializer_seconds', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+
+def _record_query(execute, sql, params, many, context):
+    sample = _sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db_seconds += time.perf_counter() - started
+
+
+def _install_query_wrapper(sender, connection, **kwargs):
+    # Connections are per thread, so the wrapper is installed on each one and
+    # finds the request's sample through the context (which sync_to_async
+    # carries into its threads). First in line, so execute_wrapper() blocks
+    # opened elsewhere still pop their own wrapper.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+class Shard:
+    """One thread's totals; only that thread writes to it"""
+
+    def __init__(self):
+        # (route, method) -> [count, duration sum, response bytes, bucket counts...]
+        self.requests = defaultdict(lambda: [0, 0.0, 0] + [0] * (len(BUCKETS) + 1))
+        # (route, method, status) -> count
+        self.statuses = defaultdict(int)
+        # (route, method) -> [sampled count, queries, db seconds, serializer seconds]
+        self.samples = defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    def record(self, route, method, status, seconds, size, sample):
+        totals = self.requests[route, method]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += size
+        totals[3 + bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.statuses[route, method, status] += 1
+        if sample is not None:
+            sampled = self.samples[route, method]
+            sampled[0] += 1
+            sampled[1] += sample.queries
+            sampled[2] += sample.db_seconds
+            sampled[3] += sample.serializer_seconds
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = Shard()
+        # Once per thread, not per request
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def _merge():
+    requests = defaultdict(lambda: [0, 0.0, 0] + [0] * (len(BUCKETS) + 1))
+    statuses = defaultdict(int)
+    samples = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        # list() copies in one step under the GIL, even while the owner inserts
+        for key, values in list(shard.requests.items()):
+            requests[key] = [total + value for total, value in zip(requests[key], values)]
+        for key, value in list(shard.statuses.items()):
+            statuses[key] += value
+        for key, values in list(shard.samples.items()):
+            samples[key] = [total + value for total, value in zip(samples[key], values)]
+    return requests, statuses, samples
+
+
+def _time_data(owner):
+    data = owner.__dict__['data']
+    if getattr(data.fget, '_metrics_timed', False):
+        return
+
+    @functools.wraps(data.fget)
+    def timed_data(self):
+        sample = _sample.get()
+        if sample is None or sample.serializing:
+            return data.fget(self)
+        sample.serializing = True
+        started = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            sample.serializer_seconds += time.perf_counter() - started
+            sample.serializing = False
+
+    timed_data._metrics_timed = True
+    owner.data = property(timed_data, doc=data.__doc__)
+
+
+def _instrument_serializers():
+    """Time top-level ``serializer.data`` calls made during a sampled request"""
+    from common.fastread import ReadSerializer
+
+    _time_data(BaseSerializer)
+    _time_data(ReadSerializer)
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.view_name or 'unnamed'
+
+
+def _response_size(response):
+    if response.streaming:
+        return 0
+    return len(response.content)
+
+
+def _start(request):
+    if request.path == '/metrics':
+        return None, None, None
+    sample = token = None
+    if random.random() < getattr(settings, 'METRICS_SAMPLE_RATE', 0.1):
+        sample = Sample()
+        token = _sample.set(sample)
+        # Connections opened before the middleware loaded missed the signal
+        for connection in connections.all(initialized_only=True):
+            _install_query_wrapper(None, connection)
+    return time.perf_counter(), sample, token
+
+
+def _finish(request, response, started, sample, token):
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    if token is not None:
+        _sample.reset(token)
+    _shard().record(
+        _route(request), request.method, response.status_code, seconds, _response_size(response), sample
+    )
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise MiddlewareNotUsed
+    _instrument_serializers()
+    connection_created.connect(_install_query_wrapper, dispatch_uid='common.metrics')
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started, sample, token = _start(request)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                if token is not None:
+                    _sample.reset(token)
+                raise
+            _finish(request, response, started, sample, token)
+            return response
+
+    else:
+        def middleware(request):
+            started, sample, token = _start(request)
+            try:
+                response = get_response(request)
+            except BaseException:
+                if token is not None:
+                    _sample.reset(token)
+                raise
+            _finish(request, response, started, sample, token)
+            return response
+
+    return middleware
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return int(value)
+    return repr(float(value)) if isinstance(value, float) else value
+
+
+def render():
+    """Current totals in the Prometheus text exposition format"""
+    requests, statuses, samples = _merge()
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+    family('http_request_duration_seconds', 'histogram', 'Request latency by route and method.')
+    for (route, method), totals in sorted(requests.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), totals[3:]):
+            cumulative += count
+            lines.append(
+                f'{PREFIX}_http_request_duration_seconds_bucket'
+                f'{_labels(route=route, method=method, le=bound)} {cumulative}'
+            )
+        lines.append(f'{PREFIX}_http_request_duration_seconds_sum{_labels(route=route, method=method)} {totals[1]!r}')
+        lines.append(f'{PREFIX}_http_request_duration_seconds_count{_labels(route=route, method=method)} {totals[0]}')
+
+    family('http_response_bytes_total', 'counter', 'Response body bytes by route and method.')
+    for (route, method), totals in sorted(requests.items()):
+        lines.append(f'{PREFIX}_http_response_bytes_total{_labels(route=route, method=method)} {totals[2]}')
+
+    family('http_requests_total', 'counter', 'Requests by route, method and status.')
+    for (route, method, status), count in sorted(statuses.items()):
+        lines.append(f'{PREFIX}_http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+    sampled_families = (
+        ('http_sampled_requests_total', 'Requests sampled for the detailed counters below.'),
+        ('http_db_queries_total', 'Database queries made by sampled requests.'),
+        ('http_db_seconds_total', 'Database time of sampled requests.'),
+        ('http_serializer_seconds_total', 'Time sampled requests spent building serializer.data.'),
+    )
+    for index, (name, help_text) in enumerate(sampled_families):
+        family(name, 'counter', help_text)
+        for (route, method), totals in sorted(samples.items()):
+            lines.append(f'{PREFIX}_{name}{_labels(route=route, method=method)} {_number(totals[index])}')
+
+    from common import dbpool
+    for alias, pool_stats in sorted(dbpool.stats().items()):
+        for key, value in pool_stats.items():
+            lines.append(f'{PREFIX}_db_pool_{key}{_labels(alias=alias)} {_number(value)}')
+
+    for source, path in STATS_SOURCES.items():
+        for key, value in import_string(path)().items():
+            if isinstance(value, (int, float)):
+                lines.append(f'{PREFIX}_{source}_{key} {_number(value)}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        # Route names and volumes aren't public; only a dev server runs open
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,62 @@
+"""
+Session-stack middleware that stays out of the way of the API.
+
+The API authenticates with JWT and never touches sessions, messages or
+CSRF cookies, but the stock middleware still parses those cookies on every
+request, and a stale ``sessionid`` cookie costs a session-table read just
+to decide it should be deleted. These subclasses behave exactly like the
+Django originals everywhere except under ``API_PATH_PREFIX``, where all of
+their hooks are skipped; ``admin/`` keeps the full stack.
+"""
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware as BaseAuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware as BaseMessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware as BaseSessionMiddleware
+from django.middleware.clickjacking import XFrameOptionsMiddleware as BaseXFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware as BaseCsrfViewMiddleware
+
+
+def is_api_request(request):
+    return request.path_info.startswith(getattr(settings, 'API_PATH_PREFIX', '/api/'))
+
+
+class APIExemptMixin:
+    """Skips the middleware's ``process_*`` hooks for API requests"""
+
+    def process_request(self, request):
+        hook = getattr(super(), 'process_request', None)
+        if hook is None or is_api_request(request):
+            return None
+        return hook(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        hook = getattr(super(), 'process_view', None)
+        if hook is None or is_api_request(request):
+            return None
+        return hook(request, view_func, view_args, view_kwargs)
+
+    def process_response(self, request, response):
+        hook = getattr(super(), 'process_response', None)
+        if hook is None or is_api_request(request):
+            return response
+        return hook(request, response)
+
+
+class SessionMiddleware(APIExemptMixin, BaseSessionMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(APIExemptMixin, BaseCsrfViewMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(APIExemptMixin, BaseAuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(APIExemptMixin, BaseMessageMiddleware):
+    pass
+
+
+class XFrameOptionsMiddleware(APIExemptMixin, BaseXFrameOptionsMiddleware):
+    pass
@@ -0,0 +1,97 @@
+"""
+Pricing math in integer paise.
+
+Prices are stored as ``DECIMAL(10, 2)`` rupees. Line subtotals, tax and
+totals are worked out here on whole paise, with one rounding policy shared
+by the cart display and order creation, and turned back into rupees only
+at the edges: ``from_paise`` for model fields, ``MoneyField`` for API
+output.
+
+Rounding is half-to-even onto whole paise, the default of the
+``Decimal.quantize(Decimal("0.01"))`` calls this replaces.
+"""
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+TAX_RATE = Decimal("0.05")  # 5% tax
+DELIVERY_FEE = Decimal("40.00")  # fixed delivery fee
+
+PAISE_PER_RUPEE = 100
+
+
+# Prices come from a small set of menu amounts, so conversions are memoised
+_paise = {}
+MAX_CACHED_AMOUNTS = 10000
+
+
+def to_paise(amount):
+    """Whole paise in a rupee amount (``Decimal``, int or string)"""
+    try:
+        return _paise[amount]
+    except KeyError:
+        pass
+    value = amount if isinstance(amount, Decimal) else Decimal(amount)
+    paise = int(value.scaleb(2).to_integral_value(ROUND_HALF_EVEN))
+    if len(_paise) >= MAX_CACHED_AMOUNTS:
+        _paise.clear()
+    _paise[amount] = paise
+    return paise
+
+
+def from_paise(paise):
+    """Rupees as a two-place ``Decimal``"""
+    return Decimal(paise).scaleb(-2)
+
+
+def format_paise(paise):
+    """Rupees as text, the way a two-place ``DecimalField`` renders them"""
+    sign = '-' if paise < 0 else ''
+    rupees, paise = divmod(abs(paise), PAISE_PER_RUPEE)
+    return f'{sign}{rupees}.{paise:02d}'
+
+
+def _divide(numerator, denominator):
+    """``numerator / denominator`` rounded half-to-even (denominator > 0)"""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+_TAX_NUMERATOR, _TAX_DENOMINATOR = TAX_RATE.as_integer_ratio()
+DELIVERY_FEE_PAISE = to_paise(DELIVERY_FEE)
+
+
+def line_subtotal(price, quantity):
+    """Paise for ``quantity`` units at ``price`` rupees"""
+    return to_paise(price) * quantity
+
+
+def tax(subtotal):
+    """Tax in paise on a subtotal in paise"""
+    return _divide(subtotal * _TAX_NUMERATOR, _TAX_DENOMINATOR)
+
+
+def totals(subtotal):
+    """``(subtotal, tax, total)`` in paise for an order of ``subtotal`` paise"""
+    tax_amount = tax(subtotal)
+    return subtotal, tax_amount, subtotal + tax_amount + DELIVERY_FEE_PAISE
+
+
+class MoneyField(serializers.Field):
+    """
+    Read-only field for an amount held in paise. Renders exactly what
+    ``DecimalField(max_digits=10, decimal_places=2)`` gives for it in rupees.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if getattr(self, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            return format_paise(value)
+        return from_paise(value)
@@ -0,0 +1,149 @@
+"""
+Pagination classes.
+
+Large, append-mostly tables (orders, menu items, restaurants, reviews) are
+paged with a keyset cursor on ``(created_at, id)`` so deep pages cost the
+same as the first one and no ``COUNT(*)`` is run.
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+POSITION_SEPARATOR = ','
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Cursor pagination matching the models' ``-created_at`` ordering.
+
+    DRF's cursor holds the first ordering field only and steps over rows
+    sharing it with an offset, so runs of equal timestamps (bulk inserts)
+    turn into offset scans. Here the cursor holds the whole ``(created_at,
+    id)`` key and pages with a comparison on it that the composite index
+    serves as a range; the key is unique, so the offset stays 0.
+    """
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*[
+                field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering
+            ])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self._after(queryset.model, current_position, reverse))
+
+        # One extra row tells whether another page follows
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _after(self, model, position, reverse):
+        """
+        Rows past ``position`` in the (possibly reversed) ordering; for a
+        descending ``(a, b)`` key that is ``a <= x AND (a < x OR b < y)``,
+        the first term giving the index a range to scan.
+        """
+        values = position.split(POSITION_SEPARATOR, len(self.ordering) - 1)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        bound = None
+        condition = None
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            if bound is None:
+                bound = Q(**{f'{name}__{lookup}e': value})
+            step = Q(**equal, **{f'{name}__{lookup}': value})
+            condition = step if condition is None else condition | step
+            equal[name] = value
+        return bound & condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(str(value))
+        return POSITION_SEPARATOR.join(values)
+
+
+class AdminPagination(CreatedAtCursorPagination):
+    """
+    Cursor pagination by default; passing ``?page=N`` switches to classic
+    page-number mode (with a total count) for the admin UI.
+    """
+    page_number_class = PageNumberPagination
+
+    def _page_number_requested(self, request):
+        return self.page_number_class.page_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self._page_number_requested(request):
+            self.page_number_paginator = self.page_number_class()
+            page = self.page_number_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.page_number_paginator.display_page_controls
+            return page
+
+        self.page_number_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,356 @@
+"""
+On-demand request profiling.
+
+With ``PROFILING_ENABLED`` on, ``profiling_middleware`` profiles a request
+when an admin sends the ``PROFILE_HEADER`` header (its value picks the
+mode) or when it falls in the ``PROFILE_SAMPLE_RATE`` share. Two modes:
+
+* ``cprofile``: deterministic ``cProfile`` of the request's thread; the
+  download is a pstats file (``python -m pstats``, snakeviz);
+* ``sample``: a background thread samples the request thread's stack every
+  ``PROFILE_SAMPLE_INTERVAL`` seconds; much lower overhead, and the
+  download is folded stacks for flamegraph.pl or speedscope.
+
+Either way the request's time is also split across DRF phases
+(authentication, permissions, throttling, view, queryset evaluation,
+serialization, rendering, and everything else) with each phase excluding
+the ones nested in it, alongside its query count and database time.
+Results are saved as ``adminpanel.RequestProfile`` rows (the newest
+``PROFILE_KEEP``) and served by the admin API under ``/api/admin/profiles/``.
+
+With ``PROFILING_ENABLED`` off the middleware removes itself and nothing is
+patched. Under ASGI the profiler and sampler watch the event-loop thread,
+so work handed to ``sync_to_async`` threads shows up as waiting there; the
+phase split still covers it.
+"""
+import cProfile
+import functools
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.query import QuerySet
+from django.utils.decorators import sync_and_async_middleware
+
+MODES = ('cprofile', 'sample')
+SUMMARY_LINES = 40
+MAX_STACK_DEPTH = 128
+
+_phases = ContextVar('profiling_phases', default=None)
+# Only one cProfile can run at a time (a process-wide limit from Python 3.12)
+_cprofile_lock = threading.Lock()
+
+
+class Phases:
+    """Exclusive wall time per phase: time goes to the innermost open phase"""
+
+    def __init__(self):
+        self.totals = Counter()
+        self.stack = ['other']
+        self.mark = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def _charge(self):
+        now = time.perf_counter()
+        self.totals[self.stack[-1]] += now - self.mark
+        self.mark = now
+
+    def enter(self, phase):
+        self._charge()
+        self.stack.append(phase)
+
+    def exit(self):
+        self._charge()
+        self.stack.pop()
+
+    def stop(self):
+        while len(self.stack) > 1:
+            self.exit()
+        self._charge()
+
+    def finish(self):
+        """Milliseconds per phase, largest first"""
+        return {phase: round(seconds * 1000, 3) for phase, seconds in self.totals.most_common()}
+
+
+def _timed(phase, function):
+    """Wrap ``function`` so profiled requests charge its time to ``phase``"""
+    if iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            phases = _phases.get()
+            if phases is None:
+                return await function(*args, **kwargs)
+            phases.enter(phase)
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                phases.exit()
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            phases = _phases.get()
+            if phases is None:
+                return function(*args, **kwargs)
+            phases.enter(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                phases.exit()
+    wrapper._profiling_phase = phase
+    return wrapper
+
+
+def _patch(owner, name, phase):
+    attribute = owner.__dict__[name]
+    if isinstance(attribute, property):
+        if getattr(attribute.fget, '_profiling_phase', None) is None:
+            setattr(owner, name, property(_timed(phase, attribute.fget), attribute.fset, doc=attribute.__doc__))
+    elif getattr(attribute, '_profiling_phase', None) is None:
+        setattr(owner, name, _timed(phase, attribute))
+
+
+def _instrument():
+    """Wrap the DRF steps that make up a request's phases (once per process)"""
+    from rest_framework.request import Request
+    from rest_framework.response import Response
+    from rest_framework.serializers import BaseSerializer
+    from rest_framework.views import APIView
+    from common.async_views import AsyncAPIView
+    from common.fastread import ReadSerializer
+
+    _patch(Request, '_authenticate', 'authentication')
+    for view_class in (APIView, AsyncAPIView):
+        _patch(view_class, 'check_permissions', 'permissions')
+        _patch(view_class, 'check_throttles', 'throttling')
+        _patch(view_class, 'dispatch', 'view')
+    _patch(APIView, 'check_object_permissions', 'permissions')
+    _patch(QuerySet, '_fetch_all', 'queryset')
+    _patch(BaseSerializer, 'data', 'serialization')
+    _patch(ReadSerializer, 'data', 'serialization')
+    _patch(Response, 'rendered_content', 'rendering')
+
+
+def _record_query(execute, sql, params, many, context):
+    phases = _phases.get()
+    if phases is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        phases.queries += 1
+        phases.db_seconds += time.perf_counter() - started
+
+
+def _install_query_wrapper(sender, connection, **kwargs):
+    # Per-connection, like common.metrics: connections belong to threads
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+class CProfiler:
+    mode = 'cprofile'
+
+    def __init__(self):
+        self.profile = None
+
+    def start(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            return False
+        self.profile = cProfile.Profile()
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Some other profiler owns the interpreter's hooks
+            _cprofile_lock.release()
+            return False
+        return True
+
+    def stop(self):
+        self.profile.disable()
+        _cprofile_lock.release()
+
+    def result(self):
+        """``(summary, data)``"""
+        self.profile.create_stats()
+        # Same format as Profile.dump_stats(); taken first, as pstats.Stats
+        # empties the profile it loads from
+        data = marshal.dumps(self.profile.stats)
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        return stream.getvalue(), data
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler(threading.Thread):
+    mode = 'sample'
+
+    def __init__(self):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.target = threading.get_ident()
+        self.interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005)
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def start(self):
+        super().start()
+        return True
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def result(self):
+        total = sum(self.stacks.values())
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        lines = [f'{total} samples every {self.interval * 1000:g} ms; top functions by own samples:']
+        lines += [f'{count:>7} {count / total:>6.1%}  {leaf}' for leaf, count in leaves.most_common(SUMMARY_LINES)]
+        folded = '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+        return '\n'.join(lines) + '\n', folded.encode()
+
+
+PROFILERS = {'cprofile': CProfiler, 'sample': StackSampler}
+
+
+def _header(request):
+    return request.headers.get(getattr(settings, 'PROFILE_HEADER', 'X-Profile'))
+
+
+def _admin_user(request):
+    """The requesting user if the API would authenticate them as an admin"""
+    from rest_framework import exceptions
+    from rest_framework.request import Request
+    from rest_framework.settings import api_settings
+
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    if getattr(user, 'role', None) != 'admin':
+        return None
+    return user
+
+
+def _trigger(request, user):
+    """``(trigger, mode)`` if the request should be profiled, else None"""
+    if user is not None:
+        header = _header(request)
+        return 'header', header if header in MODES else getattr(settings, 'PROFILE_MODE', 'cprofile')
+    if random.random() < getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0):
+        return 'sample', getattr(settings, 'PROFILE_MODE', 'cprofile')
+    return None
+
+
+def _begin(mode):
+    """Start a profiler on this thread; None if one can't run right now"""
+    for connection in connections.all(initialized_only=True):
+        _install_query_wrapper(None, connection)
+    profiler = PROFILERS[mode]()
+    return profiler if profiler.start() else None
+
+
+def _save(request, response, profiler, trigger, user, phases):
+    from adminpanel.models import RequestProfile
+
+    timings = phases.finish()
+    summary, data = profiler.result()
+    match = getattr(request, 'resolver_match', None)
+    profile = RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        route=(match.view_name if match else '') or '',
+        status_code=response.status_code,
+        user=user,
+        trigger=trigger,
+        mode=profiler.mode,
+        duration_ms=sum(timings.values()),
+        phases=timings,
+        db_queries=phases.queries,
+        db_ms=phases.db_seconds * 1000,
+        summary=summary,
+        data=data,
+    )
+    keep = getattr(settings, 'PROFILE_KEEP', 200)
+    RequestProfile.objects.filter(id__lte=profile.id - keep).delete()
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    if not getattr(settings, 'PROFILING_ENABLED', False):
+        raise MiddlewareNotUsed
+    _instrument()
+    connection_created.connect(_install_query_wrapper, dispatch_uid='common.profiling')
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            user = None
+            if _header(request) is not None:
+                # Authenticating may read the users table
+                user = await sync_to_async(_admin_user)(request)
+            triggered = _trigger(request, user)
+            # Profilers watch the thread they start on: here, the event loop's
+            profiler = _begin(triggered[1]) if triggered else None
+            if profiler is None:
+                return await get_response(request)
+            phases = Phases()
+            token = _phases.set(phases)
+            try:
+                response = await get_response(request)
+            finally:
+                _phases.reset(token)
+                phases.stop()
+                profiler.stop()
+            await sync_to_async(_save)(request, response, profiler, triggered[0], user, phases)
+            return response
+
+    else:
+        def middleware(request):
+            user = _admin_user(request) if _header(request) is not None else None
+            triggered = _trigger(request, user)
+            profiler = _begin(triggered[1]) if triggered else None
+            if profiler is None:
+                return get_response(request)
+            phases = Phases()
+            token = _phases.set(phases)
+            try:
+                response = get_response(request)
+            finally:
+                _phases.reset(token)
+                phases.stop()
+                profiler.stop()
+            _save(request, response, profiler, triggered[0], user, phases)
+            return response
+
+    return middleware
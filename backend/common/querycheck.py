@@ -0,0 +1,267 @@
+"""
+Query checks for the test suite: N+1 detection and per-route query budgets.
+
+With ``QUERY_CHECKS`` on (``common.testrunner.QueryCheckRunner`` switches
+it on for test runs), ``query_check_middleware`` records every SQL
+statement a request runs, on every database alias, with the application
+stack that ran it. After the response it flags:
+
+* N+1 patterns: the same SELECT, differing only in its parameters, run
+  ``QUERY_N_PLUS_ONE_THRESHOLD`` or more times in one request, reported
+  with the stack of the code that ran it;
+* budget overruns: more queries than the route's entry in
+  ``QUERY_BUDGETS``, keyed by view name (``<basename>-<action>`` for DRF
+  routes, as in ``common.metrics``; namespaced ones like ``admin:index``
+  keep their namespace). Savepoints are not counted.
+
+Findings are logged and collected for the runner, which fails the run if
+there are any. The routes that answered without an error are collected too,
+so the runner can tell when a budgeted route was never exercised.
+``record_queries()`` gives tests the same recording around any block of
+code.
+"""
+import logging
+import os
+import re
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+STACK_DEPTH = 6
+# Instrumentation whose frames say nothing about where a query came from
+WRAPPER_MODULES = {__file__, os.path.join(os.path.dirname(__file__), 'metrics.py')}
+
+_log = ContextVar('querycheck_log', default=None)
+_violations = []
+_exercised = set()
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+_COLUMNS = re.compile(r'^(SELECT(?: DISTINCT)?) .*? FROM', re.IGNORECASE)
+# Nested atomic() blocks; TestCase wraps every test in one, so they would
+# show up in tests but not in production
+_SAVEPOINT = re.compile(r'^\s*(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+
+
+def normalize(sql):
+    """The statement with its parameters, literals and IN-list lengths blanked out"""
+    sql = _IN_LIST.sub('(%s, ...)', sql)
+    sql = _LITERAL.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _format_frame(frame, root):
+    filename = frame.filename
+    if 'site-packages' in filename:
+        filename = filename.rsplit('site-packages' + os.sep, 1)[1]
+    elif filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    return f'{filename}:{frame.lineno} in {frame.name}'
+
+
+def _app_stack():
+    """
+    Where a query came from, innermost first: the frame that asked the ORM
+    for it (often DRF rendering a nested field), then the project frames
+    below it, leaving out middleware and instrumentation wrappers.
+    """
+    root = str(settings.BASE_DIR)
+    frames = traceback.extract_stack()[:-2]
+    caller = None
+    for frame in reversed(frames):
+        if f'{os.sep}django{os.sep}db{os.sep}' not in frame.filename and frame.filename != __file__:
+            caller = frame
+            break
+    stack = [_format_frame(caller, root)] if caller is not None else []
+    for frame in reversed(frames):
+        if len(stack) >= STACK_DEPTH:
+            break
+        if (
+            frame is caller
+            or not frame.filename.startswith(root)
+            or 'site-packages' in frame.filename
+            or frame.filename in WRAPPER_MODULES
+            or frame.name == 'middleware'
+        ):
+            continue
+        stack.append(_format_frame(frame, root))
+    return tuple(stack)
+
+
+class Query:
+    __slots__ = ('alias', 'sql', 'stack')
+
+    def __init__(self, alias, sql, stack):
+        self.alias = alias
+        self.sql = sql
+        self.stack = stack
+
+
+class QueryLog:
+    """The statements run while recording, in order"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def groups(self):
+        """``{normalized statement: [Query, ...]}``"""
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[normalize(query.sql)].append(query)
+        return groups
+
+    def repeated_selects(self, threshold=None):
+        """``[(statement, queries)]`` for SELECTs run at least ``threshold`` times"""
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 3)
+        return [
+            (statement, queries) for statement, queries in self.groups().items()
+            if len(queries) >= threshold and statement.upper().startswith('SELECT')
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    log = _log.get()
+    if log is not None and not _SAVEPOINT.match(sql):
+        log.queries.append(Query(context['connection'].alias, sql, _app_stack()))
+    return execute(sql, params, many, context)
+
+
+def _install_query_wrapper(sender, connection, **kwargs):
+    # Per-connection, like common.metrics: connections belong to threads
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def _install_everywhere():
+    connection_created.connect(_install_query_wrapper, dispatch_uid='common.querycheck')
+    for connection in connections.all(initialized_only=True):
+        _install_query_wrapper(None, connection)
+
+
+@contextmanager
+def record_queries():
+    """Record the queries run inside the block into the yielded ``QueryLog``"""
+    _install_everywhere()
+    log = QueryLog()
+    token = _log.set(log)
+    try:
+        yield log
+    finally:
+        _log.reset(token)
+
+
+class Violation:
+    __slots__ = ('kind', 'route', 'method', 'path', 'message')
+
+    def __init__(self, kind, route, method, path, message):
+        self.kind = kind
+        self.route = route
+        self.method = method
+        self.path = path
+        self.message = message
+
+    def __str__(self):
+        return f'{self.kind}: {self.method} {self.path} ({self.route}): {self.message}'
+
+
+def _shorten(statement):
+    # The column list is long and rarely the interesting part
+    return _COLUMNS.sub(r'\1 ... FROM', statement, count=1)[:300]
+
+
+def _stack_lines(stack):
+    return ''.join(f'\n      {frame}' for frame in stack) or '\n      (no stack)'
+
+
+def check(route, method, path, log):
+    """Record and return the violations found in one request's ``QueryLog``"""
+    found = []
+    for statement, queries in log.repeated_selects():
+        # The call site that ran the statement most often
+        stacks = defaultdict(int)
+        for query in queries:
+            stacks[query.stack] += 1
+        stack = max(stacks, key=stacks.get)
+        found.append(Violation(
+            'n+1', route, method, path,
+            f'{len(queries)}x {_shorten(statement)}{_stack_lines(stack)}',
+        ))
+
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(route)
+    if budget is not None and len(log) > budget:
+        found.append(Violation(
+            'budget', route, method, path,
+            f'{len(log)} queries, budget {budget}'
+            + ''.join(f'\n      {_shorten(normalize(query.sql))}' for query in log.queries),
+        ))
+
+    for violation in found:
+        logger.warning('%s', violation)
+    _violations.extend(found)
+    return found
+
+
+def violations():
+    return list(_violations)
+
+
+def unexercised_budgets():
+    """``QUERY_BUDGETS`` routes no checked request has succeeded on"""
+    return sorted(set(getattr(settings, 'QUERY_BUDGETS', {})) - _exercised)
+
+
+def reset():
+    _violations.clear()
+    _exercised.clear()
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    # Namespaced, so the API's ``login`` and ``admin:login`` stay apart
+    return match.view_name or 'unnamed'
+
+
+def _finish(request, response, log):
+    route = _route(request)
+    check(route, request.method, request.get_full_path(), log)
+    if response.status_code < 400:
+        _exercised.add(route)
+
+
+@sync_and_async_middleware
+def query_check_middleware(get_response):
+    if not getattr(settings, 'QUERY_CHECKS', False):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with record_queries() as log:
+                response = await get_response(request)
+            _finish(request, response, log)
+            return response
+
+    else:
+        def middleware(request):
+            with record_queries() as log:
+                response = get_response(request)
+            _finish(request, response, log)
+            return response
+
+    return middleware
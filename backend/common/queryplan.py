@@ -0,0 +1,115 @@
+"""
+Eager-loading query planner.
+
+Walks a serializer's field tree and works out which relations it will touch
+while rendering, so list endpoints can fetch them with ``select_related`` /
+``prefetch_related`` up front instead of one query per row.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+def _get_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _is_forward_single(model_field):
+    return model_field.is_relation and (model_field.many_to_one or model_field.one_to_one)
+
+
+def _walk(model, attrs, prefix, select, prefetch, load_last):
+    """Follow a dotted source through forward FKs, recording joins"""
+    path = prefix
+    for index, attr in enumerate(attrs):
+        is_last = index == len(attrs) - 1
+        model_field = _get_field(model, attr)
+        if model_field is None or not model_field.is_relation:
+            return
+        if is_last and not load_last:
+            return
+
+        path = f'{path}__{attr}' if path else attr
+        if _is_forward_single(model_field):
+            select.add(path)
+            model = model_field.related_model
+        else:
+            # Reverse or many-to-many hops can't be joined; prefetch the rest
+            prefetch.append((path, model_field.related_model, ((), ())))
+            return
+
+
+def _plan_fields(serializer, model, prefix, select, prefetch):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        attrs = field.source_attrs
+
+        if isinstance(field, serializers.ListSerializer):
+            model_field = _get_field(model, attrs[0]) if len(attrs) == 1 else None
+            if model_field is None or not model_field.is_relation:
+                continue
+            path = f'{prefix}__{attrs[0]}' if prefix else attrs[0]
+            child_model = model_field.related_model
+            prefetch.append((path, child_model, _plan(type(field.child), child_model)))
+
+        elif isinstance(field, serializers.BaseSerializer):
+            _walk(model, attrs, prefix, select, prefetch, load_last=True)
+            # Descend into the nested serializer along the same join path
+            related_model = model
+            path = prefix
+            for attr in attrs:
+                model_field = _get_field(related_model, attr)
+                if model_field is None or not _is_forward_single(model_field):
+                    break
+                related_model = model_field.related_model
+                path = f'{path}__{attr}' if path else attr
+            else:
+                _plan_fields(field, related_model, path, select, prefetch)
+
+        elif isinstance(field, ManyRelatedField):
+            _walk(model, attrs, prefix, select, prefetch, load_last=True)
+
+        else:
+            # Primary key fields read the local ``<fk>_id`` column; anything
+            # else that renders the related object needs it loaded.
+            load_last = (
+                isinstance(field, RelatedField) and not field.use_pk_only_optimization()
+            )
+            _walk(model, attrs, prefix, select, prefetch, load_last=load_last)
+
+
+@lru_cache(maxsize=None)
+def _plan(serializer_class, model):
+    """Return ``(select_related paths, prefetch specs)`` for a serializer"""
+    select = set()
+    prefetch = []
+    _plan_fields(serializer_class(), model, '', select, prefetch)
+    return tuple(sorted(select)), tuple(prefetch)
+
+
+def _apply(queryset, plan):
+    select, prefetch = plan
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*[
+            Prefetch(path, queryset=_apply(related_model._default_manager.all(), child_plan))
+            for path, related_model, child_plan in prefetch
+        ])
+    return queryset
+
+
+def eager_load(queryset, serializer_class):
+    """
+    Apply the joins and prefetches ``serializer_class`` needs to render
+    ``queryset`` without further queries per row.
+    """
+    return _apply(queryset, _plan(serializer_class, queryset.model))
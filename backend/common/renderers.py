@@ -0,0 +1,40 @@
+"""
+orjson-backed JSON renderer.
+
+Renders the same bytes as DRF's ``JSONRenderer`` with its default settings
+(compact, UTF-8, ``\\u2028``/``\\u2029`` escaped) several times faster.
+Aware datetimes are written natively in the ``...Z`` form DRF's
+``DateTimeField`` produces; anything orjson doesn't know (``Decimal``,
+lazy strings, timedeltas) goes through DRF's encoder as before, and data
+orjson can't encode at all (integers beyond 64 bits) is rendered by DRF.
+One difference remains: NaN and infinity render as ``null`` rather than
+raising.
+"""
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+_encoder = JSONEncoder()
+
+# Non-string keys are stringified, as the json module does
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        options = OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            # orjson only indents by two spaces
+            options |= orjson.OPT_INDENT_2
+
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,98 @@
+"""
+Fixtures shared by the apps' API tests.
+
+Rows are built directly (not through the API) and in bulk where it matters,
+so list endpoints are exercised with several rows per relation: enough for
+``common.querycheck`` to spot per-row queries.
+"""
+import itertools
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from rest_framework.test import APITestCase
+
+from cart.models import Cart, CartItem
+from common import money
+from menu.models import Category, MenuItem
+from orders.models import Order, OrderItem
+from restaurants.models import Restaurant, Review
+from users.models import User
+from users.tokens import RoleRefreshToken
+
+_sequence = itertools.count(1)
+
+
+def make_user(role='customer', password=None, **fields):
+    n = next(_sequence)
+    email = fields.pop('email', f'{role}-{n}@example.com')
+    name = fields.pop('name', f'{role.title()} {n}')
+    # An unusable password skips the (slow) hasher unless one is needed
+    return User.objects.create_user_with_hash(email, name, make_password(password), role=role, **fields)
+
+
+def make_restaurant(owner=None, items=3, category=None, **fields):
+    n = next(_sequence)
+    restaurant = Restaurant.objects.create(
+        owner=owner or make_user('owner'),
+        name=fields.pop('name', f'Restaurant {n}'),
+        address=fields.pop('address', f'{n} Test Street'),
+        **fields,
+    )
+    category = category or Category.objects.get_or_create(name='Mains')[0]
+    MenuItem.objects.bulk_create([
+        MenuItem(
+            restaurant=restaurant,
+            category=category,
+            name=f'Dish {n}.{i}',
+            price=Decimal('99.50') + i * 10,
+        )
+        for i in range(items)
+    ])
+    return restaurant
+
+
+def fill_cart(user, items):
+    """``user``'s cart holding each of ``items`` (quantities 1, 2, ...)"""
+    cart, _ = Cart.objects.get_or_create(user=user)
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, menu_item=item, quantity=quantity, price_snapshot=item.price)
+        for quantity, item in enumerate(items, 1)
+    ])
+    return cart
+
+
+def make_order(user, restaurant, status='placed', agent=None, lines=2):
+    items = list(restaurant.menu_items.all()[:lines])
+    subtotal = sum(money.line_subtotal(item.price, 1) for item in items)
+    order = Order.objects.create(
+        user=user,
+        restaurant=restaurant,
+        total_amount=money.from_paise(money.totals(subtotal)[2]),
+        payment_method='cod',
+        status=status,
+        assigned_agent=agent,
+        delivery_address='1 Customer Street',
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menu_item=item, quantity=1, price=item.price) for item in items
+    ])
+    return order
+
+
+def make_review(user, restaurant, rating):
+    return Review.objects.create(user=user, restaurant=restaurant, rating=rating, comment='')
+
+
+def access_token(user):
+    return str(RoleRefreshToken.for_user(user).access_token)
+
+
+class APITest(APITestCase):
+    """``APITestCase`` with a helper to act as a user through a real JWT"""
+
+    def login_as(self, user):
+        if user is None:
+            self.client.credentials()
+        else:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token(user)}')
+        return user
@@ -0,0 +1,58 @@
+"""
+Test runner that fails the run on N+1 queries and query budget overruns.
+
+Every request the tests make through the test client is checked by
+``common.querycheck``; the findings are printed after the test results and
+each distinct one counts as a failure. A full run (no test labels) also
+fails if some route in ``QUERY_BUDGETS`` never got a successful request,
+since its budget was then never checked.
+"""
+import sys
+from collections import Counter
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from common import querycheck
+
+
+class QueryCheckRunner(DiscoverRunner):
+
+    def run_tests(self, test_labels, **kwargs):
+        self._full_run = not test_labels
+        return super().run_tests(test_labels, **kwargs)
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Test clients build their middleware chain after this, so it applies
+        self._query_checks = override_settings(QUERY_CHECKS=True)
+        self._query_checks.enable()
+        querycheck.reset()
+
+    def teardown_test_environment(self, **kwargs):
+        self._query_checks.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def suite_result(self, suite, result, **kwargs):
+        failures = super().suite_result(suite, result, **kwargs)
+        # The same finding from many requests is reported once
+        found = Counter()
+        first = {}
+        for violation in querycheck.violations():
+            key = (violation.kind, violation.route, violation.message.split('\n', 1)[0])
+            found[key] += 1
+            first.setdefault(key, violation)
+        if found:
+            sys.stderr.write(f'\n{len(found)} query check failure(s):\n')
+            for key, count in found.items():
+                summary, _, details = str(first[key]).partition('\n')
+                repeats = f' [{count} requests]' if count > 1 else ''
+                sys.stderr.write(f'  {summary}{repeats}\n' + (f'{details}\n' if details else ''))
+
+        unexercised = querycheck.unexercised_budgets() if getattr(self, '_full_run', False) else []
+        if unexercised:
+            sys.stderr.write(
+                f'\n{len(unexercised)} budgeted route(s) without a successful test request:\n'
+                + ''.join(f'  {route}\n' for route in unexercised)
+            )
+        return failures + len(found) + len(unexercised)
@@ -0,0 +1,1015 @@
+import datetime
+import gzip
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
+
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends import base as cache_base, locmem
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.base import BaseHandler
+from django.db import connection, connections, transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from adminpanel.models import RequestProfile
+from adminpanel.serializers import RequestProfileDetailSerializer, RequestProfileSerializer
+from cart.models import Cart, CartItem
+from cart.serializers import CartItemSerializer, CartSerializer
+from common import compression, dbpool, dbrouter, metrics, money, profiling, throttling
+from common.fastread import read_serializer
+from common.parsers import ORJSONParser
+from common.querycheck import record_queries
+from common.queryplan import eager_load
+from common.renderers import ORJSONRenderer
+from common.testing import APITest, access_token, fill_cart, make_order, make_restaurant, make_review, make_user
+from menu.models import Category, MenuItem
+from menu.serializers import CategorySerializer, MenuItemSerializer
+from orders.models import Order, OrderItem
+from orders.serializers import OrderItemSerializer, OrderSerializer
+from restaurants.models import Restaurant, Review
+from restaurants.serializers import RestaurantSerializer, ReviewSerializer
+from users.models import User
+from users.serializers import UserSerializer
+from users.tokens import RoleRefreshToken
+
+
+class CreatedAtCursorPaginationTests(APITest):
+    url = '/api/restaurants/'
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = make_user('owner')
+        for _ in range(45):
+            make_restaurant(owner, items=0)
+        # A bulk insert: every row shares one timestamp, so only ids tell them apart
+        Restaurant.objects.update(created_at=timezone.now())
+        cls.expected = list(Restaurant.objects.order_by('-id').values_list('id', flat=True))
+
+    def walk(self, url, link):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [row['id'] for row in response.data['results']]
+            ids = page + ids if link == 'previous' else ids + page
+            url = response.data[link]
+            pages += 1
+        return ids, pages
+
+    def test_next_links_visit_every_row_once_in_order(self):
+        ids, pages = self.walk(self.url, 'next')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, 3)
+
+    def test_previous_links_walk_back_to_the_start(self):
+        url = self.client.get(self.url).data['next']
+        last = None
+        while url:
+            last = self.client.get(url).data
+            url = last['next']
+        ids, _ = self.walk(last['previous'], 'previous')
+        self.assertEqual(ids, self.expected[:40])
+
+    def test_keyset_filter_replaces_the_offset(self):
+        second = self.client.get(self.url).data['next']
+        with self.assertNumQueries(1) as context:
+            self.client.get(second)
+        sql = context.captured_queries[0]['sql']
+        self.assertNotIn('OFFSET', sql.upper())
+        self.assertIn('"created_at" <=', sql)
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('cD0yMDI2LTAxLTAx', 'cD1ub3QtYS1kYXRlLDE%3D'):
+            response = self.client.get(f'{self.url}?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class RecordQueriesTests(TestCase):
+
+    def test_savepoints_are_not_counted(self):
+        with record_queries() as log:
+            with transaction.atomic():
+                User.objects.count()
+        self.assertEqual([query.sql.split()[0] for query in log.queries], ['SELECT'])
+
+    def test_repeated_selects_are_grouped_by_statement(self):
+        users = [make_user() for _ in range(3)]
+        with record_queries() as log:
+            for user in users:
+                User.objects.get(pk=user.pk)
+            User.objects.count()
+        [(statement, queries)] = log.repeated_selects()
+        self.assertEqual(len(queries), 3)
+        self.assertIn('WHERE "users"."id" = %s LIMIT ?', statement)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AuthThrottleTests(APITest):
+    url = '/api/auth/login/'
+
+    def setUp(self):
+        cache.clear()
+
+    def statuses(self, count, email=lambda n: 'ada@example.com', **extra):
+        return [
+            self.client.post(
+                self.url, {'email': email(n), 'password': 'wrong'}, format='json',
+                **{key: value(n) for key, value in extra.items()},
+            ).status_code
+            for n in range(count)
+        ]
+
+    def test_forwarded_for_does_not_pick_the_bucket(self):
+        # Burst of 5 per address; a rotating header must not reset it
+        statuses = self.statuses(7, email=lambda n: f'user{n}@example.com',
+                                 HTTP_X_FORWARDED_FOR=lambda n: f'203.0.113.{n}')
+        self.assertEqual(statuses, [401] * 5 + [429] * 2)
+
+    def test_one_account_is_throttled_across_addresses(self):
+        # Burst of 10 per email, whichever address the guesses come from
+        statuses = self.statuses(12, REMOTE_ADDR=lambda n: f'198.51.100.{n}')
+        self.assertEqual(statuses, [401] * 10 + [429] * 2)
+
+    def test_throttled_response_says_when_to_retry(self):
+        self.statuses(5)
+        response = self.client.post(self.url, {'email': 'ada@example.com', 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        clock = mock.Mock(time=lambda: self.now)
+        for module in (locmem, cache_base):
+            patcher = mock.patch.object(module, 'time', clock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.throttle = throttling.TokenBucketThrottle()
+        self.throttle.cache = locmem.LocMemCache('throttle-tests', {})
+        self.throttle.cache.clear()
+        self.throttle.timer = lambda: self.now
+        self.throttle.scope = 'test'
+        self.throttle.get_ident_for = lambda request, view: 'client'
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'test': '1/s:5'}})
+    def test_steady_load_across_the_ttl_keeps_the_bucket(self):
+        # The keys live 2 * 5 + 60 = 70s from their last use
+        self.assertEqual([self.throttle.allow_request(None, None) for _ in range(6)], [True] * 5 + [False])
+        allowed = 0
+        for _ in range(300):
+            self.now += 0.5
+            allowed += self.throttle.allow_request(None, None)
+        # Two requests a second against a refill of one: the bucket never comes back full
+        self.assertEqual(allowed, 150)
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'test': '1/s:5'}})
+    def test_idle_bucket_expires_full(self):
+        for _ in range(6):
+            self.throttle.allow_request(None, None)
+        self.now += 71
+        self.assertEqual([self.throttle.allow_request(None, None) for _ in range(6)], [True] * 5 + [False])
+
+
+# Saving a profile adds queries the route's budget doesn't allow for
+@override_settings(
+    PROFILING_ENABLED=True, PROFILE_SAMPLE_RATE=0.0, PROFILE_SAMPLE_INTERVAL=0.0005, QUERY_CHECKS=False,
+)
+class ProfilingMiddlewareTests(APITest):
+    url = '/api/admin/users/'
+
+    def setUp(self):
+        self.admin = make_user('admin')
+
+    def profiled(self, user, mode='cprofile'):
+        self.login_as(user)
+        response = self.client.get(self.url, headers={'X-Profile': mode})
+        self.assertEqual(response.status_code, 200 if user.role == 'admin' else 403)
+        return list(RequestProfile.objects.all())
+
+    def test_admin_header_stores_a_profile(self):
+        for mode in profiling.MODES:
+            with self.subTest(mode):
+                RequestProfile.objects.all().delete()
+                [profile] = self.profiled(self.admin, mode)
+                self.assertEqual((profile.trigger, profile.mode, profile.user), ('header', mode, self.admin))
+                self.assertEqual(
+                    (profile.path, profile.route, profile.status_code), (self.url, 'admin-users-list', 200),
+                )
+                self.assertLessEqual(
+                    {'authentication', 'permissions', 'view', 'queryset', 'serialization', 'rendering'},
+                    set(profile.phases),
+                )
+                self.assertAlmostEqual(profile.duration_ms, sum(profile.phases.values()), places=1)
+                self.assertGreater(profile.db_queries, 0)
+                self.assertTrue(profile.summary)
+                # A fast request can end before the sampler takes its first sample
+                if mode == 'cprofile':
+                    self.assertTrue(profile.data)
+
+    def test_header_is_ignored_for_other_users(self):
+        for role in ('customer', 'owner', 'agent'):
+            with self.subTest(role):
+                self.assertEqual(self.profiled(make_user(role)), [])
+        self.client.credentials()
+        self.client.get('/api/restaurants/', headers={'X-Profile': 'cprofile'})
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_profiling_leaves_the_stack(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.profiling_middleware(lambda request: None)
+        with mock.patch.object(profiling, '_instrument') as instrument:
+            BaseHandler().load_middleware()
+        instrument.assert_not_called()
+        self.assertEqual(self.profiled(self.admin), [])
+
+
+class MetricsViewTests(TestCase):
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_open_on_a_dev_server(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='s3cret', DEBUG=False)
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'foodie_', response.content)
+
+
+class SerializerTimingTests(TestCase):
+
+    def setUp(self):
+        metrics._instrument_serializers()
+        make_restaurant(items=2)
+        self.restaurants = eager_load(Restaurant.objects.all(), RestaurantSerializer)
+
+    def sampled_seconds(self, serializer):
+        sample = metrics.Sample()
+        token = metrics._sample.set(sample)
+        try:
+            serializer.data
+        finally:
+            metrics._sample.reset(token)
+        return sample.serializer_seconds
+
+    def test_drf_and_compiled_serializers_are_timed(self):
+        compiled = read_serializer(RestaurantSerializer)
+        self.assertIsNot(compiled, RestaurantSerializer)
+        for serializer_class in (RestaurantSerializer, compiled):
+            with self.subTest(serializer_class.__name__):
+                self.assertGreater(self.sampled_seconds(serializer_class(self.restaurants, many=True)), 0)
+
+    def test_instrumenting_twice_times_once(self):
+        data = metrics.BaseSerializer.data
+        metrics._instrument_serializers()
+        self.assertIs(metrics.BaseSerializer.data, data)
+
+
+class AsyncReadParityTests(APITest):
+    """The async read views answer exactly as the DRF views they stand in for"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from common.testing import make_order
+        from menu.models import Category
+
+        Category.objects.bulk_create([Category(name=f'Category {n}') for n in range(3)])
+        owner = make_user('owner')
+        cls.restaurants = [make_restaurant(owner, items=2) for _ in range(23)]
+        cls.customer = make_user()
+        for restaurant in cls.restaurants[:3]:
+            make_order(cls.customer, restaurant)
+
+    def fetch_both(self, url):
+        separator = '&' if '?' in url else '?'
+        fast = self.client.get(url)
+        drf = self.client.get(f'{url}{separator}format=json')
+        return fast, drf
+
+    def assertSame(self, url):
+        fast, drf = self.fetch_both(url)
+        self.assertEqual(fast.status_code, drf.status_code, url)
+        self.assertEqual(fast['Content-Type'], drf['Content-Type'], url)
+        fast_body, drf_body = fast.json(), drf.json()
+        if isinstance(fast_body, dict) and 'results' in fast_body:
+            # DRF's links carry the format=json that routed to it
+            for link in ('next', 'previous'):
+                if drf_body[link] is not None:
+                    drf_body[link] = drf_body[link].replace('format=json&', '').replace('&format=json', '')
+        self.assertEqual(fast_body, drf_body, url)
+        return fast
+
+    def test_public_reads(self):
+        restaurant = self.restaurants[0]
+        first = self.assertSame('/api/restaurants/')
+        self.assertSame(first.json()['next'])
+        for url in (
+            f'/api/restaurants/{restaurant.pk}/',
+            f'/api/restaurants/{restaurant.pk}/menu/',
+            '/api/menu/categories/',
+            '/api/menu/',
+            f'/api/menu/?restaurant={restaurant.pk}',
+        ):
+            self.assertSame(url)
+
+    def test_order_list(self):
+        self.login_as(self.customer)
+        self.assertEqual(len(self.assertSame('/api/orders/').json()['results']), 3)
+
+    def test_error_bodies(self):
+        for url in (
+            '/api/restaurants/999999/',
+            '/api/restaurants/not-a-number/',
+            '/api/restaurants/999999/menu/',
+            '/api/restaurants/?cursor=cD1ub3QtYS1kYXRlLDE%3D',
+            '/api/orders/',
+        ):
+            self.assertGreaterEqual(self.assertSame(url).status_code, 400, url)
+        fast, drf = self.fetch_both('/api/orders/')
+        self.assertEqual(fast['WWW-Authenticate'], drf['WWW-Authenticate'])
+
+    def test_bad_token_body(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-jwt')
+        self.assertEqual(self.assertSame('/api/orders/').status_code, 401)
+
+
+class ORJSONRendererTests(TestCase):
+    """Same bytes as DRF's JSONRenderer"""
+
+    def assertRendersLikeDRF(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_order_payload(self):
+        customer = make_user()
+        for restaurant in [make_restaurant(items=3) for _ in range(2)]:
+            make_order(customer, restaurant, lines=3)
+        self.assertRendersLikeDRF(OrderSerializer(Order.objects.all(), many=True).data)
+
+    def test_values_orjson_and_drf_encode_differently(self):
+        kolkata = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+        values = [
+            Decimal('1.10'),
+            datetime.datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=kolkata),
+            datetime.datetime(2026, 1, 2, 3, 4, 5, 6),
+            datetime.date(2026, 1, 2),
+            datetime.time(1, 2, 3, 456789),
+            datetime.timedelta(seconds=90),
+            uuid.UUID(int=5),
+            {1},
+            {1: 'a', None: 2},
+            'ñ \u2028 \u2029',
+            2 ** 70,
+        ]
+        for value in values:
+            with self.subTest(value=value):
+                self.assertRendersLikeDRF({'value': value})
+
+    def test_indented_on_request(self):
+        rendered = ORJSONRenderer().render({'a': [1]}, 'application/json; indent=4')
+        self.assertEqual(rendered, b'{\n  "a": [\n    1\n  ]\n}')
+
+
+class ORJSONParserTests(SimpleTestCase):
+
+    def parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(io.BytesIO(body), parser_context={'encoding': encoding})
+
+    def test_parses_like_drf(self):
+        for body in [b'{"a": 1.5, "b": [null, true], "c": "\\u00f1"}', b'[]', '{"n": "ñ"}'.encode()]:
+            with self.subTest(body=body):
+                self.assertEqual(self.parse(ORJSONParser(), body), self.parse(JSONParser(), body))
+
+    def test_other_charsets_are_decoded(self):
+        self.assertEqual(self.parse(ORJSONParser(), '{"n": "ñ"}'.encode('latin-1'), 'latin-1'), {'n': 'ñ'})
+
+    def test_invalid_bodies_are_refused(self):
+        for body in [b'{bad', b'{"a": NaN}', b'{"a": Infinity}', b'\xff']:
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                self.parse(ORJSONParser(), body)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionTests(APITest):
+
+    body = orjson.dumps([{'id': n, 'status': 'placed'} for n in range(50)])
+
+    def compress(self, accept_encoding, response=None):
+        request = RequestFactory().get('/api/orders/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        if response is None:
+            response = HttpResponse(self.body, content_type='application/json')
+        return compression.compress_response(request, response)
+
+    def test_gzip(self):
+        response = self.compress('gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_api_responses_are_compressed(self):
+        make_restaurant()
+        response = self.client.get('/api/restaurants/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(orjson.loads(gzip.decompress(response.content))['results']), 1)
+
+    def test_refused_codings_are_not_used(self):
+        for accept_encoding in ['', 'gzip;q=0', 'identity', 'br;q=0, gzip;q=0']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.compress(accept_encoding)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, self.body)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_small_html_and_streaming_responses_are_left_alone(self):
+        responses = [
+            HttpResponse(b'[]', content_type='application/json'),
+            HttpResponse(b'<p>' * 100, content_type='text/html'),
+            StreamingHttpResponse(iter([self.body]), content_type='application/json'),
+        ]
+        for response in responses:
+            with self.subTest(response=response):
+                self.assertFalse(self.compress('gzip', response).has_header('Content-Encoding'))
+
+    def test_etag_is_weakened(self):
+        response = HttpResponse(self.body, content_type='application/json')
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.compress('gzip', response)['ETag'], 'W/"abc"')
+
+    def test_without_brotli_br_falls_back_to_gzip(self):
+        with mock.patch.object(compression, 'brotli', None):
+            self.assertEqual(self.compress('br, gzip')['Content-Encoding'], 'gzip')
+            self.assertFalse(self.compress('br').has_header('Content-Encoding'))
+
+    @skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        response = self.compress('gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), self.body)
+
+
+class APIMiddlewareTests(APITest):
+    """The session stack is skipped under /api/ and kept for admin/"""
+
+    def setUp(self):
+        # A browser that has used the admin: stale session, CSRF cookie
+        self.client = self.client_class(enforce_csrf_checks=True)
+        self.client.cookies['sessionid'] = 'stale'
+        self.client.cookies['csrftoken'] = 'x' * 32
+
+    def test_api_requests_skip_the_session_stack(self):
+        make_restaurant()
+        with self.assertNumQueries(2):  # count and page, as without cookies; no session read
+            response = self.client.get('/api/menu/categories/')
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(response.has_header('X-Frame-Options'))
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+
+    def test_api_posts_need_no_csrf_token(self):
+        cache.clear()  # auth throttle
+        response = self.client.post('/api/auth/login/', {'email': 'nobody@example.com', 'password': 'x'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_admin_keeps_the_session_stack(self):
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies['sessionid'].value, '')  # the stale session is cleared
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertEqual(self.client.post('/admin/login/', {'username': 'a', 'password': 'b'}).status_code, 403)
+
+    def test_admin_session_login(self):
+        self.client.cookies.clear()
+        self.client.force_login(make_user('admin', is_staff=True, is_superuser=True))
+        self.assertEqual(self.client.get('/admin/').status_code, 200)
+
+
+class FastReadTests(TestCase):
+    """Compiled read serializers render exactly what the DRF serializers do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        customers = [make_user() for _ in range(3)]
+        agent = make_user('agent')
+        restaurants = [make_restaurant(items=4) for _ in range(3)]
+        for n, customer in enumerate(customers):
+            make_review(customer, restaurants[0], n + 3)
+            make_order(customer, restaurants[n % 2], agent=agent if n else None, lines=3)
+            fill_cart(customer, restaurants[1].menu_items.all()[:n + 1])
+        fill_cart(agent, [])
+        RequestProfile.objects.create(
+            method='GET', path='/api/menu/', route='menuitem-list', status_code=200, user=agent,
+            trigger='sample', mode='sample', duration_ms=1.5, phases={'view': 1.0}, data=b'',
+        )
+        cls.request = Request(RequestFactory().get('/api/menu/'))
+
+    cases = [
+        (CategorySerializer, Category.objects.all()),
+        (MenuItemSerializer, MenuItem.objects.all()),
+        (RestaurantSerializer, Restaurant.objects.all()),
+        (ReviewSerializer, Review.objects.all()),
+        (OrderSerializer, Order.objects.all()),
+        (OrderItemSerializer, OrderItem.objects.all()),
+        (CartSerializer, Cart.objects.with_totals()),
+        (CartItemSerializer, CartItem.objects.all()),
+        (UserSerializer, User.objects.all()),
+        (RequestProfileSerializer, RequestProfile.objects.all()),
+        (RequestProfileDetailSerializer, RequestProfile.objects.all()),
+    ]
+
+    def assertRendersLikeDRF(self, serializer_class, data, many=True, context={}):
+        fast = read_serializer(serializer_class)
+        self.assertIsNot(fast, serializer_class, 'not compiled')
+        self.assertEqual(
+            ORJSONRenderer().render(fast(data, many=many, context=context).data),
+            ORJSONRenderer().render(serializer_class(data, many=many, context=context).data),
+        )
+
+    def test_every_read_serializer(self):
+        for serializer_class, queryset in self.cases:
+            rows = list(eager_load(queryset, serializer_class))
+            self.assertGreater(len(rows), 0)
+            for context in ({}, {'request': self.request}):
+                with self.subTest(serializer_class.__name__, context=context):
+                    self.assertRendersLikeDRF(serializer_class, rows, context=context)
+                    self.assertRendersLikeDRF(serializer_class, rows[0], many=False, context=context)
+
+    def test_settings_the_output_depends_on(self):
+        rows = list(eager_load(Order.objects.all(), OrderSerializer))
+        for settings in [
+            {'REST_FRAMEWORK': {'COERCE_DECIMAL_TO_STRING': False}},
+            {'TIME_ZONE': 'Asia/Kolkata'},
+            {'USE_TZ': False},
+        ]:
+            with self.subTest(**settings), override_settings(**settings):
+                self.assertRendersLikeDRF(OrderSerializer, rows)
+        with timezone.override('America/New_York'):
+            self.assertRendersLikeDRF(OrderSerializer, rows)
+
+    def test_values_the_inline_conversions_hand_back_to_drf(self):
+        items = list(eager_load(MenuItem.objects.all(), MenuItemSerializer)[:5])
+        items[0].category = None
+        items[1].image = 'menu_items/dish.png'
+        items[2].price = Decimal('12.345')
+        items[3].price = 7.5
+        items[4].created_at = datetime.datetime(2024, 1, 2, 3, 4, 5)
+        for context in ({}, {'request': self.request}):
+            with self.subTest(context=context):
+                self.assertRendersLikeDRF(MenuItemSerializer, items, context=context)
+        self.assertRendersLikeDRF(MenuItemSerializer, MenuItem(name='new', price=Decimal('1')), many=False)
+
+        order = eager_load(Order.objects.filter(assigned_agent=None), OrderSerializer).get()
+        order.status = 'unknown'
+        self.assertRendersLikeDRF(OrderSerializer, order, many=False)
+
+    def test_related_managers(self):
+        restaurant = Restaurant.objects.first()
+        self.assertRendersLikeDRF(MenuItemSerializer, restaurant.menu_items)
+
+
+def decimal_line(price, quantity):
+    """The Decimal line subtotal common.money replaced"""
+    return (price * quantity).quantize(Decimal('0.01'))
+
+
+def decimal_totals(subtotal):
+    """The Decimal totals common.money replaced"""
+    tax = (subtotal * Decimal('0.05')).quantize(Decimal('0.01'))
+    return subtotal, tax, (subtotal + tax + Decimal('40.00')).quantize(Decimal('0.01'))
+
+
+class MoneyTests(SimpleTestCase):
+    """Paise arithmetic gives what the Decimal arithmetic gave"""
+
+    decimal_field = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    def test_every_subtotal_up_to_400_rupees(self):
+        # Tax is a twentieth of the subtotal, so this covers each rounding case
+        # (and each half-to-even tie) 2000 times over
+        for paise in range(40001):
+            rupees = Decimal(paise).scaleb(-2)
+            self.assertEqual(tuple(map(money.from_paise, money.totals(paise))), decimal_totals(rupees))
+            self.assertEqual(money.format_paise(paise), self.decimal_field.to_representation(rupees))
+            self.assertEqual(money.format_paise(-paise), self.decimal_field.to_representation(-rupees))
+
+    def test_random_lines(self):
+        rng = random.Random(25)
+        for _ in range(5000):
+            price = Decimal(rng.choice([rng.randrange(100), rng.randrange(10 ** 6), rng.randrange(10 ** 8)])).scaleb(-2)
+            quantity = rng.randint(1, 50)
+            paise = money.line_subtotal(price, quantity)
+            self.assertEqual(money.from_paise(paise), decimal_line(price, quantity))
+            self.assertEqual(money.MoneyField().to_representation(paise), str(decimal_line(price, quantity)))
+
+    def test_sub_paise_prices_round_half_to_even(self):
+        for price, paise in [('12.345', 1234), ('12.355', 1236), ('0.005', 0), ('0.015', 2), (7, 700), ('7.5', 750)]:
+            with self.subTest(price=price):
+                self.assertEqual(money.to_paise(Decimal(price) if isinstance(price, str) else price), paise)
+
+    def test_conversion_memo_is_bounded(self):
+        with mock.patch.object(money, 'MAX_CACHED_AMOUNTS', 10), mock.patch.object(money, '_paise', {}):
+            for paise in range(25):
+                self.assertEqual(money.to_paise(Decimal(paise).scaleb(-2)), paise)
+                self.assertLessEqual(len(money._paise), 10)
+
+    @override_settings(REST_FRAMEWORK={'COERCE_DECIMAL_TO_STRING': False})
+    def test_money_field_without_string_coercion(self):
+        self.assertEqual(money.MoneyField().to_representation(75085), Decimal('750.85'))
+
+
+class CartTotalsTests(TestCase):
+    """Each way a cart total is computed agrees with the Decimal arithmetic"""
+
+    def test_random_carts(self):
+        rng = random.Random(25)
+        restaurant = make_restaurant(items=6)
+        items = list(restaurant.menu_items.all())
+        carts = []
+        for _ in range(20):
+            cart = Cart.objects.create(user=make_user())
+            lines = [
+                CartItem(
+                    cart=cart, menu_item=item, quantity=rng.randint(1, 20),
+                    price_snapshot=Decimal(rng.randrange(10 ** 7)).scaleb(-2),
+                )
+                for item in rng.sample(items, rng.randint(0, len(items)))
+            ]
+            CartItem.objects.bulk_create(lines)
+            subtotal = sum((decimal_line(line.price_snapshot, line.quantity) for line in lines), Decimal('0.00'))
+            carts.append((cart.pk, decimal_totals(subtotal)))
+
+        prefetched = Cart.objects.prefetch_related(Prefetch('items', queryset=CartItem.objects.all()))
+        for pk, expected in carts:
+            with self.subTest(cart=pk):
+                self.assertEqual(Cart.objects.get(pk=pk).totals(), expected)  # aggregate query
+                self.assertEqual(Cart.objects.with_totals().get(pk=pk).totals(), expected)
+                self.assertEqual(prefetched.get(pk=pk).totals(), expected)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the replica is a copy of the SQLite test database')
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Two SQLite databases: the test database as primary and a copy of it as
+    replica, whose names are marked so each read shows where it came from.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        cls.replica_path = os.path.join(cls.replica_dir.name, 'replica.sqlite3')
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_path}
+        cls.replica_settings = mock.patch.dict(settings.DATABASES, {'replica': replica})
+        cls.replica_settings.start()
+        connections.configure_settings(settings.DATABASES)
+        # Set here, not on the class, so the runner doesn't try to create it
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        cls.replica_settings.stop()
+        cls.replica_dir.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.restaurant = make_restaurant(owner=self.owner, name='Dosa Corner')
+        self.customer = make_user()
+        make_order(self.customer, self.restaurant)
+
+        connections['replica'].close()
+        connections['default'].ensure_connection()
+        with closing(sqlite3.connect(self.replica_path)) as replica:
+            connections['default'].connection.backup(replica)
+            replica.execute("UPDATE restaurants SET name = name || ' (replica)'")
+            replica.execute("UPDATE users SET name = name || ' (replica)'")
+            replica.commit()
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token(user)}')
+        return client
+
+    def restaurant_name(self, client):
+        return client.get(f'/api/restaurants/{self.restaurant.pk}/').json()['name']
+
+    def test_catalog_reads_come_from_the_replica(self):
+        client = self.client_for()
+        self.assertEqual(self.restaurant_name(client), 'Dosa Corner (replica)')
+        self.assertEqual(client.get('/api/restaurants/').json()['results'][0]['name'], 'Dosa Corner (replica)')
+        self.assertEqual(self.restaurant_name(self.client_for(self.customer)), 'Dosa Corner (replica)')
+
+    async def test_async_catalog_reads_come_from_the_replica(self):
+        response = await self.async_client.get(f'/api/restaurants/{self.restaurant.pk}/')
+        self.assertEqual(response.json()['name'], 'Dosa Corner (replica)')
+
+    def test_other_apps_read_the_primary(self):
+        orders = self.client_for(self.customer).get('/api/orders/').json()['results']
+        self.assertEqual(orders[0]['restaurant_name'], 'Dosa Corner')
+
+    def test_admin_reporting_reads_the_replica(self):
+        users = self.client_for(make_user('admin')).get('/api/admin/users/').json()['results']
+        self.assertIn(f'{self.customer.name} (replica)', [user['name'] for user in users])
+
+    def test_django_admin_reads_the_primary(self):
+        self.client.force_login(make_user('admin', is_staff=True, is_superuser=True))
+        response = self.client.get(f'/admin/restaurants/restaurant/{self.restaurant.pk}/change/')
+        self.assertContains(response, 'value="Dosa Corner"')
+        self.assertNotContains(response, '(replica)')
+
+    def test_writer_is_pinned_to_the_primary(self):
+        owner = self.client_for(self.owner)
+        response = owner.patch(f'/api/restaurants/{self.restaurant.pk}/', {'address': '2 New Street'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.restaurant_name(owner), 'Dosa Corner')
+        # Other clients keep reading the replica
+        self.assertEqual(self.restaurant_name(self.client_for()), 'Dosa Corner (replica)')
+        self.assertEqual(self.restaurant_name(self.client_for(self.customer)), 'Dosa Corner (replica)')
+
+        # The pin follows the user to a refreshed access token
+        refreshed = APIClient()
+        refreshed.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleRefreshToken.for_user(self.owner).access_token}')
+        self.assertEqual(self.restaurant_name(refreshed), 'Dosa Corner')
+
+        cache.clear()  # the pin expires
+        self.assertEqual(self.restaurant_name(owner), 'Dosa Corner (replica)')
+
+    def test_anonymous_writer_is_pinned_by_address(self):
+        client = self.client_for()
+        client.post('/api/auth/login/', {'email': 'nobody@example.com', 'password': 'x'})
+        self.assertEqual(self.restaurant_name(client), 'Dosa Corner')
+        self.assertEqual(self.restaurant_name(self.client_for(self.customer)), 'Dosa Corner (replica)')
+
+    def test_forged_token_cannot_pin_another_user(self):
+        forged = APIClient()
+        forged.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token(self.owner)[:-4]}xxxx')
+        self.assertEqual(forged.post('/api/cart/add/', {}).status_code, 401)
+        self.assertEqual(self.restaurant_name(self.client_for(self.owner)), 'Dosa Corner (replica)')
+
+    def test_atomic_blocks_and_use_primary_read_the_primary(self):
+        scope = dbrouter._replica_reads.set('apps')
+        self.addCleanup(dbrouter._replica_reads.reset, scope)
+        self.assertEqual(Restaurant.objects.get().name, 'Dosa Corner (replica)')
+        with transaction.atomic():
+            self.assertEqual(Restaurant.objects.get().name, 'Dosa Corner')
+        with dbrouter.use_primary():
+            self.assertEqual(Restaurant.objects.get().name, 'Dosa Corner')
+        self.assertEqual(Restaurant.objects.get().name, 'Dosa Corner (replica)')
+        # Outside the catalog apps
+        self.assertEqual(User.objects.get(pk=self.owner.pk).name, self.owner.name)
+
+
+class FakeConnection:
+    """A DB-API connection that records what the pool does to it"""
+
+    class Error(Exception):
+        pass
+
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        if not self.alive:
+            raise self.Error('gone away')
+        return mock.Mock()
+
+    def rollback(self):
+        if not self.alive:
+            raise self.Error('gone away')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch.object(dbpool.time, 'monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.pool = dbpool.ConnectionPool(max_size=2, timeout=0, max_lifetime=600, max_idle=60, ping_interval=10)
+        self.opened = []
+        self.checks = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def check(self, connection):
+        self.checks.append(connection)
+        return connection.alive
+
+    def acquire(self):
+        return self.pool.acquire(self.connect, self.check)
+
+    def test_size_is_capped(self):
+        first, second = self.acquire(), self.acquire()
+        with self.assertRaises(dbpool.PoolTimeout):
+            self.acquire()
+        self.pool.release(first)
+        self.assertIs(self.acquire(), first)
+        stats = self.pool.stats()
+        self.assertEqual((stats['created'], stats['timeouts'], stats['size'], stats['in_use']), (2, 1, 2, 2))
+
+    def test_waiter_gets_the_next_released_connection(self):
+        pool = dbpool.ConnectionPool(max_size=1, timeout=5, max_lifetime=600, max_idle=60, ping_interval=10)
+        with mock.patch.object(dbpool.time, 'monotonic', time.monotonic):
+            connection = pool.acquire(self.connect, self.check)
+            got = []
+            waiter = threading.Thread(target=lambda: got.append(pool.acquire(self.connect, self.check)))
+            waiter.start()
+            while not pool.stats()['waiting'] and waiter.is_alive():
+                time.sleep(0.001)
+            pool.release(connection)
+            waiter.join(pool.timeout)
+        self.assertEqual(got, [connection])
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_failed_connect_frees_its_slot(self):
+        with self.assertRaises(OSError):
+            self.pool.acquire(mock.Mock(side_effect=OSError), self.check)
+        self.acquire(), self.acquire()
+        self.assertEqual(self.pool.stats()['size'], 2)
+
+    def test_idle_connections_are_recycled(self):
+        connection = self.acquire()
+        self.pool.release(connection)
+        self.now += 61
+        self.assertIsNot(self.acquire(), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['recycled'], 1)
+
+    def test_old_connections_are_recycled(self):
+        connection = self.acquire()
+        self.now += 601
+        self.pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['idle'], 0)
+
+        # ...and so are idle ones that grew too old
+        connection = self.acquire()
+        self.now += 590
+        self.pool.release(connection)
+        self.now += 20
+        self.assertIsNot(self.acquire(), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['recycled'], 2)
+
+    def test_connections_idle_past_the_ping_interval_are_checked(self):
+        connection = self.acquire()
+        self.pool.release(connection)
+        self.now += 5
+        self.assertIs(self.acquire(), connection)
+        self.assertEqual(self.checks, [])
+
+        self.pool.release(connection)
+        self.now += 11
+        self.assertIs(self.acquire(), connection)
+        self.assertEqual(self.checks, [connection])
+
+    def test_connections_failing_the_check_are_dropped(self):
+        connection = self.acquire()
+        self.pool.release(connection)
+        connection.alive = False
+        self.now += 11
+        replacement = self.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        stats = self.pool.stats()
+        self.assertEqual((stats['failed_checks'], stats['size'], stats['in_use']), (1, 1, 1))
+
+    def test_each_database_and_process_gets_its_own_pool(self):
+        settings_dict = {'NAME': 'foodie', 'POOL': {'MAX_SIZE': 3}}
+        pool = dbpool.get_pool('default', settings_dict)
+        self.assertIs(dbpool.get_pool('default', settings_dict), pool)
+        self.assertEqual(pool.max_size, 3)
+        self.assertIsNot(dbpool.get_pool('default', {**settings_dict, 'NAME': 'test_foodie'}), pool)
+        with mock.patch.object(dbpool.os, 'getpid', return_value=pool.pid + 1):
+            self.assertIsNot(dbpool.get_pool('default', settings_dict), pool)
+
+
+class FakeDatabaseWrapper:
+    """The parts of a Django ``DatabaseWrapper`` the pool mixin uses"""
+    Database = FakeConnection
+    alias = 'fake'
+
+    def __init__(self, pool):
+        self.settings_dict = {'NAME': 'fake'}
+        self._pool = pool
+        self.connection = None
+        self.in_atomic_block = False
+        self.errors_occurred = False
+        self.autocommit = True
+
+    def get_new_connection(self, conn_params):
+        return FakeConnection()
+
+    def get_autocommit(self):
+        return self.autocommit
+
+    def is_usable(self):
+        return self.connection.alive
+
+
+class PooledWrapper(dbpool.PooledDatabaseWrapperMixin, FakeDatabaseWrapper):
+
+    @property
+    def pool(self):
+        return self._pool
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = dbpool.ConnectionPool(max_size=2, timeout=0, max_lifetime=600, max_idle=60, ping_interval=10)
+        self.wrapper = PooledWrapper(self.pool)
+
+    def connect(self):
+        self.wrapper.connection = self.wrapper.get_new_connection({})
+        return self.wrapper.connection
+
+    def close(self):
+        connection = self.wrapper.connection
+        self.wrapper._close()
+        self.wrapper.connection = None
+        return connection
+
+    def assertPooled(self, connection, pooled=True):
+        self.assertEqual(self.pool.stats()['idle'], int(pooled))
+        self.assertEqual(connection.closed, not pooled)
+
+    def test_closed_connections_go_back_to_the_pool(self):
+        connection = self.connect()
+        self.close()
+        self.assertPooled(connection)
+        self.assertEqual(connection.rollbacks, 0)
+        self.assertIs(self.connect(), connection)
+
+    def test_open_transactions_are_rolled_back(self):
+        connection = self.connect()
+        self.wrapper.autocommit = False
+        self.close()
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertPooled(connection)
+
+    def test_failed_rollback_discards(self):
+        connection = self.connect()
+        self.wrapper.autocommit = False
+        connection.alive = False
+        self.close()
+        self.assertPooled(connection, False)
+
+    def test_closed_inside_atomic_is_discarded(self):
+        connection = self.connect()
+        self.wrapper.in_atomic_block = True
+        self.close()
+        self.assertPooled(connection, False)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_errors_discard_only_unusable_connections(self):
+        connection = self.connect()
+        self.wrapper.errors_occurred = True
+        self.close()
+        self.assertPooled(connection)
+
+        connection = self.connect()
+        connection.alive = False
+        self.close()
+        self.assertPooled(connection, False)
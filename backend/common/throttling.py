@@ -0,0 +1,159 @@
+"""
+Token-bucket throttling.
+
+Each bucket holds up to ``burst`` tokens and refills at ``N / period``.
+State lives in the shared cache as two keys: the bucket's start time and a
+running count of tokens taken, bumped with the backend's atomic ``incr``.
+Both keys expire once the bucket has been idle long enough to refill, and
+every request pushes that expiry back. A request is allowed while
+
+    taken <= burst + refill_rate * (now - start)
+
+so a check is O(1), needs no locks and never touches the database. When a
+bucket has been idle long enough to hold more than ``burst`` tokens its
+start time is moved forward to cap the credit.
+
+Rates are configured in ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']`` as
+``'N/period'`` (burst defaults to N) or ``'N/period:burst'``.
+
+Client addresses come from DRF's ``get_ident``, which only reads
+``X-Forwarded-For`` when ``REST_FRAMEWORK['NUM_PROXIES']`` says how many
+trusted proxies append to it; otherwise any client could pick its own
+address, and with it a fresh bucket.
+"""
+import hashlib
+import math
+import time
+
+from django.core.cache import cache as default_cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return ``(refill tokens per second, burst)`` for a rate string"""
+    rate, _, burst = rate.partition(':')
+    num, period = rate.split('/')
+    refill = int(num) / PERIODS[period[0]]
+    return refill, int(burst) if burst else int(num)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    cache = default_cache
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+    timer = time.time
+    scope = None
+
+    def get_rate(self):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        try:
+            return rates[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No throttle rate set for '{self.scope}' scope")
+
+    def get_ident_for(self, request, view):
+        """Return the bucket identity, or None to skip throttling"""
+        raise NotImplementedError('.get_ident_for() must be overridden')
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        ident = self.get_ident_for(request, view)
+        if ident is None:
+            return True
+
+        rate = self.get_rate()
+        if rate is None:
+            return True
+        refill, burst = parse_rate(rate)
+
+        key = self.cache_format % {'scope': self.scope, 'ident': ident}
+        start_key, taken_key = f'{key}:start', f'{key}:taken'
+        now = self.timer()
+        # Long enough for an idle bucket to refill completely, plus slack
+        ttl = math.ceil(burst / refill) * 2 + 60
+
+        start = self.cache.get(start_key)
+        if start is None:
+            start = now
+            self.cache.set_many({start_key: start, taken_key: 0}, timeout=ttl)
+        else:
+            # incr() keeps a key's expiry, so a busy bucket would otherwise
+            # expire on schedule and come back full
+            self.cache.touch(start_key, ttl)
+            self.cache.touch(taken_key, ttl)
+
+        try:
+            taken = self.cache.incr(taken_key)
+        except ValueError:
+            self.cache.set_many({start_key: now, taken_key: 1}, timeout=ttl)
+            start, taken = now, 1
+
+        available = burst + refill * (now - start) - taken
+        if available >= 0:
+            if available > burst:
+                # Idle bucket: cap the credit at one full bucket
+                self.cache.set(start_key, now - taken / refill, timeout=ttl)
+            return True
+
+        # Denied requests don't consume a token
+        self.cache.decr(taken_key)
+        self.retry_after = -available / refill
+        return False
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user (``user`` rate)"""
+    scope = 'user'
+
+    def get_ident_for(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per client address (``ip`` rate)"""
+    scope = 'ip'
+
+    def get_ident_for(self, request, view):
+        return self.get_ident(request)
+
+
+class ScopedTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Per-endpoint-class buckets for views (or actions) that set
+    ``throttle_scope``; keyed by user, or by address for anonymous requests.
+    """
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            self.retry_after = None
+            return True
+        return super().allow_request(request, view)
+
+    def get_ident_for(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return f'ip-{self.get_ident(request)}'
+
+
+class EmailTokenBucketThrottle(TokenBucketThrottle):
+    """
+    One bucket per submitted ``email`` (``auth_email`` rate), so guesses at
+    one account's password are throttled however many addresses they come from.
+    """
+    scope = 'auth_email'
+
+    def get_ident_for(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        # Fixed-length and safe as a cache key whatever was submitted
+        return hashlib.sha256(email.strip().lower().encode()).hexdigest()
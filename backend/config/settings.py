@@ -51,17 +51,27 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 # ============================================================
 
+# The session, CSRF, auth, messages and clickjacking middleware come from
+# common.middleware: the Django classes, skipped under API_PATH_PREFIX
+# (JWT only) and unchanged for admin/.
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Keep on top
+    'common.metrics.metrics_middleware',
+    'common.querycheck.query_check_middleware',  # Test runs only
+    'common.profiling.profiling_middleware',  # Only with PROFILING_ENABLED
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'common.compression.compression_middleware',
+    'common.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'common.dbrouter.replica_routing_middleware',
+    'common.middleware.CsrfViewMiddleware',
+    'common.middleware.AuthenticationMiddleware',
+    'common.middleware.MessageMiddleware',
+    'common.middleware.XFrameOptionsMiddleware',
 ]
 
+API_PATH_PREFIX = '/api/'
+
 
 ROOT_URLCONF = 'config.urls'
 
@@ -88,15 +98,20 @@ TEMPLATES = [
 
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 
 
 # ============================================================
 # DATABASE (MySQL)
 # ============================================================
 
+# Connections come from a per-process pool (common.dbpool) unless DB_POOL
+# is off, in which case CONN_MAX_AGE keeps one open per thread instead.
+DB_POOL = config('DB_POOL', default=True, cast=bool)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'common.dbpool.mysql' if DB_POOL else 'django.db.backends.mysql',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
@@ -104,17 +119,192 @@ DATABASES = {
         'PORT': config('DB_PORT', cast=int),
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-        }
+            'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+        },
+        # With the pool, 0 returns connections to it after every request
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0 if DB_POOL else 60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'POOL': {
+            'MAX_SIZE': config('DB_POOL_SIZE', default=10, cast=int),
+            # Seconds to wait for a free connection before failing
+            'TIMEOUT': config('DB_POOL_TIMEOUT', default=5, cast=float),
+            'MAX_LIFETIME': config('DB_POOL_MAX_LIFETIME', default=60 * 30, cast=int),
+            # Keep below the server's wait_timeout
+            'MAX_IDLE': config('DB_POOL_MAX_IDLE', default=60 * 5, cast=int),
+            'PING_INTERVAL': config('DB_POOL_PING_INTERVAL', default=30, cast=int),
+        },
     }
 }
 
 
+# Read replica: set DB_REPLICA_HOST to send catalog and admin-reporting reads
+# to it (see common.dbrouter); other credentials default to the primary's.
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+
+if DB_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST,
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT'], cast=int),
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        # Tests see one database through both aliases
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['common.dbrouter.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_APPS = ['restaurants', 'menu']
+REPLICA_PATHS = ['/api/admin/']
+# Always read from the primary: the Django admin edits what it reads
+PRIMARY_PATHS = ['/admin/']
+# How long a client that wrote reads only from the primary
+REPLICA_STICKY_SECONDS = config('DB_REPLICA_STICKY_SECONDS', default=5, cast=int)
+
+
+# ============================================================
+# RESPONSE COMPRESSION
+# ============================================================
+
+# common.compression: brotli when the `brotli` package is installed and the
+# client accepts it, gzip otherwise, for text responses of at least this size
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+
+
+# ============================================================
+# METRICS
+# ============================================================
+
+# common.metrics: per-route request metrics served at /metrics. Every request
+# is timed; this share also records DB queries/time and serializer time.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.1, cast=float)
+# Scrapes must send `Authorization: Bearer <token>`; with no token set the
+# endpoint is closed (403) unless DEBUG is on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+
+# ============================================================
+# REQUEST PROFILING
+# ============================================================
+
+# common.profiling: profiles one request at a time on demand and stores the
+# result for /api/admin/profiles/. Off means no overhead at all.
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+# Admins send this header to profile a request; its value may pick the mode
+PROFILE_HEADER = 'X-Profile'
+# Share of all requests profiled without the header
+PROFILE_SAMPLE_RATE = config('PROFILE_SAMPLE_RATE', default=0.0, cast=float)
+# 'cprofile' (deterministic) or 'sample' (stack sampling, lower overhead)
+PROFILE_MODE = config('PROFILE_MODE', default='cprofile')
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Newest profiles kept
+PROFILE_KEEP = 200
+
+# ============================================================
+# QUERY CHECKS (tests)
+# ============================================================
+
+# common.querycheck: flags N+1 queries and routes over their query budget.
+# The test runner turns the checks on; QUERY_CHECKS=True does it elsewhere.
+TEST_RUNNER = 'common.testrunner.QueryCheckRunner'
+QUERY_CHECKS = config('QUERY_CHECKS', default=False, cast=bool)
+# Same SELECT (parameters aside) this many times in one request = N+1
+QUERY_N_PLUS_ONE_THRESHOLD = 3
+# Most queries a request to each route may run, by view name (all methods)
+QUERY_BUDGETS = {
+    'register': 2,
+    'login': 1,
+    'token_refresh': 2,
+    'restaurant-list': 2,
+    'restaurant-detail': 3,
+    'restaurant-menu': 2,
+    'review-list': 5,
+    'review-detail': 3,
+    'category-list': 2,
+    'category-detail': 1,
+    'menuitem-list': 3,
+    'menuitem-detail': 5,
+    'cart-list': 2,
+    'cart-detail': 2,
+    'cart-add': 7,
+    'cart-remove': 5,
+    'cart-update-quantity': 5,
+    'order-list': 2,
+    'order-detail': 2,
+    'order-create-order': 9,
+    'order-update-status': 4,
+    'order-events': 1,
+    'delivery-list': 2,
+    'delivery-available-orders': 2,
+    'delivery-claim-next': 6,
+    'delivery-accept-order': 4,
+    'delivery-update-delivery-status': 4,
+    'admin-users-list': 2,
+    'admin-users-detail': 1,
+    'admin-restaurants-list': 2,
+    'admin-restaurants-detail': 3,
+    'admin-orders-list': 3,
+    'admin-orders-detail': 2,
+    'admin-profiles-list': 2,
+    'admin-profiles-detail': 1,
+    'admin-profiles-download': 1,
+    'metrics': 0,
+}
+
+
+# ============================================================
+# CACHE
+# ============================================================
+
+# LocMem by default; point CACHE_BACKEND/CACHE_LOCATION at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache) in production so that
+# menu invalidations are seen by every worker.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='foodie-express'),
+    }
+}
+
+MENU_CACHE_ALIAS = 'default'
+MENU_CACHE_TIMEOUT = config('MENU_CACHE_TIMEOUT', default=60 * 15, cast=int)
+
+# Authenticated user cache (users.authentication.CachedJWTAuthentication)
+AUTH_USER_CACHE_ALIAS = 'default'
+# Worker processes per server. uvicorn and gunicorn take their default worker
+# count from this variable, so set it instead of passing --workers; above 1
+# the app won't start on LocMem (see users.authentication).
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+
+
+# ============================================================
+# ORDER EVENTS (Server-Sent Events)
+# ============================================================
+
+# CacheBroker fans out across workers through the shared cache above;
+# orders.events.InProcessBroker is a single-process stand-in for tests.
+ORDER_EVENTS_BROKER = config('ORDER_EVENTS_BROKER', default='orders.events.CacheBroker')
+ORDER_EVENTS_BACKLOG_TTL = 60 * 5
+ORDER_EVENTS_KEEPALIVE = 15
+ORDER_EVENTS_STREAM_TIMEOUT = config('ORDER_EVENTS_STREAM_TIMEOUT', default=60 * 5, cast=int)
+# Streams open at once per process; further subscribers get a 503. Serve the
+# stream from the ASGI app: under WSGI each one holds a worker thread.
+ORDER_EVENTS_MAX_STREAMS = config('ORDER_EVENTS_MAX_STREAMS', default=100, cast=int)
+
+
 # ============================================================
 # CUSTOM USER MODEL
 # ============================================================
 
 AUTH_USER_MODEL = 'users.User'
 
+# Password checks run on a bounded pool (users.hashing)
+AUTHENTICATION_BACKENDS = ['users.backends.BoundedModelBackend']
+
 
 # ============================================================
 # PASSWORD VALIDATION
@@ -127,6 +317,13 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# PBKDF2 hashing pool: at most WORKERS hashes run at once and QUEUE_SIZE more
+# wait; anything beyond that gets 429 with Retry-After.
+# Workers default to half the CPUs.
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=0, cast=int) or None
+PASSWORD_HASH_QUEUE_SIZE = config('PASSWORD_HASH_QUEUE_SIZE', default=16, cast=int)
+PASSWORD_HASH_TIMEOUT = 10
+
 
 # ============================================================
 # INTERNATIONALIZATION
@@ -157,7 +354,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication plus a short-TTL cache of the user row
+        'users.authentication.CachedJWTAuthentication',
     ),
 
     # Require login for all APIs by default (good practice)
@@ -165,8 +363,41 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
 
+    # orjson (common/renderers.py, common/parsers.py); same output as the
+    # stock JSON renderer and parser
+    'DEFAULT_RENDERER_CLASSES': (
+        'common.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'common.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+
+    # Token buckets (common/throttling.py); rates are 'N/period[:burst]'.
+    # Views opt into an endpoint-class bucket by setting `throttle_scope`.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'common.throttling.UserTokenBucketThrottle',
+        'common.throttling.IPTokenBucketThrottle',
+        'common.throttling.ScopedTokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '600/min:120',
+        'ip': '1200/min:240',
+        'auth': '10/min:5',
+        'auth_email': '30/hour:10',
+        'cart': '60/min:20',
+        'checkout': '10/min:3',
+        'dispatch': '60/min:10',
+    },
+    # Proxies in front of the app that append to X-Forwarded-For (e.g. 1
+    # behind nginx). With 0 the header is ignored and REMOTE_ADDR is the
+    # client; never leave it unset, or clients choose their own address.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
 }
 
 
@@ -186,6 +417,15 @@ SIMPLE_JWT = {
 
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
+
+    # Refreshed access tokens get current role/name claims; rotated refresh
+    # tokens are retired in users.revocation rather than the blacklist app
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.RoleTokenRefreshSerializer',
+}
+
+# Refresh-token revocation store (users.revocation.RevocationStore)
+REFRESH_REVOCATION = {
+    'alias': 'default',
 }
 
 
@@ -5,6 +5,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from common.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -15,6 +16,7 @@ urlpatterns = [
     path('api/orders/', include('orders.urls')),
     path('api/agent/', include('delivery.urls')),
     path('api/admin/', include('adminpanel.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development
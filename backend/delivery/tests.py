@@ -0,0 +1,75 @@
+from django.core.cache import cache
+
+from common.testing import APITest, make_order, make_restaurant, make_user
+from orders.models import Order
+
+URL = '/api/agent/orders/'
+
+
+class DeliveryRouteTests(APITest):
+    """Every agent route, with orders in each dispatch state"""
+
+    def setUp(self):
+        cache.clear()  # dispatch throttle
+        self.agent = self.login_as(make_user('agent'))
+        self.other_agent = make_user('agent')
+        customer = make_user()
+        restaurant = make_restaurant(items=3)
+        self.waiting = [make_order(customer, restaurant, status='cooking') for _ in range(3)]
+        self.placed = make_order(customer, restaurant)
+        self.mine = [make_order(customer, restaurant, status='accepted', agent=self.agent) for _ in range(2)]
+        self.theirs = make_order(customer, restaurant, status='accepted', agent=self.other_agent)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.json()]
+
+    def test_list_shows_the_agents_orders(self):
+        self.assertCountEqual(self.ids(self.client.get(URL)), [order.pk for order in self.mine])
+
+    def test_available_orders(self):
+        self.assertCountEqual(
+            self.ids(self.client.get(f'{URL}available_orders/')),
+            [order.pk for order in self.waiting],
+        )
+
+    def test_claim_next_takes_the_oldest(self):
+        claimed = self.ids(self.client.post(f'{URL}claim_next/', {'count': 2}))
+        self.assertCountEqual(claimed, [order.pk for order in self.waiting[:2]])
+        self.assertEqual(
+            set(Order.objects.filter(assigned_agent=self.agent).values_list('pk', flat=True)),
+            {order.pk for order in self.mine + self.waiting[:2]},
+        )
+
+    def test_claim_next_count_is_bounded(self):
+        for count in (0, 11, 'many'):
+            response = self.client.post(f'{URL}claim_next/', {'count': count})
+            self.assertEqual(response.status_code, 400, count)
+
+    def test_accept_order(self):
+        order = self.waiting[1]
+        response = self.client.post(f'{URL}{order.pk}/accept_order/')
+        self.assertEqual(response.json()['assigned_agent'], self.agent.pk)
+
+    def test_accepting_a_held_order_is_refused(self):
+        response = self.client.post(f'{URL}{self.theirs.pk}/accept_order/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(f'{URL}0/accept_order/').status_code, 404)
+
+    def test_update_delivery_status(self):
+        order = self.mine[0]
+        response = self.client.post(f'{URL}{order.pk}/update_delivery_status/', {'status': 'out_for_delivery'})
+        self.assertEqual(response.json()['status'], 'out_for_delivery')
+        self.assertEqual(
+            self.client.post(f'{URL}{order.pk}/update_delivery_status/', {'status': 'cancelled'}).status_code,
+            400,
+        )
+        self.assertEqual(
+            self.client.post(f'{URL}{self.theirs.pk}/update_delivery_status/', {'status': 'delivered'}).status_code,
+            404,
+        )
+
+    def test_customers_are_refused(self):
+        self.login_as(make_user())
+        self.assertEqual(self.client.get(URL).status_code, 403)
+        self.assertEqual(self.client.post(f'{URL}claim_next/').status_code, 403)
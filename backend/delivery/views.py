@@ -4,11 +4,22 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from orders.models import Order
 from orders.serializers import OrderSerializer
+from orders.events import publish_order_events
+from common.queryplan import eager_load
+from common.fastread import read_serializer, renders_json
+
+MAX_CLAIM_COUNT = 10
 
 
 class DeliveryAgentViewSet(viewsets.ViewSet):
     """Delivery Agent ViewSet"""
     permission_classes = [IsAuthenticated]
+    throttle_scope = None  # set per action
+    
+    def get_read_serializer(self, *args, **kwargs):
+        # The compiled serializer for JSON; the browsable API keeps DRF's
+        serializer_class = read_serializer(OrderSerializer) if renders_json(self.request) else OrderSerializer
+        return serializer_class(*args, **kwargs)
     
     def list(self, request):
         """Get all orders assigned to the agent"""
@@ -18,11 +29,11 @@ class DeliveryAgentViewSet(viewsets.ViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        orders = Order.objects.filter(assigned_agent=request.user)
-        serializer = OrderSerializer(orders, many=True)
+        orders = eager_load(Order.objects.filter(assigned_agent=request.user), OrderSerializer)
+        serializer = self.get_read_serializer(orders, many=True)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], throttle_scope='dispatch')
     def available_orders(self, request):
         """Get orders that need delivery (not assigned to any agent)"""
         if request.user.role != 'agent':
@@ -31,16 +42,13 @@ class DeliveryAgentViewSet(viewsets.ViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        orders = Order.objects.filter(
-            status__in=['accepted', 'cooking', 'out_for_delivery'],
-            assigned_agent__isnull=True
-        )
-        serializer = OrderSerializer(orders, many=True)
+        orders = eager_load(Order.objects.dispatchable(), OrderSerializer)
+        serializer = self.get_read_serializer(orders, many=True)
         return Response(serializer.data)
     
-    @action(detail=True, methods=['post'])
-    def accept_order(self, request, pk=None):
-        """Accept a delivery order"""
+    @action(detail=False, methods=['post'], throttle_scope='dispatch')
+    def claim_next(self, request):
+        """Claim the oldest available orders (up to `count`) in one step"""
         if request.user.role != 'agent':
             return Response(
                 {'error': 'Only delivery agents can accept orders'},
@@ -48,22 +56,43 @@ class DeliveryAgentViewSet(viewsets.ViewSet):
             )
         
         try:
-            order = Order.objects.get(pk=pk)
-        except Order.DoesNotExist:
+            count = int(request.data.get('count', 1))
+        except (TypeError, ValueError):
+            count = 0
+        if not 1 <= count <= MAX_CLAIM_COUNT:
             return Response(
-                {'error': 'Order not found'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': f'count must be between 1 and {MAX_CLAIM_COUNT}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        claimed_ids = Order.objects.claim_next(request.user, limit=count)
+        publish_order_events(claimed_ids)
+        orders = eager_load(Order.objects.filter(pk__in=claimed_ids), OrderSerializer)
+        serializer = OrderSerializer(orders, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['post'])
+    def accept_order(self, request, pk=None):
+        """Accept a delivery order"""
+        if request.user.role != 'agent':
+            return Response(
+                {'error': 'Only delivery agents can accept orders'},
+                status=status.HTTP_403_FORBIDDEN
             )
         
-        if order.assigned_agent:
+        if not Order.objects.claim(pk, request.user):
+            if not Order.objects.filter(pk=pk).exists():
+                return Response(
+                    {'error': 'Order not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
             return Response(
                 {'error': 'Order already assigned to another agent'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        order.assigned_agent = request.user
-        order.save()
-        
+        publish_order_events([pk])
+        order = eager_load(Order.objects.filter(pk=pk), OrderSerializer).get()
         return Response(OrderSerializer(order).data)
     
     @action(detail=True, methods=['post'])
@@ -76,7 +105,7 @@ class DeliveryAgentViewSet(viewsets.ViewSet):
             )
         
         try:
-            order = Order.objects.get(pk=pk, assigned_agent=request.user)
+            order = eager_load(Order.objects.filter(assigned_agent=request.user), OrderSerializer).get(pk=pk)
         except Order.DoesNotExist:
             return Response(
                 {'error': 'Order not found or not assigned to you'},
@@ -100,5 +129,6 @@ class DeliveryAgentViewSet(viewsets.ViewSet):
         
         order.status = new_status
         order.save()
+        publish_order_events([order.pk])
         
         return Response(OrderSerializer(order).data)
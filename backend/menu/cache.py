@@ -0,0 +1,150 @@
+"""
+Versioned read-through cache for restaurant menus.
+
+Every restaurant has a version counter in the cache, and there is one global
+counter for changes that can touch every menu (categories). A menu payload is
+stored under a key built from both versions, so bumping either counter makes
+the old payload unreachable and it simply expires.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from common.dbrouter import use_primary
+
+GLOBAL_VERSION_KEY = 'menu:version:global'
+RESTAURANT_VERSION_KEY = 'menu:version:restaurant:{}'
+PAYLOAD_KEY = 'menu:payload:{}:{}:{}'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 15)
+
+
+def _record(event, count=1):
+    with _stats_lock:
+        _stats[event] += count
+
+
+def stats():
+    """Return hit / miss / invalidate counters for this process"""
+    with _stats_lock:
+        return {event: _stats[event] for event in ('hit', 'miss', 'invalidate')}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _fresh_version():
+    # Seed from the clock so a counter lost to eviction never reuses an old key
+    return time.time_ns()
+
+
+def _get_versions(restaurant_id):
+    cache = _cache()
+    restaurant_key = RESTAURANT_VERSION_KEY.format(restaurant_id)
+    versions = cache.get_many([GLOBAL_VERSION_KEY, restaurant_key])
+
+    missing = {}
+    if GLOBAL_VERSION_KEY not in versions:
+        missing[GLOBAL_VERSION_KEY] = _fresh_version()
+    if restaurant_key not in versions:
+        missing[restaurant_key] = _fresh_version()
+
+    for key, value in missing.items():
+        # add() keeps whichever value another worker stored first
+        if not cache.add(key, value, timeout=None):
+            value = cache.get(key, value)
+        versions[key] = value
+
+    return versions[GLOBAL_VERSION_KEY], versions[restaurant_key]
+
+
+async def _aget_versions(restaurant_id):
+    cache = _cache()
+    restaurant_key = RESTAURANT_VERSION_KEY.format(restaurant_id)
+    versions = await cache.aget_many([GLOBAL_VERSION_KEY, restaurant_key])
+
+    for key in (GLOBAL_VERSION_KEY, restaurant_key):
+        if key not in versions:
+            value = _fresh_version()
+            if not await cache.aadd(key, value, timeout=None):
+                value = await cache.aget(key, value)
+            versions[key] = value
+
+    return versions[GLOBAL_VERSION_KEY], versions[restaurant_key]
+
+
+def _bump(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), timeout=None)
+    _record('invalidate')
+
+
+def bump_restaurant_versions(restaurant_ids):
+    """Invalidate the cached menus of the given restaurants"""
+    for restaurant_id in set(restaurant_ids):
+        if restaurant_id is not None:
+            _bump(RESTAURANT_VERSION_KEY.format(restaurant_id))
+
+
+def bump_global_version():
+    """Invalidate every cached menu"""
+    _bump(GLOBAL_VERSION_KEY)
+
+
+def get_menu(restaurant_id, build):
+    """
+    Return the cached menu payload for a restaurant.
+
+    ``build`` is called on a miss and must return the serialized menu; its
+    result is stored under the current version key.
+    """
+    cache = _cache()
+    global_version, restaurant_version = _get_versions(restaurant_id)
+    key = PAYLOAD_KEY.format(restaurant_id, global_version, restaurant_version)
+
+    payload = cache.get(key)
+    if payload is not None:
+        _record('hit')
+        return payload
+
+    _record('miss')
+    # Replica lag must not end up cached under the new version
+    with use_primary():
+        payload = build()
+    cache.set(key, payload, timeout=_timeout())
+    return payload
+
+
+async def aget_menu(restaurant_id, build):
+    """Async ``get_menu``; ``build`` is a coroutine function"""
+    cache = _cache()
+    global_version, restaurant_version = await _aget_versions(restaurant_id)
+    key = PAYLOAD_KEY.format(restaurant_id, global_version, restaurant_version)
+
+    payload = await cache.aget(key)
+    if payload is not None:
+        _record('hit')
+        return payload
+
+    _record('miss')
+    with use_primary():
+        payload = await build()
+    await cache.aset(key, payload, timeout=_timeout())
+    return payload
@@ -1,10 +1,59 @@
-from django.db import models
+from django.db import models, transaction
 from restaurants.models import Restaurant
+from . import cache as menu_cache
+
+
+class CategoryQuerySet(models.QuerySet):
+    """Bulk writes skip model signals, so invalidate cached menus here"""
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        transaction.on_commit(menu_cache.bump_global_version, using=self.db)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        transaction.on_commit(menu_cache.bump_global_version, using=self.db)
+        return rows
+
+
+class MenuItemQuerySet(models.QuerySet):
+    """Bulk writes skip model signals, so invalidate cached menus here"""
+
+    def _invalidate(self, restaurant_ids):
+        restaurant_ids = set(restaurant_ids)
+        transaction.on_commit(
+            lambda: menu_cache.bump_restaurant_versions(restaurant_ids),
+            using=self.db
+        )
+
+    def update(self, **kwargs):
+        restaurant_ids = set(self.values_list('restaurant_id', flat=True).distinct())
+        rows = super().update(**kwargs)
+        target = kwargs.get('restaurant_id', kwargs.get('restaurant'))
+        if target is not None:
+            # Items moved to another restaurant invalidate the target menu too
+            restaurant_ids.add(getattr(target, 'pk', target))
+        self._invalidate(restaurant_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._invalidate(obj.restaurant_id for obj in objs)
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        self._invalidate(obj.restaurant_id for obj in objs)
+        return rows
 
 
 class Category(models.Model):
     """Category Model"""
     name = models.CharField(max_length=100, unique=True)
+
+    objects = CategoryQuerySet.as_manager()
     
     def __str__(self):
         return self.name
@@ -25,6 +74,8 @@ class MenuItem(models.Model):
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MenuItemQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
@@ -32,3 +83,6 @@ class MenuItem(models.Model):
     class Meta:
         db_table = 'menu_items'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='menu_items_created_id_idx'),
+        ]
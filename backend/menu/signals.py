@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from restaurants.models import Restaurant
+from .models import Category, MenuItem
+from . import cache as menu_cache
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+def invalidate_menu_item(sender, instance, **kwargs):
+    restaurant_id = instance.restaurant_id
+    transaction.on_commit(lambda: menu_cache.bump_restaurant_versions([restaurant_id]))
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def invalidate_restaurant(sender, instance, **kwargs):
+    restaurant_id = instance.pk
+    transaction.on_commit(lambda: menu_cache.bump_restaurant_versions([restaurant_id]))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    transaction.on_commit(menu_cache.bump_global_version)
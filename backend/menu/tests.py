@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from common.testing import APITest, make_restaurant, make_user
+from menu import cache as menu_cache
+from menu.models import Category, MenuItem
+from restaurants.models import Restaurant
+
+
+class MenuRouteTests(APITest):
+    """Every menu route, over items from several restaurants and categories"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=name) for name in ('Mains', 'Sides', 'Drinks')])
+        cls.restaurants = [
+            make_restaurant(make_user('owner'), items=4, category=category) for category in categories
+        ]
+
+    def test_categories(self):
+        response = self.client.get('/api/menu/categories/')
+        self.assertEqual([category['name'] for category in response.json()['results']], ['Mains', 'Sides', 'Drinks'])
+        category = Category.objects.get(name='Sides')
+        response = self.client.get(f'/api/menu/categories/{category.pk}/')
+        self.assertEqual(response.json(), {'id': category.pk, 'name': 'Sides'})
+
+    def test_menu_items(self):
+        response = self.client.get('/api/menu/')
+        self.assertEqual(len(response.json()['results']), 12)
+        restaurant = self.restaurants[2]
+        response = self.client.get(f'/api/menu/?restaurant={restaurant.pk}')
+        items = response.json()['results']
+        self.assertEqual(
+            {(item['restaurant_name'], item['category_name']) for item in items}, {(restaurant.name, 'Drinks')},
+        )
+
+        item = MenuItem.objects.filter(restaurant=restaurant).first()
+        response = self.client.get(f'/api/menu/{item.pk}/')
+        self.assertEqual((response.json()['name'], response.json()['price']), (item.name, f'{item.price:.2f}'))
+
+
+class MenuCacheTests(APITest):
+    """Cached menus are dropped once writes that change them commit"""
+
+    def setUp(self):
+        caches[settings.MENU_CACHE_ALIAS].clear()
+        menu_cache.reset_stats()
+        self.login_as(make_user())
+        self.category = Category.objects.create(name='Mains')
+        self.restaurant = make_restaurant(items=2, category=self.category)
+        self.url = f'/api/restaurants/{self.restaurant.pk}/menu/'
+
+    def menu(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def committed(self, write, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            write(*args, **kwargs)
+
+    def assertServes(self, field, values):
+        self.assertCountEqual([item[field] for item in self.menu()], values)
+
+    def test_counters(self):
+        self.menu()
+        self.menu()
+        self.assertEqual(menu_cache.stats(), {'hit': 1, 'miss': 1, 'invalidate': 0})
+        self.committed(MenuItem.objects.filter(restaurant=self.restaurant).update, is_available=False)
+        self.assertEqual(self.menu(), [])
+        self.assertEqual(menu_cache.stats(), {'hit': 1, 'miss': 2, 'invalidate': 1})
+
+    def test_uncommitted_writes_keep_the_cache(self):
+        items = self.menu()
+        MenuItem.objects.filter(restaurant=self.restaurant).update(name='Renamed')
+        self.assertEqual(self.menu(), items)
+
+    def test_menu_item_save_and_delete(self):
+        self.menu()
+        item = MenuItem.objects.filter(restaurant=self.restaurant).first()
+        item.name = 'Renamed'
+        self.committed(item.save)
+        self.assertIn('Renamed', [item['name'] for item in self.menu()])
+
+        self.committed(item.delete)
+        self.assertEqual(len(self.menu()), 1)
+
+        self.committed(MenuItem.objects.create, restaurant=self.restaurant, name='New', price='10.00')
+        self.assertIn('New', [item['name'] for item in self.menu()])
+
+    def test_category_save_and_delete(self):
+        self.assertServes('category_name', ['Mains', 'Mains'])
+        self.category.name = 'Specials'
+        self.committed(self.category.save)
+        self.assertServes('category_name', ['Specials', 'Specials'])
+
+        self.committed(self.category.delete)
+        self.assertServes('category', [None, None])
+
+    def test_restaurant_save_and_delete(self):
+        self.assertServes('restaurant_name', [self.restaurant.name] * 2)
+        self.restaurant.name = 'Renamed'
+        self.committed(self.restaurant.save)
+        self.assertServes('restaurant_name', ['Renamed', 'Renamed'])
+
+        self.committed(self.restaurant.delete)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_bulk_updates(self):
+        items = list(MenuItem.objects.filter(restaurant=self.restaurant))
+        self.menu()
+        self.committed(MenuItem.objects.filter(pk=items[0].pk).update, price='12.00')
+        self.assertServes('price', ['12.00', f'{items[1].price:.2f}'])
+
+        for item in items:
+            item.price = '15.00'
+        self.committed(MenuItem.objects.bulk_update, items, ['price'])
+        self.assertServes('price', ['15.00', '15.00'])
+
+        self.committed(Category.objects.update, name='Specials')
+        self.assertServes('category_name', ['Specials', 'Specials'])
+
+        self.committed(Restaurant.objects.filter(pk=self.restaurant.pk).update, name='Renamed')
+        self.assertServes('restaurant_name', ['Renamed', 'Renamed'])
+
+        self.restaurant.name = 'Renamed again'
+        self.committed(Restaurant.objects.bulk_update, [self.restaurant], ['name'])
+        self.assertServes('restaurant_name', ['Renamed again', 'Renamed again'])
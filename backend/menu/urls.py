@@ -1,11 +1,16 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, MenuItemViewSet
+from .views import CategoryViewSet, MenuItemViewSet, CategoryListView, MenuItemListView
+from common.async_views import async_read_routes
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'', MenuItemViewSet, basename='menuitem')
 
 urlpatterns = [
+    *async_read_routes(router, {
+        'category-list': CategoryListView,
+        'menuitem-list': MenuItemListView,
+    }),
     path('', include(router.urls)),
 ]
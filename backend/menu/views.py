@@ -3,9 +3,13 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from .models import Category, MenuItem
 from .serializers import CategorySerializer, MenuItemSerializer
 from restaurants.permissions import IsRestaurantOwner
+from common.pagination import CreatedAtCursorPagination
+from common.async_views import AsyncReadView
+from common.queryplan import eager_load
+from common.fastread import FastReadMixin
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(FastReadMixin, viewsets.ModelViewSet):
     """Category ViewSet"""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -16,10 +20,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated(), IsRestaurantOwner()]
 
 
-class MenuItemViewSet(viewsets.ModelViewSet):
+class MenuItemViewSet(FastReadMixin, viewsets.ModelViewSet):
     """Menu Item ViewSet"""
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
+    pagination_class = CreatedAtCursorPagination
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -27,10 +32,29 @@ class MenuItemViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated(), IsRestaurantOwner()]
     
     def get_queryset(self):
-        queryset = MenuItem.objects.all()
-        restaurant_id = self.request.query_params.get('restaurant', None)
-        
-        if restaurant_id:
-            queryset = queryset.filter(restaurant_id=restaurant_id)
-        
-        return queryset
+        return filter_menu_items(eager_load(MenuItem.objects.all(), MenuItemSerializer), self.request)
+
+
+def filter_menu_items(queryset, request):
+    restaurant_id = request.query_params.get('restaurant', None)
+    
+    if restaurant_id:
+        queryset = queryset.filter(restaurant_id=restaurant_id)
+    
+    return queryset
+
+
+class CategoryListView(AsyncReadView):
+    """Async ``GET /api/menu/categories/``"""
+    
+    async def get(self, request):
+        return await self.paginate(Category.objects.all(), CategorySerializer)
+
+
+class MenuItemListView(AsyncReadView):
+    """Async ``GET /api/menu/``"""
+    pagination_class = CreatedAtCursorPagination
+    
+    async def get(self, request):
+        queryset = filter_menu_items(eager_load(MenuItem.objects.all(), MenuItemSerializer), request)
+        return await self.paginate(queryset, MenuItemSerializer)
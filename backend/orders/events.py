@@ -0,0 +1,317 @@
+"""
+Order status events.
+
+Views publish a small delta whenever an order changes hands or status, and
+the ``/api/orders/events/`` stream forwards the deltas each user is allowed
+to see. Events travel through a pluggable broker (``ORDER_EVENTS_BROKER``)
+so they reach subscribers connected to other worker processes.
+
+A stream is held open for minutes, so it is meant for the ASGI entry point,
+where it runs as an async generator and costs no thread while it waits.
+Under WSGI it still works but occupies a worker for its whole lifetime;
+``ORDER_EVENTS_MAX_STREAMS`` caps the streams each process keeps open.
+
+When events a client should have seen are gone (its Last-Event-ID is older
+than the backlog, or the broker restarted), the stream sends a ``reset``
+event in their place; the client should then reload its orders.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+def reset_event(event_id):
+    """Stands in for events up to ``event_id`` that can no longer be read"""
+    return {'id': event_id, 'reset': True}
+
+
+class InProcessBroker:
+    """Keeps recent events in memory; subscribers must share the process"""
+
+    def __init__(self, backlog=1000, poll_interval=0.05):
+        self._events = deque(maxlen=backlog)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self.poll_interval = poll_interval
+
+    def publish(self, event):
+        with self._condition:
+            self._last_id += 1
+            event = {**event, 'id': self._last_id}
+            self._events.append(event)
+            self._condition.notify_all()
+        return event['id']
+
+    def last_id(self):
+        return self._last_id
+
+    def read(self, after_id, timeout):
+        """Return events newer than ``after_id``, waiting up to ``timeout`` seconds"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > after_id, timeout=timeout)
+            return self._newer(after_id)
+
+    def _newer(self, after_id):
+        events = [event for event in self._events if event['id'] > after_id]
+        first_id = events[0]['id'] if events else self._last_id + 1
+        if first_id > after_id + 1 and self._last_id > after_id:
+            # Older events have dropped out of the backlog
+            events.insert(0, reset_event(first_id - 1))
+        return events
+
+    async def alast_id(self):
+        return self._last_id
+
+    async def aread(self, after_id, timeout):
+        # Waiting on the condition would hold a thread, so poll the counter
+        deadline = time.monotonic() + timeout
+        while self._last_id <= after_id and time.monotonic() < deadline:
+            await asyncio.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+        with self._condition:
+            return self._newer(after_id)
+
+
+class CacheBroker:
+    """
+    Appends events to a numbered log in the Django cache.
+
+    With a shared cache backend (Redis, Memcached) every worker sees every
+    event; subscribers poll the sequence counter, which is a single cache
+    read per poll.
+    """
+    SEQUENCE_KEY = 'order-events:seq'
+    EVENT_KEY = 'order-events:{}'
+
+    def __init__(self, backlog=1000, poll_interval=0.5, alias='default'):
+        self.backlog = backlog
+        self.poll_interval = poll_interval
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def publish(self, event):
+        self.cache.add(self.SEQUENCE_KEY, 0, timeout=None)
+        event_id = self.cache.incr(self.SEQUENCE_KEY)
+        event = {**event, 'id': event_id}
+        self.cache.set(self.EVENT_KEY.format(event_id), event, timeout=self.backlog_ttl)
+        return event_id
+
+    @property
+    def backlog_ttl(self):
+        return getattr(settings, 'ORDER_EVENTS_BACKLOG_TTL', 60 * 5)
+
+    def last_id(self):
+        return self.cache.get(self.SEQUENCE_KEY, 0)
+
+    async def alast_id(self):
+        return await self.cache.aget(self.SEQUENCE_KEY, 0)
+
+    def _event_keys(self, after_id, last_id):
+        first_id = max(after_id + 1, last_id - self.backlog + 1)
+        return [self.EVENT_KEY.format(event_id) for event_id in range(first_id, last_id + 1)]
+
+    def _events(self, after_id, last_id, found):
+        """
+        Events ``after_id + 1`` to ``last_id`` in order, each run of missing
+        ones (expired, or beyond the backlog) replaced by one reset event.
+        """
+        events = []
+        for event_id in range(after_id + 1, last_id + 1):
+            event = found.get(self.EVENT_KEY.format(event_id))
+            if event is not None:
+                events.append(event)
+            elif events and events[-1].get('reset'):
+                events[-1] = reset_event(event_id)
+            else:
+                events.append(reset_event(event_id))
+        return events
+
+    def read(self, after_id, timeout):
+        deadline = time.monotonic() + timeout
+        retried = False
+        while True:
+            remaining = deadline - time.monotonic()
+            last_id = self.last_id()
+            if last_id > after_id:
+                found = self.cache.get_many(self._event_keys(after_id, last_id))
+                if len(found) == last_id - after_id or retried or remaining <= 0:
+                    return self._events(after_id, last_id, found)
+                # A publisher may be between incr() and set(); give it one
+                # poll before reporting the missing events as lost
+                retried = True
+            elif remaining <= 0:
+                return []
+            time.sleep(min(self.poll_interval, max(remaining, 0)))
+
+    async def aread(self, after_id, timeout):
+        deadline = time.monotonic() + timeout
+        retried = False
+        while True:
+            remaining = deadline - time.monotonic()
+            last_id = await self.alast_id()
+            if last_id > after_id:
+                found = await self.cache.aget_many(self._event_keys(after_id, last_id))
+                if len(found) == last_id - after_id or retried or remaining <= 0:
+                    return self._events(after_id, last_id, found)
+                retried = True
+            elif remaining <= 0:
+                return []
+            await asyncio.sleep(min(self.poll_interval, max(remaining, 0)))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(
+                    settings, 'ORDER_EVENTS_BROKER', 'orders.events.CacheBroker'
+                ))
+                _broker = broker_class()
+    return _broker
+
+
+def set_broker(broker):
+    """Swap the broker, e.g. for an ``InProcessBroker`` in tests"""
+    global _broker
+    _broker = broker
+
+
+def _publish_now(order_ids):
+    from .models import Order
+
+    broker = get_broker()
+    rows = Order.objects.filter(pk__in=order_ids).values(
+        'id', 'status', 'user_id', 'restaurant__owner_id', 'assigned_agent_id', 'updated_at'
+    )
+    for row in rows:
+        broker.publish({
+            'order': {
+                'id': row['id'],
+                'status': row['status'],
+                'assigned_agent': row['assigned_agent_id'],
+                'updated_at': row['updated_at'],
+            },
+            # Mirrors the role filters in OrderQuerySet.visible_to
+            'audience': [row['user_id'], row['restaurant__owner_id'], row['assigned_agent_id']],
+        })
+
+
+def publish_order_events(order_ids):
+    """Publish the current status of ``order_ids`` once the transaction commits"""
+    order_ids = list(order_ids)
+    if order_ids:
+        transaction.on_commit(lambda: _publish_now(order_ids))
+
+
+def can_see(user, event):
+    return user.role == 'admin' or user.pk in event['audience']
+
+
+def format_event(event):
+    if event.get('reset'):
+        return f"id: {event['id']}\nevent: reset\ndata: {{}}\n\n"
+    data = json.dumps(event['order'], cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: order\ndata: {data}\n\n"
+
+
+class StreamSlots:
+    """Counts the event streams open in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+
+    def acquire(self):
+        """Take a slot and return its (idempotent) release, or None when all are taken"""
+        with self._lock:
+            if self.open >= getattr(settings, 'ORDER_EVENTS_MAX_STREAMS', 100):
+                return None
+            self.open += 1
+
+        released = []
+
+        def release():
+            with self._lock:
+                if not released:
+                    released.append(True)
+                    self.open -= 1
+
+        return release
+
+
+stream_slots = StreamSlots()
+
+# Clients reconnect (sending Last-Event-ID) once the stream times out
+RETRY = 'retry: 3000\n\n'
+KEEPALIVE_COMMENT = ': keep-alive\n\n'
+
+
+def _stream_limits():
+    keepalive = getattr(settings, 'ORDER_EVENTS_KEEPALIVE', 15)
+    deadline = time.monotonic() + getattr(settings, 'ORDER_EVENTS_STREAM_TIMEOUT', 60 * 5)
+    return keepalive, deadline
+
+
+def _start_after(last_event_id, last_id):
+    """The id a stream reads from, and the reset event to send first (or None)"""
+    if last_event_id is None:
+        return last_id, None
+    if last_event_id > last_id:
+        # The event log restarted since the client's last event
+        return last_id, reset_event(last_id)
+    return last_event_id, None
+
+
+def stream_order_events(user, last_event_id=None):
+    """Yield Server-Sent Events for the orders ``user`` can see (blocking, for WSGI)"""
+    broker = get_broker()
+    keepalive, deadline = _stream_limits()
+    after_id, reset = _start_after(last_event_id, broker.last_id())
+
+    yield RETRY
+    if reset:
+        yield format_event(reset)
+    while time.monotonic() < deadline:
+        events = broker.read(after_id, timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+        if not events:
+            yield KEEPALIVE_COMMENT
+            continue
+        for event in events:
+            after_id = event['id']
+            if event.get('reset') or can_see(user, event):
+                yield format_event(event)
+
+
+async def astream_order_events(user, last_event_id=None):
+    """``stream_order_events`` as an async generator, for ASGI"""
+    broker = get_broker()
+    keepalive, deadline = _stream_limits()
+    after_id, reset = _start_after(last_event_id, await broker.alast_id())
+
+    yield RETRY
+    if reset:
+        yield format_event(reset)
+    while time.monotonic() < deadline:
+        events = await broker.aread(after_id, timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+        if not events:
+            yield KEEPALIVE_COMMENT
+            continue
+        for event in events:
+            after_id = event['id']
+            if event.get('reset') or can_see(user, event):
+                yield format_event(event)
@@ -0,0 +1,77 @@
+import re
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from orders.models import Order
+from orders.views import OrderViewSet
+
+User = get_user_model()
+
+PAGE_SIZE = 20
+
+
+def _order_list_queryset(role):
+    """The queryset OrderViewSet.list pages through for a user with ``role``"""
+    request = SimpleNamespace(user=User(pk=1, role=role))
+    view = OrderViewSet(request=request, action='list', format_kwarg=None)
+    return view.get_queryset().order_by('-created_at', '-id')[:PAGE_SIZE]
+
+
+def access_paths():
+    """Every orders access path served by the API, keyed by a short label"""
+    paths = {
+        f'orders list ({role})': _order_list_queryset(role)
+        for role in ('customer', 'owner', 'agent', 'admin')
+    }
+    paths['agent orders'] = Order.objects.filter(assigned_agent_id=1)
+    paths['available orders'] = Order.objects.dispatchable()
+    paths['dispatch claim'] = Order.objects.dispatchable().order_by('created_at', 'id')[:PAGE_SIZE]
+    return paths
+
+
+def full_scans(plan, vendor, table='orders'):
+    """Return the plan lines that read ``table`` without using an index"""
+    lines = plan.splitlines()
+    if vendor == 'sqlite':
+        return [
+            line for line in lines
+            if re.search(rf'\bSCAN {table}\b', line) and 'USING' not in line
+        ]
+    if vendor == 'mysql':
+        # TRADITIONAL format: id, select_type, table, partitions, type, ...
+        return [
+            line for line in lines
+            if len(line.split('\t')) > 4
+            and line.split('\t')[2] == table
+            and line.split('\t')[4] == 'ALL'
+        ]
+    if vendor == 'postgresql':
+        return [line for line in lines if f'Seq Scan on {table}' in line]
+    return []
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN every orders access path used by the API and fail if any of '
+        'them falls back to a full table scan'
+    )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        failures = []
+
+        for label, queryset in access_paths().items():
+            plan = queryset.explain()
+            scans = full_scans(plan, vendor)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'--- {label}\n{plan}\n')
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {label}: {scans[0].strip()}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'ok         {label}'))
+
+        if failures:
+            raise CommandError(f'{len(failures)} orders access path(s) use a full scan: {", ".join(failures)}')
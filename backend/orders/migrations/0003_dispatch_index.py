@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_created_id_index'),
+        ('restaurants', '0003_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['assigned_agent', 'status', 'created_at'], name='orders_dispatch_idx'),
+        ),
+    ]
@@ -1,7 +1,63 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from restaurants.models import Restaurant
 from menu.models import MenuItem
+from common import money
+
+
+class OrderQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Orders ``user`` may see, by role"""
+        if user.role == 'customer':
+            return self.filter(user=user)
+        if user.role == 'owner':
+            return self.filter(restaurant__owner=user)
+        if user.role == 'agent':
+            return self.filter(assigned_agent=user)
+        if user.role == 'admin':
+            return self.all()
+        return self.none()
+
+    def dispatchable(self):
+        """Orders waiting for a delivery agent"""
+        return self.filter(status__in=Order.DISPATCH_STATUSES, assigned_agent__isnull=True)
+
+    def claim(self, order_id, agent):
+        """
+        Assign ``order_id`` to ``agent`` if nobody holds it yet.
+
+        A single conditional UPDATE, so concurrent agents can never both win.
+        """
+        return self.filter(pk=order_id, assigned_agent__isnull=True).update(
+            assigned_agent=agent, updated_at=timezone.now()
+        ) == 1
+
+    def claim_next(self, agent, limit=1):
+        """Atomically claim up to ``limit`` of the oldest dispatchable orders"""
+        with transaction.atomic(using=self.db):
+            # SKIP LOCKED lets concurrent agents each take different rows
+            # instead of queueing behind one another
+            candidate_ids = list(
+                self.dispatchable()
+                .order_by('created_at', 'id')
+                .select_for_update(skip_locked=True)
+                .values_list('pk', flat=True)[:limit]
+            )
+            if not candidate_ids:
+                return []
+
+            claimed = self.filter(pk__in=candidate_ids, assigned_agent__isnull=True).update(
+                assigned_agent=agent, updated_at=timezone.now()
+            )
+            if claimed == len(candidate_ids):
+                return candidate_ids
+            # Backends without row locks (SQLite) can lose a race; report
+            # only the rows that really went to this agent
+            return list(
+                self.filter(pk__in=candidate_ids, assigned_agent=agent).values_list('pk', flat=True)
+            )
+
 
 class Order(models.Model):
     """Order Model"""
@@ -15,6 +71,8 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    DISPATCH_STATUSES = ['accepted', 'cooking', 'out_for_delivery']
+    
     PAYMENT_CHOICES = [
         ('cod', 'Cash on Delivery'),
         ('online', 'Online Payment'),
@@ -36,6 +94,8 @@ class Order(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrderQuerySet.as_manager()
     
     def __str__(self):
         return f"Order #{self.id} - {self.user.name}"
@@ -43,6 +103,16 @@ class Order(models.Model):
     class Meta:
         db_table = 'orders'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='orders_created_id_idx'),
+            # Customer list: user = ? ORDER BY created_at DESC
+            models.Index(fields=['user', 'created_at'], name='orders_user_created_idx'),
+            # Owner list / status filters: restaurant IN (owner's) AND status = ?
+            models.Index(fields=['restaurant', 'status', 'created_at'], name='orders_rest_status_idx'),
+            # Agent list (assigned_agent = ?) and dispatch queue
+            # (assigned_agent IS NULL AND status IN (...) ORDER BY created_at)
+            models.Index(fields=['assigned_agent', 'status', 'created_at'], name='orders_dispatch_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -55,9 +125,13 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.menu_item.name} x {self.quantity}"
     
+    @property
+    def subtotal_paise(self):
+        return money.line_subtotal(self.price, self.quantity)
+    
     @property
     def subtotal(self):
-        return self.quantity * self.price
+        return money.from_paise(self.subtotal_paise)
     
     class Meta:
         db_table = 'order_items'
@@ -1,11 +1,12 @@
 from rest_framework import serializers
 from .models import Order, OrderItem
 from menu.serializers import MenuItemSerializer
+from common.money import MoneyField
 
 class OrderItemSerializer(serializers.ModelSerializer):
     """Order Item Serializer"""
     menu_item_details = MenuItemSerializer(source='menu_item', read_only=True)
-    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    subtotal = MoneyField(source='subtotal_paise')
 
     class Meta:
         model = OrderItem
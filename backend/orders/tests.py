@@ -0,0 +1,429 @@
+import threading
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+
+from cart.models import CartItem
+from common.queryplan import eager_load
+from common.testing import APITest, access_token, fill_cart, make_order, make_restaurant, make_user
+from orders import events
+from orders.events import CacheBroker, InProcessBroker, set_broker
+from orders.management.commands.explain_order_queries import access_paths, full_scans
+from orders import models as order_models
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer
+
+URL = '/api/orders/events/'
+
+
+@override_settings(ORDER_EVENTS_STREAM_TIMEOUT=0.3, ORDER_EVENTS_KEEPALIVE=0.1)
+class OrderEventStreamTests(APITest):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_user()
+        cls.other = make_user()
+
+    def setUp(self):
+        self.broker = InProcessBroker(poll_interval=0.01)
+        set_broker(self.broker)
+        self.addCleanup(set_broker, None)
+        self.headers = {'Authorization': f'Bearer {access_token(self.customer)}', 'Last-Event-ID': '0'}
+        for order_id, audience in ((1, self.other), (2, self.customer)):
+            self.broker.publish({
+                'order': {'id': order_id, 'status': 'preparing'},
+                'audience': [audience.pk, None, None],
+            })
+
+    def assertStream(self, chunks):
+        text = ''.join(chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in chunks)
+        self.assertTrue(text.startswith('retry: 3000\n\n'))
+        self.assertIn('id: 2\nevent: order\ndata: {"id": 2, "status": "preparing"}\n\n', text)
+        self.assertNotIn('"id": 1', text)
+        self.assertTrue(text.endswith(': keep-alive\n\n'))
+
+    async def test_asgi_streams_from_an_async_generator(self):
+        response = await self.async_client.get(URL, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertStream([chunk async for chunk in response.streaming_content])
+        self.assertEqual(events.stream_slots.open, 0)
+
+    def test_wsgi_streams_from_a_generator(self):
+        response = self.client.get(URL, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        self.assertStream(response.streaming_content)
+        self.assertEqual(events.stream_slots.open, 0)
+
+    @override_settings(ORDER_EVENTS_MAX_STREAMS=1)
+    def test_streams_per_process_are_capped(self):
+        first = self.client.get(URL, headers=self.headers)
+        self.assertEqual(first.status_code, 200)
+        second = self.client.get(URL, headers=self.headers)
+        self.assertEqual(second.status_code, 503)
+        self.assertEqual(second['Retry-After'], '3')
+        first.close()
+        third = self.client.get(URL, headers=self.headers)
+        self.assertEqual(third.status_code, 200)
+        third.close()
+        self.assertEqual(events.stream_slots.open, 0)
+
+    def test_anonymous_requests_are_rejected(self):
+        self.assertEqual(self.client.get(URL).status_code, 401)
+
+
+@override_settings(ORDER_EVENTS_STREAM_TIMEOUT=0.3, ORDER_EVENTS_KEEPALIVE=0.1)
+class CacheBrokerTests(APITest):
+    """Reading the cache's event log when some events are gone"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_user()
+
+    def setUp(self):
+        cache.clear()
+        self.broker = CacheBroker(poll_interval=0.01)
+        set_broker(self.broker)
+        self.addCleanup(set_broker, None)
+        for order_id in range(1, 5):
+            self.broker.publish({'order': {'id': order_id, 'status': 'cooking'}, 'audience': [self.customer.pk]})
+
+    def expire(self, *event_ids):
+        cache.delete_many([CacheBroker.EVENT_KEY.format(event_id) for event_id in event_ids])
+
+    def ids(self, events):
+        return [('reset' if event.get('reset') else 'order', event['id']) for event in events]
+
+    def stream(self, last_event_id):
+        headers = {'Authorization': f'Bearer {access_token(self.customer)}', 'Last-Event-ID': str(last_event_id)}
+        with mock.patch.object(self.broker, 'read', wraps=self.broker.read) as read:
+            response = self.client.get(URL, headers=headers)
+            text = b''.join(response.streaming_content).decode()
+        return text, read.call_count
+
+    def test_missing_events_are_replaced_by_resets(self):
+        self.expire(1, 3)
+        self.assertEqual(
+            self.ids(self.broker.read(0, timeout=1)),
+            [('reset', 1), ('order', 2), ('reset', 3), ('order', 4)],
+        )
+        self.expire(2)
+        self.assertEqual(self.ids(self.broker.read(0, timeout=1)), [('reset', 3), ('order', 4)])
+
+    def test_event_published_during_a_read_is_waited_for(self):
+        # The sequence is bumped but the event is not stored yet
+        cache.incr(CacheBroker.SEQUENCE_KEY)
+        late = {'order': {'id': 5}, 'audience': [], 'id': 5}
+
+        def store_late_event(seconds):
+            cache.set(CacheBroker.EVENT_KEY.format(5), late)
+
+        with mock.patch.object(events.time, 'sleep', side_effect=store_late_event):
+            self.assertEqual(self.broker.read(4, timeout=1), [late])
+
+    def test_reconnect_with_an_expired_last_event_id(self):
+        self.expire(1, 2, 3, 4)
+        text, reads = self.stream(last_event_id=1)
+        self.assertEqual(text, 'retry: 3000\n\nid: 4\nevent: reset\ndata: {}\n\n' + ': keep-alive\n\n' * (reads - 1))
+        # Each read waits for new events instead of spinning on the lost ones
+        self.assertLessEqual(reads, 5)
+
+    def test_reconnect_after_the_log_restarted(self):
+        text, _ = self.stream(last_event_id=50)
+        self.assertTrue(text.startswith('retry: 3000\n\nid: 4\nevent: reset\ndata: {}\n\n'))
+
+    async def test_asgi_reconnect_with_an_expired_last_event_id(self):
+        self.expire(1, 2)
+        headers = {'Authorization': f'Bearer {access_token(self.customer)}', 'Last-Event-ID': '0'}
+        response = await self.async_client.get(URL, headers=headers)
+        text = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertIn('id: 2\nevent: reset\ndata: {}\n\nid: 3\nevent: order\n', text)
+        self.assertIn('id: 4\nevent: order\n', text)
+
+    def test_in_process_backlog_overflow_is_reset(self):
+        broker = InProcessBroker(backlog=2)
+        for order_id in range(1, 5):
+            broker.publish({'order': {'id': order_id}, 'audience': []})
+        self.assertEqual(self.ids(broker.read(1, timeout=0)), [('reset', 2), ('order', 3), ('order', 4)])
+        self.assertEqual(self.ids(broker.read(2, timeout=0)), [('order', 3), ('order', 4)])
+
+
+class CreateOrderTests(APITest):
+    url = '/api/orders/create_order/'
+    data = {'payment_method': 'cod', 'delivery_address': '1 Customer Street'}
+
+    def setUp(self):
+        cache.clear()  # checkout throttle
+        self.customer = self.login_as(make_user())
+        self.restaurant = make_restaurant(items=3)
+        self.items = list(self.restaurant.menu_items.order_by('id'))
+
+    def checkout(self):
+        return self.client.post(self.url, self.data, format='json')
+
+    def test_order_is_built_from_the_cart(self):
+        # 99.50 x 1 + 109.50 x 2 + 119.50 x 3 = 677.00; 5% tax 33.85; delivery 40.00
+        cart = fill_cart(self.customer, self.items)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['total_amount'], '750.85')
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertEqual(order.total_amount, Decimal('750.85'))
+        self.assertEqual(
+            sorted(order.items.values_list('menu_item_id', 'quantity', 'price')),
+            [(item.id, quantity, item.price) for quantity, item in enumerate(self.items, 1)],
+        )
+        self.assertFalse(cart.items.exists())
+
+    def test_second_checkout_of_the_same_cart_finds_it_empty(self):
+        fill_cart(self.customer, self.items)
+        self.assertEqual(self.checkout().status_code, 201)
+        response = self.checkout()
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Cart is empty'}))
+        self.assertEqual(Order.objects.filter(user=self.customer).count(), 1)
+
+    def test_lines_added_during_checkout_stay_in_the_cart(self):
+        cart = fill_cart(self.customer, self.items[:2])
+        bulk_create = OrderItem.objects.bulk_create
+
+        def add_concurrently(*args, **kwargs):
+            # Another request adding a line after the checkout read the cart
+            CartItem.objects.create(cart=cart, menu_item=self.items[2], quantity=1, price_snapshot=self.items[2].price)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(OrderItem.objects, 'bulk_create', add_concurrently):
+            self.assertEqual(self.checkout().status_code, 201)
+        self.assertEqual(list(cart.items.values_list('menu_item_id', flat=True)), [self.items[2].id])
+
+    def test_repriced_items_are_refreshed_and_refused(self):
+        cart = fill_cart(self.customer, self.items[:1])
+        type(self.items[0]).objects.filter(pk=self.items[0].pk).update(price=Decimal('120.00'))
+        response = self.checkout()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(cart.items.get().price_snapshot, Decimal('120.00'))
+        self.assertEqual(self.checkout().status_code, 201)
+
+    def test_items_from_two_restaurants_are_refused(self):
+        other = make_restaurant(items=1)
+        fill_cart(self.customer, [self.items[0], other.menu_items.get()])
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'All items must be from the same restaurant'})
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderEagerLoadingTests(APITest):
+
+    def setUp(self):
+        self.customer = make_user()
+        self.agent = make_user('agent')
+        self.restaurants = [make_restaurant(items=3) for _ in range(2)]
+
+    def add_orders(self, count):
+        for n in range(count):
+            make_order(self.customer, self.restaurants[n % 2], agent=self.agent, lines=3)
+
+    def queries(self, user, url):
+        self.login_as(user)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(context)
+
+    def test_plan_covers_every_relation_the_serializer_reads(self):
+        plan = eager_load(Order.objects.all(), OrderSerializer)
+        self.assertEqual(
+            set(plan.query.select_related),
+            {'user', 'restaurant', 'assigned_agent'},
+        )
+        self.add_orders(3)
+        orders = list(plan)
+        with self.assertNumQueries(0):
+            OrderSerializer(orders, many=True).data
+
+    def test_order_pages_cost_the_same_for_one_order_or_many(self):
+        admin = make_user('admin')
+        urls = [
+            (self.customer, '/api/orders/'),
+            (self.customer, '/api/orders/?format=json'),
+            (self.agent, '/api/agent/orders/'),
+            (admin, '/api/admin/orders/'),
+        ]
+        self.add_orders(1)
+        few = [self.queries(user, url) for user, url in urls]
+        self.add_orders(11)
+        self.assertEqual([self.queries(user, url) for user, url in urls], few)
+
+
+class OrderRouteTests(APITest):
+    """Order detail and status updates, among several orders"""
+
+    def setUp(self):
+        self.customer = make_user()
+        self.restaurant = make_restaurant(items=3)
+        self.orders = [make_order(self.customer, self.restaurant, lines=3) for _ in range(3)]
+        self.order = self.orders[1]
+
+    def test_detail(self):
+        self.login_as(self.customer)
+        data = self.client.get(f'/api/orders/{self.order.pk}/').json()
+        self.assertEqual(data['id'], self.order.pk)
+        self.assertEqual(len(data['items']), 3)
+        self.assertEqual(data['restaurant_name'], self.restaurant.name)
+
+    def test_detail_of_another_customers_order_is_hidden(self):
+        self.login_as(make_user())
+        self.assertEqual(self.client.get(f'/api/orders/{self.order.pk}/').status_code, 404)
+
+    def test_owner_updates_status(self):
+        self.login_as(self.restaurant.owner)
+        response = self.client.post(f'/api/orders/{self.order.pk}/update_status/', {'status': 'accepted'})
+        self.assertEqual(response.json()['status'], 'accepted')
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('status', flat=True)),
+            ['placed', 'accepted', 'placed'],
+        )
+
+    def test_invalid_status_is_refused(self):
+        self.login_as(self.restaurant.owner)
+        response = self.client.post(f'/api/orders/{self.order.pk}/update_status/', {'status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'placed')
+
+
+class DispatchClaimTests(TestCase):
+
+    def setUp(self):
+        self.agent, self.rival = make_user('agent'), make_user('agent')
+        customer = make_user()
+        restaurant = make_restaurant(items=2)
+        self.orders = [make_order(customer, restaurant, status='cooking') for _ in range(4)]
+        make_order(customer, restaurant, status='placed')
+
+    def held_by(self, agent):
+        return set(Order.objects.filter(assigned_agent=agent).values_list('pk', flat=True))
+
+    def test_claim_is_won_once(self):
+        order = self.orders[0]
+        self.assertTrue(Order.objects.claim(order.pk, self.agent))
+        self.assertFalse(Order.objects.claim(order.pk, self.rival))
+        self.assertEqual(self.held_by(self.agent), {order.pk})
+
+    def test_claim_next_takes_the_oldest_dispatchable(self):
+        self.assertEqual(Order.objects.claim_next(self.agent, limit=3), [order.pk for order in self.orders[:3]])
+        self.assertEqual(Order.objects.claim_next(self.rival, limit=3), [self.orders[3].pk])
+        self.assertEqual(Order.objects.claim_next(self.rival, limit=3), [])
+
+    def test_claim_next_reports_only_the_rows_it_won(self):
+        # A rival takes one of the candidates between the SELECT and the UPDATE,
+        # as it can on a backend without row locks
+        stolen = self.orders[1]
+        now = order_models.timezone.now
+
+        def rival_claims_first():
+            Order.objects.filter(pk=stolen.pk).update(assigned_agent=self.rival)
+            return now()
+
+        with mock.patch.object(order_models.timezone, 'now', side_effect=rival_claims_first):
+            claimed = Order.objects.claim_next(self.agent, limit=2)
+        self.assertEqual(claimed, [self.orders[0].pk])
+        self.assertEqual(self.held_by(self.agent), {self.orders[0].pk})
+        self.assertEqual(self.held_by(self.rival), {stolen.pk})
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class DispatchStressTests(TransactionTestCase):
+    """Many agents claiming at once, each on its own connection"""
+
+    AGENTS = 16
+    ORDERS = 200
+
+    def setUp(self):
+        customer = make_user()
+        restaurant = make_restaurant(items=1)
+        self.orders = [make_order(customer, restaurant, status='cooking', lines=1) for _ in range(self.ORDERS)]
+        self.agents = [make_user('agent') for _ in range(self.AGENTS)]
+        self.start = threading.Barrier(self.AGENTS)
+
+    def run_agents(self, work):
+        def run(agent):
+            try:
+                self.start.wait()
+                return work(agent)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.AGENTS) as pool:
+            return dict(zip(self.agents, pool.map(run, self.agents)))
+
+    def test_claim_next_hands_each_order_to_one_agent(self):
+        def drain(agent):
+            claimed = []
+            while batch := Order.objects.claim_next(agent, limit=3):
+                claimed += batch
+            return claimed
+
+        claims = self.run_agents(drain)
+        claimed = [pk for batch in claims.values() for pk in batch]
+        self.assertEqual(sorted(claimed), sorted(order.pk for order in self.orders))
+        for agent, batch in claims.items():
+            self.assertEqual(
+                set(Order.objects.filter(assigned_agent=agent).values_list('pk', flat=True)), set(batch)
+            )
+
+    def test_claim_of_one_order_has_one_winner(self):
+        order = self.orders[0]
+        wins = self.run_agents(lambda agent: Order.objects.claim(order.pk, agent))
+        winners = [agent for agent, won in wins.items() if won]
+        self.assertEqual(len(winners), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.assigned_agent, winners[0])
+
+
+class OrderQueryPlanTests(TestCase):
+    """Every orders access path is served by an index, per EXPLAIN"""
+
+    def test_no_access_path_scans_orders(self):
+        for label, queryset in access_paths().items():
+            with self.subTest(label):
+                plan = queryset.explain()
+                self.assertEqual(full_scans(plan, connection.vendor), [], plan)
+
+    def test_command_passes(self):
+        call_command('explain_order_queries', stdout=StringIO())
+
+    def test_command_fails_on_a_full_scan(self):
+        unindexed = {'by total': Order.objects.filter(total_amount__gt=0).order_by()}
+        with mock.patch('orders.management.commands.explain_order_queries.access_paths', return_value=unindexed):
+            with self.assertRaisesMessage(CommandError, 'by total'):
+                call_command('explain_order_queries', stdout=StringIO())
+
+    def test_full_scans_reads_each_vendors_plan(self):
+        plans = {
+            'sqlite': (
+                '2 0 0 SCAN orders USING INDEX orders_user_created_idx\n'
+                '9 0 0 SCAN orders',
+                ['9 0 0 SCAN orders'],
+            ),
+            'mysql': (
+                '1\tSIMPLE\torders\tNULL\tref\torders_user_created_idx\n'
+                '1\tSIMPLE\torders\tNULL\tALL\tNULL',
+                ['1\tSIMPLE\torders\tNULL\tALL\tNULL'],
+            ),
+            'postgresql': (
+                'Index Scan using orders_user_created_idx on orders\n'
+                '  ->  Seq Scan on orders',
+                ['  ->  Seq Scan on orders'],
+            ),
+        }
+        for vendor, (plan, scans) in plans.items():
+            with self.subTest(vendor):
+                self.assertEqual(full_scans(plan, vendor), scans)
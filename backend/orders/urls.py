@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet
+from .views import OrderViewSet, OrderListView
+from common.async_views import async_read_routes
 
 router = DefaultRouter()
 router.register(r'', OrderViewSet, basename='order')
 
 urlpatterns = [
+    *async_read_routes(router, {'order-list': OrderListView}),
     path('', include(router.urls)),
 ]
@@ -3,84 +3,128 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from .models import Order, OrderItem
 from .serializers import OrderSerializer, CreateOrderSerializer
+from .events import astream_order_events, publish_order_events, stream_order_events, stream_slots
+from .renderers import EventStreamRenderer
 from cart.models import Cart, CartItem
+from common.queryplan import eager_load
+from common.pagination import CreatedAtCursorPagination
+from common.renderers import ORJSONRenderer
+from common.async_views import AsyncReadView
+from common.fastread import FastReadMixin
+from common import money
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class EventStreamResponse(StreamingHttpResponse):
+    """Gives back the stream's slot once the server closes the response"""
+    
+    def __init__(self, streaming_content, release, **kwargs):
+        super().__init__(streaming_content, **kwargs)
+        self._release = release
+    
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._release()
+
+
+class OrderViewSet(FastReadMixin, viewsets.ModelViewSet):
     """Order ViewSet"""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+    throttle_scope = None  # set per action
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if user.role == 'customer':
-            return Order.objects.filter(user=user)
-        elif user.role == 'owner':
-            return Order.objects.filter(restaurant__owner=user)
-        elif user.role == 'agent':
-            return Order.objects.filter(assigned_agent=user)
-        elif user.role == 'admin':
-            return Order.objects.all()
-        
-        return Order.objects.none()
+        return eager_load(Order.objects.visible_to(self.request.user), OrderSerializer)
     
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_scope='checkout')
     def create_order(self, request):
         """Create order from cart"""
         serializer = CreateOrderSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        try:
-            cart = Cart.objects.get(user=request.user)
-        except Cart.DoesNotExist:
-            return Response(
-                {'error': 'Cart is empty'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        cart_items = cart.items.all()
-        if not cart_items:
-            return Response(
-                {'error': 'Cart is empty'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if all items are from the same restaurant
-        restaurants = set(item.menu_item.restaurant for item in cart_items)
-        if len(restaurants) > 1:
-            return Response(
-                {'error': 'All items must be from the same restaurant'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        restaurant = list(restaurants)[0]
-        
-        # Create order
         with transaction.atomic():
+            # Lock the cart so concurrent checkouts of it run one at a time;
+            # the second then finds the lines gone
+            try:
+                cart = Cart.objects.select_for_update().get(user=request.user)
+            except Cart.DoesNotExist:
+                return Response(
+                    {'error': 'Cart is empty'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Cart lines, their menu items and restaurants in a single query
+            cart_items = list(CartItem.objects.filter(cart=cart).select_related('menu_item__restaurant'))
+            if not cart_items:
+                return Response(
+                    {'error': 'Cart is empty'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Check if all items are from the same restaurant
+            restaurants = set(item.menu_item.restaurant_id for item in cart_items)
+            if len(restaurants) > 1:
+                return Response(
+                    {'error': 'All items must be from the same restaurant'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Revalidate against the menu rows loaded above
+            unavailable = [
+                item.menu_item.name for item in cart_items
+                if not item.menu_item.is_available or not item.menu_item.restaurant.is_active
+            ]
+            if unavailable:
+                return Response(
+                    {'error': f'Items no longer available: {", ".join(unavailable)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            repriced = [item for item in cart_items if item.price_snapshot != item.menu_item.price]
+            if repriced:
+                for item in repriced:
+                    item.price_snapshot = item.menu_item.price
+                CartItem.objects.bulk_update(repriced, ['price_snapshot'])
+                return Response(
+                    {'error': 'Prices have changed since these items were added. Please review your cart.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            subtotal, tax_amount, total_amount = money.totals(sum(item.subtotal_paise for item in cart_items))
+            
+            # Create order
             order = Order.objects.create(
                 user=request.user,
-                restaurant=restaurant,
-                total_amount=cart.total_amount,  # THIS NOW INCLUDES TAX + DELIVERY
+                restaurant_id=restaurants.pop(),
+                total_amount=money.from_paise(total_amount),  # THIS NOW INCLUDES TAX + DELIVERY
                 payment_method=serializer.validated_data['payment_method'],
                 delivery_address=serializer.validated_data['delivery_address'],
                 notes=serializer.validated_data.get('notes', ''),
             )
             
             # Create order items
-            for cart_item in cart_items:
-                OrderItem.objects.create(
+            OrderItem.objects.bulk_create([
+                OrderItem(
                     order=order,
                     menu_item=cart_item.menu_item,
                     quantity=cart_item.quantity,
                     price=cart_item.price_snapshot
                 )
+                for cart_item in cart_items
+            ])
             
-            # Clear cart
-            cart_items.delete()
+            # Clear the ordered lines only; any added since are left in the cart
+            CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
+            
+            publish_order_events([order.pk])
         
+        order = eager_load(Order.objects.filter(pk=order.pk), OrderSerializer).get()
         return Response(
             OrderSerializer(order).data,
             status=status.HTTP_201_CREATED
@@ -108,7 +152,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         # Check permissions
         user = request.user
-        if user.role == 'owner' and order.restaurant.owner != user:
+        if user.role == 'owner' and order.restaurant.owner_id != user.pk:
             return Response(
                 {'error': 'You do not have permission to update this order'},
                 status=status.HTTP_403_FORBIDDEN
@@ -116,5 +160,45 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         order.status = new_status
         order.save()
+        publish_order_events([order.pk])
         
         return Response(OrderSerializer(order).data)
+    
+    @action(detail=False, methods=['get'], renderer_classes=[EventStreamRenderer, ORJSONRenderer])
+    def events(self, request):
+        """Server-Sent Events stream of status changes for the user's orders"""
+        last_event_id = request.headers.get('Last-Event-ID')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+        
+        release = stream_slots.acquire()
+        if release is None:
+            response = Response(
+                {'detail': 'Too many open event streams, retry shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = '3'
+            return response
+        
+        # Under ASGI a sync generator would be drained to the end before
+        # anything is sent, so the stream must be the async one there
+        if isinstance(request._request, ASGIRequest):
+            stream = astream_order_events(request.user, last_event_id)
+        else:
+            stream = stream_order_events(request.user, last_event_id)
+        response = EventStreamResponse(stream, release, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+        return response
+
+
+class OrderListView(AsyncReadView):
+    """Async ``GET /api/orders/``"""
+    permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+    
+    async def get(self, request):
+        queryset = eager_load(Order.objects.visible_to(request.user), OrderSerializer)
+        return await self.paginate(queryset, OrderSerializer)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from restaurants.models import Restaurant, Review
+from restaurants.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild restaurant rating aggregates and star histograms from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        reviewed = rebuild_rating_aggregates(Restaurant, Review, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates ({reviewed} reviewed restaurants)'))
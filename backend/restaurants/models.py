@@ -1,6 +1,75 @@
-from django.db import models
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
 
+RATING_STARS = range(1, 6)
+
+
+def rating_histogram_field(stars):
+    return f'rating_count_{stars}'
+
+
+def average_rating(rating_sum, rating_count):
+    return (Decimal(rating_sum) / rating_count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+# Denormalized review aggregates; none of them appear in the menu payload
+RATING_AGGREGATE_FIELDS = {'rating', 'rating_sum', 'rating_count'} | {
+    rating_histogram_field(stars) for stars in RATING_STARS
+}
+
+
+class RestaurantQuerySet(models.QuerySet):
+    """Bulk writes skip model signals, so invalidate cached menus here"""
+
+    def _invalidate(self, restaurant_ids):
+        from menu import cache as menu_cache
+
+        restaurant_ids = set(restaurant_ids)
+        transaction.on_commit(
+            lambda: menu_cache.bump_restaurant_versions(restaurant_ids),
+            using=self.db
+        )
+
+    def update(self, **kwargs):
+        if set(kwargs) <= RATING_AGGREGATE_FIELDS:
+            return super().update(**kwargs)
+
+        restaurant_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        self._invalidate(restaurant_ids)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        if not set(fields) <= RATING_AGGREGATE_FIELDS:
+            self._invalidate(obj.pk for obj in objs)
+        return rows
+
+    def adjust_rating(self, stars, step):
+        """
+        Atomically add (``step=1``) or remove (``step=-1``) one review of
+        ``stars`` from the rating aggregates, then refresh the average.
+        A restaurant left with no reviews keeps its current ``rating``.
+        """
+        histogram_field = rating_histogram_field(stars)
+        with transaction.atomic(using=self.db):
+            self.update(**{
+                'rating_sum': F('rating_sum') + stars * step,
+                'rating_count': F('rating_count') + step,
+                histogram_field: F(histogram_field) + step,
+            })
+            # Averaged here rather than in SQL: dividing integers truncates on
+            # SQLite, and backends round ties differently
+            counted = self.filter(rating_count__gt=0).values_list('pk', 'rating_sum', 'rating_count')
+            self.bulk_update([
+                self.model(pk=pk, rating=average_rating(rating_sum, rating_count))
+                for pk, rating_sum, rating_count in counted
+            ], ['rating'])
+
 
 class Restaurant(models.Model):
     """Restaurant Model"""
@@ -8,16 +77,35 @@ class Restaurant(models.Model):
     name = models.CharField(max_length=255)
     address = models.TextField()
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_count_1 = models.PositiveIntegerField(default=0)
+    rating_count_2 = models.PositiveIntegerField(default=0)
+    rating_count_3 = models.PositiveIntegerField(default=0)
+    rating_count_4 = models.PositiveIntegerField(default=0)
+    rating_count_5 = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RestaurantQuerySet.as_manager()
     
     def __str__(self):
         return self.name
+
+    @property
+    def rating_histogram(self):
+        return {
+            str(stars): getattr(self, rating_histogram_field(stars))
+            for stars in RATING_STARS
+        }
     
     class Meta:
         db_table = 'restaurants'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='restaurants_created_id_idx'),
+        ]
 
 
 class Review(models.Model):
@@ -27,6 +115,13 @@ class Review(models.Model):
     rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is counted in the restaurant aggregates right now
+        instance._counted_rating = (instance.__dict__.get('restaurant_id'), instance.__dict__.get('rating'))
+        return instance
     
     def __str__(self):
         return f"{self.user.name} - {self.restaurant.name} ({self.rating}★)"
@@ -34,4 +129,7 @@ class Review(models.Model):
     class Meta:
         db_table = 'reviews'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='reviews_created_id_idx'),
+        ]
         unique_together = ['user', 'restaurant']
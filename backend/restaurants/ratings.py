@@ -0,0 +1,61 @@
+"""
+Bulk maintenance of the denormalized restaurant rating aggregates.
+
+Day-to-day changes are applied incrementally by the review signals; this
+module rebuilds everything from the reviews table in one grouped query.
+
+A restaurant without reviews keeps whatever ``rating`` it has (fixtures and
+imports seed one); only its counters are reset.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .models import RATING_STARS, average_rating, rating_histogram_field
+
+COUNT_FIELDS = ['rating_sum', 'rating_count'] + [
+    rating_histogram_field(stars) for stars in RATING_STARS
+]
+AGGREGATE_FIELDS = ['rating'] + COUNT_FIELDS
+
+
+def rebuild_rating_aggregates(restaurant_model, review_model, batch_size=1000):
+    """
+    Recompute every restaurant's aggregates from its reviews.
+
+    Takes the model classes so data migrations can pass historical models.
+    Returns the number of restaurants that have at least one review.
+    """
+    rows = (
+        review_model.objects
+        .order_by()
+        .values('restaurant_id')
+        .annotate(
+            rating_sum=Sum('rating'),
+            rating_count=Count('id'),
+            **{
+                rating_histogram_field(stars): Count('id', filter=Q(rating=stars))
+                for stars in RATING_STARS
+            }
+        )
+    )
+
+    reviewed = 0
+    with transaction.atomic():
+        # Only rows that counted reviews before; untouched ones are already zero
+        restaurant_model.objects.exclude(rating_count=0).update(**{field: 0 for field in COUNT_FIELDS})
+
+        batch = []
+        for row in rows.iterator():
+            restaurant_id = row.pop('restaurant_id')
+            row['rating'] = average_rating(row['rating_sum'], row['rating_count'])
+            batch.append(restaurant_model(pk=restaurant_id, **row))
+            if len(batch) >= batch_size:
+                restaurant_model.objects.bulk_update(batch, AGGREGATE_FIELDS)
+                reviewed += len(batch)
+                batch = []
+
+        if batch:
+            restaurant_model.objects.bulk_update(batch, AGGREGATE_FIELDS)
+            reviewed += len(batch)
+
+    return reviewed
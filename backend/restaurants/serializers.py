@@ -5,11 +5,15 @@ from .models import Restaurant, Review
 class RestaurantSerializer(serializers.ModelSerializer):
     """Restaurant Serializer"""
     owner_name = serializers.CharField(source='owner.name', read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
     
     class Meta:
         model = Restaurant
-        fields = ['id', 'owner', 'owner_name', 'name', 'address', 'rating', 'is_active', 'created_at']
-        read_only_fields = ['id', 'rating', 'created_at', 'owner_name']
+        fields = [
+            'id', 'owner', 'owner_name', 'name', 'address', 'rating', 'rating_count',
+            'rating_histogram', 'is_active', 'created_at'
+        ]
+        read_only_fields = ['id', 'rating', 'rating_count', 'created_at', 'owner_name']
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Restaurant, Review
+
+
+def _is_known(counted):
+    return counted is not None and None not in counted
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # Fixtures carry no aggregates; run `manage.py rebuild_ratings` after loading
+        return
+
+    counted = None if created else getattr(instance, '_counted_rating', None)
+    current = (instance.restaurant_id, instance.rating)
+
+    if counted == current:
+        return
+    if not created and not _is_known(counted):
+        # Loaded without restaurant/rating; `rebuild_ratings` can resync
+        return
+
+    with transaction.atomic():
+        if counted is not None:
+            Restaurant.objects.filter(pk=counted[0]).adjust_rating(counted[1], -1)
+        Restaurant.objects.filter(pk=current[0]).adjust_rating(current[1], 1)
+
+    instance._counted_rating = current
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    counted = getattr(instance, '_counted_rating', (instance.restaurant_id, instance.rating))
+    if _is_known(counted):
+        Restaurant.objects.filter(pk=counted[0]).adjust_rating(counted[1], -1)
@@ -0,0 +1,128 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from common.testing import APITest, make_restaurant, make_review, make_user
+from restaurants.models import Restaurant, Review
+from restaurants.ratings import rebuild_rating_aggregates
+
+
+class RatingAggregateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [make_user() for _ in range(3)]
+
+    def setUp(self):
+        self.restaurant = make_restaurant(items=0)
+
+    def review(self, rating, customer=0):
+        return make_review(self.customers[customer], self.restaurant, rating)
+
+    def rating(self, restaurant=None):
+        return Restaurant.objects.get(pk=(restaurant or self.restaurant).pk).rating
+
+    def test_average_is_not_truncated(self):
+        self.review(4)
+        self.review(5, 1)
+        self.assertEqual(self.rating(), Decimal('4.50'))
+        self.review(5, 2)
+        self.assertEqual(self.rating(), Decimal('4.67'))
+
+    def test_editing_and_deleting_reviews_move_the_average(self):
+        first = self.review(4)
+        second = self.review(5, 1)
+        first.rating = 1
+        first.save()
+        self.assertEqual(self.rating(), Decimal('3.00'))
+        second.delete()
+        restaurant = Restaurant.objects.get(pk=self.restaurant.pk)
+        self.assertEqual(
+            (restaurant.rating, restaurant.rating_count, restaurant.rating_count_5), (Decimal('1.00'), 1, 0),
+        )
+
+    def test_rebuild_matches_incremental_updates(self):
+        for customer, rating in enumerate((2, 5, 4)):
+            self.review(rating, customer)
+        incremental = Restaurant.objects.filter(pk=self.restaurant.pk).values().get()
+        Restaurant.objects.update(rating=0, rating_sum=0, rating_count=0, rating_count_5=0)
+        self.assertEqual(rebuild_rating_aggregates(Restaurant, Review), 1)
+        self.assertEqual(Restaurant.objects.filter(pk=self.restaurant.pk).values().get(), incremental)
+
+    def test_rebuild_keeps_seeded_rating_of_unreviewed_restaurants(self):
+        seeded = make_restaurant(items=0, rating=Decimal('4.30'))
+        self.review(3)
+        rebuild_rating_aggregates(Restaurant, Review)
+        self.assertEqual(self.rating(seeded), Decimal('4.30'))
+        self.assertEqual(self.rating(), Decimal('3.00'))
+
+
+class BrowseEagerLoadingTests(APITest):
+    """The DRF list views load relations up front, like their async stand-ins"""
+    urls = ['/api/restaurants/?format=json', '/api/menu/?format=json']
+
+    def queries(self):
+        counts = []
+        for url in self.urls:
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            counts.append(len(context))
+        return counts
+
+    def test_pages_cost_the_same_for_one_row_or_many(self):
+        make_restaurant(items=1)
+        few = self.queries()
+        for _ in range(6):
+            make_restaurant(make_user('owner'), items=3)
+        self.assertEqual(self.queries(), few)
+
+
+class RestaurantRouteTests(APITest):
+    """Every restaurant and review route, over several rows per relation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [make_user() for _ in range(4)]
+        cls.restaurants = [make_restaurant(make_user('owner'), items=4) for _ in range(4)]
+        for n, customer in enumerate(cls.customers):
+            for restaurant in cls.restaurants[:3]:
+                make_review(customer, restaurant, 1 + (n + restaurant.pk) % 5)
+
+    def test_restaurant_list_and_detail(self):
+        response = self.client.get('/api/restaurants/')
+        self.assertEqual(len(response.json()['results']), 4)
+        restaurant = self.restaurants[0]
+        response = self.client.get(f'/api/restaurants/{restaurant.pk}/')
+        self.assertEqual(response.json()['owner_name'], restaurant.owner.name)
+        self.assertEqual(response.json()['rating_count'], 4)
+
+    def test_restaurant_menu(self):
+        self.login_as(self.customers[0])
+        restaurant = self.restaurants[1]
+        response = self.client.get(f'/api/restaurants/{restaurant.pk}/menu/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['restaurant_name'] for item in response.json()}, {restaurant.name})
+        self.assertEqual(len(response.json()), 4)
+
+    def test_review_list_and_detail(self):
+        self.login_as(self.customers[0])
+        response = self.client.get('/api/restaurants/reviews/')
+        self.assertEqual(response.status_code, 200)
+        reviews = response.json()['results']
+        self.assertEqual(len(reviews), 12)
+        self.assertEqual(len({review['user_name'] for review in reviews}), 4)
+        response = self.client.get(f"/api/restaurants/reviews/{reviews[0]['id']}/")
+        self.assertEqual(response.json(), reviews[0])
+
+    def test_review_create_updates_the_rating(self):
+        self.login_as(self.customers[0])
+        restaurant = self.restaurants[3]
+        response = self.client.post(
+            '/api/restaurants/reviews/', {'restaurant': restaurant.pk, 'rating': 4, 'comment': 'Good'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['user'], self.customers[0].pk)
+        restaurant = self.client.get(f'/api/restaurants/{restaurant.pk}/').json()
+        self.assertEqual((restaurant['rating'], restaurant['rating_count']), ('4.00', 1))
@@ -1,11 +1,24 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
-from .views import RestaurantViewSet, ReviewViewSet
+from rest_framework.routers import DefaultRouter, SimpleRouter
+from .views import (
+    RestaurantViewSet, ReviewViewSet,
+    RestaurantListView, RestaurantDetailView, RestaurantMenuView,
+)
+from common.async_views import async_read_routes
 
 router = DefaultRouter()
 router.register(r'', RestaurantViewSet, basename='restaurant')
-router.register(r'reviews', ReviewViewSet, basename='review')
+
+# Ahead of the restaurant routes, whose <pk> would otherwise match "reviews"
+review_router = SimpleRouter()
+review_router.register(r'reviews', ReviewViewSet, basename='review')
 
 urlpatterns = [
+    path('', include(review_router.urls)),
+    *async_read_routes(router, {
+        'restaurant-list': RestaurantListView,
+        'restaurant-detail': RestaurantDetailView,
+        'restaurant-menu': RestaurantMenuView,
+    }),
     path('', include(router.urls)),
 ]
@@ -1,3 +1,4 @@
+from django.http import Http404
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -5,12 +6,20 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from .models import Restaurant, Review
 from .serializers import RestaurantSerializer, ReviewSerializer
 from .permissions import IsOwnerOrReadOnly
+from common.pagination import CreatedAtCursorPagination
+from common.async_views import AsyncReadView
+from common.queryplan import eager_load
+from common.fastread import FastReadMixin, read_serializer
 
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+class RestaurantViewSet(FastReadMixin, viewsets.ModelViewSet):
     """Restaurant ViewSet"""
     queryset = Restaurant.objects.filter(is_active=True)
     serializer_class = RestaurantSerializer
+    pagination_class = CreatedAtCursorPagination
+    
+    def get_queryset(self):
+        return eager_load(super().get_queryset(), RestaurantSerializer)
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -22,28 +31,80 @@ class RestaurantViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     def menu(self, request, pk=None):
-        """Get menu items for a restaurant"""
-        restaurant = self.get_object()
+        """Get menu items for a restaurant (served from the menu cache)"""
+        from menu import cache as menu_cache
+        from menu.models import MenuItem
+        from menu.serializers import MenuItemSerializer
+        
+        try:
+            restaurant_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        
+        def build_menu():
+            restaurant = self.get_object()
+            menu_items = MenuItem.objects.filter(restaurant=restaurant, is_available=True)
+            serializer = read_serializer(MenuItemSerializer)(menu_items, many=True)
+            return serializer.data
+        
+        return Response(menu_cache.get_menu(restaurant_id, build_menu))
+
+
+class RestaurantListView(AsyncReadView):
+    """Async ``GET /api/restaurants/``"""
+    pagination_class = CreatedAtCursorPagination
+    
+    async def get(self, request):
+        queryset = eager_load(Restaurant.objects.filter(is_active=True), RestaurantSerializer)
+        return await self.paginate(queryset, RestaurantSerializer)
+
+
+class RestaurantDetailView(AsyncReadView):
+    """Async ``GET /api/restaurants/<pk>/``"""
+    
+    async def get(self, request, pk):
+        queryset = eager_load(Restaurant.objects.filter(is_active=True), RestaurantSerializer)
+        restaurant = await self.get_object_or_404(queryset, pk=pk)
+        return Response(read_serializer(RestaurantSerializer)(restaurant).data)
+
+
+class RestaurantMenuView(AsyncReadView):
+    """Async ``GET /api/restaurants/<pk>/menu/``"""
+    # Same as RestaurantViewSet.get_permissions gives the menu action
+    permission_classes = [IsAuthenticated]
+    
+    async def get(self, request, pk):
+        from menu import cache as menu_cache
         from menu.models import MenuItem
         from menu.serializers import MenuItemSerializer
         
-        menu_items = MenuItem.objects.filter(restaurant=restaurant, is_available=True)
-        serializer = MenuItemSerializer(menu_items, many=True)
-        return Response(serializer.data)
+        try:
+            restaurant_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        
+        async def build_menu():
+            await self.get_object_or_404(Restaurant.objects.filter(is_active=True), pk=restaurant_id)
+            menu_items = eager_load(
+                MenuItem.objects.filter(restaurant_id=restaurant_id, is_available=True),
+                MenuItemSerializer
+            )
+            serializer = read_serializer(MenuItemSerializer)([item async for item in menu_items], many=True)
+            return serializer.data
+        
+        return Response(await menu_cache.aget_menu(restaurant_id, build_menu))
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(FastReadMixin, viewsets.ModelViewSet):
     """Review ViewSet"""
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [IsAuthenticated]
     
+    def get_queryset(self):
+        return eager_load(super().get_queryset(), self.get_serializer_class())
+    
     def perform_create(self, serializer):
-        review = serializer.save(user=self.request.user)
-        
-        # Update restaurant rating
-        restaurant = review.restaurant
-        reviews = Review.objects.filter(restaurant=restaurant)
-        avg_rating = sum(r.rating for r in reviews) / reviews.count()
-        restaurant.rating = round(avg_rating, 2)
-        restaurant.save()
+        # Restaurant rating aggregates are kept up to date by signals
+        serializer.save(user=self.request.user)
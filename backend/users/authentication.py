@@ -0,0 +1,174 @@
+"""
+JWT authentication that avoids loading the user row on every request.
+
+Access tokens minted by ``users.tokens.RoleRefreshToken`` carry ``role`` and
+``name`` claims. For those, the request user is a ``User`` built from the
+claims with every other field deferred, so permission classes and role
+branches need no query and anything else is loaded lazily by the ORM.
+
+Each user has a generation value in the cache, set to a new value whenever
+the user row is saved or deleted, and tokens record the generation they were
+minted at. A token minted before the user last changed (new role,
+deactivated, password reset), or whose user has no generation in the cache
+any more (evicted, flushed, another cache), is not trusted; the user is
+then loaded through a short-lived cache keyed by user id and token id
+(jti), which runs the usual ``is_active`` and revocation checks.
+``User.objects...update()`` starts new generations for the rows it changes
+too. Only writes that bypass the ORM need an explicit ``invalidate_user``;
+without one, tokens served from claims keep the old role until they expire.
+
+Generations only work if every worker sees the same cache, so the app
+refuses to start with ``WEB_CONCURRENCY`` above 1 on a per-process
+``LocMemCache``.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from common.dbrouter import use_primary
+
+ENTRY_KEY = 'auth:user:{}:{}'
+GENERATION_KEY = 'auth:user-generation:{}'
+
+# Fields served from token claims; ``User.is_active`` is implied because only
+# active users can obtain or refresh tokens
+CLAIM_FIELDS = ('role', 'name')
+GENERATION_CLAIM = 'user_gen'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def _record(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def stats():
+    """Return claims / hit / miss / invalidate counters and the cache hit ratio for this process"""
+    with _stats_lock:
+        counts = {event: _stats[event] for event in ('claims', 'hit', 'miss', 'invalidate')}
+    lookups = counts['hit'] + counts['miss']
+    counts['hit_ratio'] = counts['hit'] / lookups if lookups else 0.0
+    return counts
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _new_generation():
+    # Clock-based, so a generation lost to eviction is never handed out again
+    return time.time_ns()
+
+
+def current_generation(user_id):
+    """Return the user's generation, starting a new one if it isn't tracked"""
+    cache = _cache()
+    key = GENERATION_KEY.format(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def check_shared_cache():
+    """
+    Raise ``ImproperlyConfigured`` if several workers would each keep their
+    own generations: a user deactivated through one worker could go on using
+    their token's claims on the others until it expired.
+    """
+    workers = getattr(settings, 'WEB_CONCURRENCY', 1)
+    if workers > 1 and isinstance(_cache(), LocMemCache):
+        alias = getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')
+        raise ImproperlyConfigured(
+            f"WEB_CONCURRENCY is {workers} but the '{alias}' cache is a per-process LocMemCache; "
+            f"point CACHE_BACKEND at a shared cache such as Redis"
+        )
+
+
+def invalidate_user(user_id):
+    """Make every cached entry for ``user_id`` unreachable"""
+    _cache().set(GENERATION_KEY.format(user_id), _new_generation(), timeout=None)
+    _record('invalidate')
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that serves the user from claims or the cache"""
+
+    def get_user(self, validated_token):
+        user = self.get_claims_user(validated_token)
+        if user is not None:
+            _record('claims')
+            return user
+        return self.get_cached_user(validated_token)
+
+    def get_claims_user(self, validated_token):
+        """Build a deferred ``User`` from token claims, or return None"""
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        claims = [validated_token.get(claim) for claim in CLAIM_FIELDS]
+        token_generation = validated_token.get(GENERATION_CLAIM)
+        if user_id is None or token_generation is None or None in claims:
+            return None
+
+        generation = _cache().get(GENERATION_KEY.format(user_id))
+        if generation is None or generation != token_generation:
+            # The user changed after this token was minted, or the cache no
+            # longer knows whether they did; either way the claims may be stale
+            return None
+
+        User = get_user_model()
+        loaded = {
+            User._meta.pk.attname: User._meta.pk.to_python(user_id),
+            'is_active': True,
+            **dict(zip(CLAIM_FIELDS, claims)),
+        }
+        # from_db expects values in concrete field order
+        field_names = [f.attname for f in User._meta.concrete_fields if f.attname in loaded]
+        return User.from_db(None, field_names, [loaded[name] for name in field_names])
+
+    def get_cached_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        token_id = validated_token.get(api_settings.JTI_CLAIM)
+        if user_id is None or token_id is None:
+            return super().get_user(validated_token)
+
+        cache = _cache()
+        entry_key = ENTRY_KEY.format(user_id, token_id)
+        generation_key = GENERATION_KEY.format(user_id)
+        found = cache.get_many([entry_key, generation_key])
+        generation = found.get(generation_key)
+
+        entry = found.get(entry_key)
+        if entry is not None and generation is not None and entry[0] == generation:
+            _record('hit')
+            return entry[1]
+
+        _record('miss')
+        # Performs the usual existence, is_active and revocation checks; read
+        # from the primary so a just-deactivated account can't slip through
+        with use_primary():
+            user = super().get_user(validated_token)
+
+        if generation is None:
+            generation = current_generation(user_id)
+        cache.set(entry_key, (generation, user), timeout=_timeout())
+        return user
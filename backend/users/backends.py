@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from .hashing import arun_hashing, run_hashing
+
+UserModel = get_user_model()
+
+
+class BoundedModelBackend(ModelBackend):
+    """ModelBackend that checks passwords on the bounded hashing pool"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            run_hashing(UserModel().set_password, password)
+            return None
+
+        if run_hashing(user.check_password, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            await arun_hashing(UserModel().set_password, password)
+            return None
+
+        if await arun_hashing(user.check_password, password) and self.user_can_authenticate(user):
+            return user
+        return None
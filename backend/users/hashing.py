@@ -0,0 +1,149 @@
+"""
+Bounded executor for password hashing.
+
+PBKDF2 at 600k iterations costs hundreds of milliseconds of CPU per call. A
+login burst run directly on the request workers stalls menu and cart
+traffic, so hashing runs in a small pool sized to the CPUs we are willing
+to spend on it. Work beyond the pool and its queue is rejected immediately
+with 429 instead of piling up, as is a hash still unfinished after
+``PASSWORD_HASH_TIMEOUT`` seconds.
+
+The login and register views are async and await the pool (``arun``), so
+under ASGI a request waiting for its hash holds no worker at all. Sync
+callers (``run``) block on the result; under WSGI the pool then only caps
+how many hashes run at once.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import Throttled
+
+
+class HashingSaturated(Throttled):
+    default_detail = 'Too many sign-in requests right now, please retry shortly.'
+    default_code = 'hashing_saturated'
+
+
+class BoundedHasher:
+    """Runs callables on a fixed pool, admitting at most ``workers + queue_size`` at once"""
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        # hashlib releases the GIL, so threads hash in parallel
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def _call(self, fn, args, kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._completed += 1
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+            # Pool threads outlive requests, so don't let them hold connections
+            connections.close_all()
+
+    def _submit(self, fn, args, kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingSaturated(wait=1)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(self._call, fn, args, kwargs)
+        except BaseException:
+            self._finished(None)
+            raise
+        # The slot is held until the hash is done, even if the caller gave up
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _timed_out_error(self):
+        with self._lock:
+            self._timed_out += 1
+        return HashingSaturated(wait=1)
+
+    def run(self, fn, *args, **kwargs):
+        """Run ``fn`` on the pool and wait for it, or raise ``HashingSaturated``"""
+        future = self._submit(fn, args, kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            raise self._timed_out_error() from None
+
+    async def arun(self, fn, *args, **kwargs):
+        """``run`` for async callers: awaits the pool without blocking the event loop"""
+        future = asyncio.wrap_future(self._submit(fn, args, kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out_error() from None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'capacity': self.capacity,
+                'in_flight': self._in_flight,
+                'queued': max(self._in_flight - self.workers, 0),
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'avg_seconds': self._total_seconds / self._completed if self._completed else 0.0,
+                'max_seconds': self._max_seconds,
+            }
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                workers = getattr(settings, 'PASSWORD_HASH_WORKERS', None) or max((os.cpu_count() or 2) // 2, 1)
+                _hasher = BoundedHasher(
+                    workers=workers,
+                    queue_size=getattr(settings, 'PASSWORD_HASH_QUEUE_SIZE', workers * 4),
+                    timeout=getattr(settings, 'PASSWORD_HASH_TIMEOUT', 10),
+                )
+    return _hasher
+
+
+def run_hashing(fn, *args, **kwargs):
+    return get_hasher().run(fn, *args, **kwargs)
+
+
+async def arun_hashing(fn, *args, **kwargs):
+    return await get_hasher().arun(fn, *args, **kwargs)
+
+
+def stats():
+    """Queue depth, rejections and hash latency for this process"""
+    return get_hasher().stats()
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users.revocation import compact
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked refresh tokens that have expired (run periodically, e.g. hourly cron)'
+
+    def handle(self, *args, **options):
+        deleted = compact()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired revoked tokens'))
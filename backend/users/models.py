@@ -1,16 +1,38 @@
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.db import models, transaction
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # post_save doesn't fire for bulk updates; invalidate the cached
+        # authentication state of the users touched, as users.signals does
+        from .authentication import invalidate_user
+
+        user_ids = list(self.values_list('pk', flat=True))
+        updated = super().update(**kwargs)
+        for user_id in user_ids:
+            invalidate_user(user_id)
+        transaction.on_commit(lambda: [invalidate_user(user_id) for user_id in user_ids], using=self.db)
+        return updated
+
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
 
+    def get_queryset(self):
+        return UserQuerySet(self.model, using=self._db)
+
     def create_user(self, email, name, password=None, **extra_fields):
+        return self.create_user_with_hash(email, name, make_password(password), **extra_fields)
+
+    def create_user_with_hash(self, email, name, password_hash, **extra_fields):
+        """Create a user from an already hashed password (see users.hashing)"""
         if not email:
             raise ValueError("Users must have an email address")
 
         email = self.normalize_email(email)
-        user = self.model(email=email, name=name, **extra_fields)
-        user.set_password(password)
+        user = self.model(email=email, name=name, password=password_hash, **extra_fields)
         user.username = email   # satisfy AbstractUser
         user.save(using=self._db)
         return user
@@ -61,3 +83,13 @@ class User(AbstractUser):
         db_table = "users"
 
 
+class RevokedToken(models.Model):
+    """Durable record of a used (rotated) refresh token; see users.revocation"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+    class Meta:
+        db_table = "revoked_tokens"
@@ -0,0 +1,80 @@
+"""
+Refresh-token revocation store.
+
+With ``ROTATE_REFRESH_TOKENS`` every refresh retires the token it was given;
+presenting a retired token again must fail. Rather than checking a blacklist
+table and then writing to it:
+
+* the shared cache holds one ``add()``-only key per retired token, which
+  both checks and retires it in a single atomic round trip (two workers
+  racing on the same token can't both win), so a replay is refused
+  without touching the database;
+* a token that passes is written to ``revoked_tokens`` before the refresh
+  succeeds, so the retirement survives cache restarts and evictions; the
+  unique ``jti`` index makes that insert the check as well when the cache
+  has lost the key.
+
+``manage.py compact_revoked_tokens`` deletes rows whose tokens have expired.
+"""
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+CACHE_KEY = 'auth:revoked:{}'
+
+
+class RevocationStore:
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def consume(self, jti, expires_at):
+        """
+        Retire a refresh token. Returns False if it had already been retired.
+
+        ``expires_at`` is the token's ``exp`` claim (a Unix timestamp).
+        """
+        ttl = max(int(expires_at - time.time()), 1)
+        if not self.cache.add(CACHE_KEY.format(jti), 1, timeout=ttl):
+            return False
+
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(
+                    jti=jti,
+                    expires_at=datetime.fromtimestamp(expires_at, tz=dt_timezone.utc),
+                )
+        except IntegrityError:
+            # The cache lost this entry (restart, eviction) but the table didn't
+            return False
+        return True
+
+
+def compact(now=None):
+    """Delete table rows for tokens that have expired anyway"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RevocationStore(**getattr(settings, 'REFRESH_REVOCATION', {}))
+    return _store
@@ -1,6 +1,14 @@
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.password_validation import validate_password
+from .hashing import run_hashing
+from .revocation import get_store as get_revocation_store
+from .tokens import RoleRefreshToken
 
 User = get_user_model()
 
@@ -30,7 +38,12 @@ class RegisterSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data.pop('password2')
-        user = User.objects.create_user(**validated_data)
+        password = validated_data.pop('password')
+        # RegisterView hashes on the bounded pool itself and passes the result
+        password_hash = validated_data.pop('password_hash', None)
+        if password_hash is None:
+            password_hash = run_hashing(make_password, password)
+        user = User.objects.create_user_with_hash(password_hash=password_hash, **validated_data)
         return user
 
 
@@ -39,3 +52,36 @@ class LoginResponseSerializer(serializers.Serializer):
     access = serializers.CharField()
     refresh = serializers.CharField()
     user = UserSerializer()
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh Serializer that re-reads role/name so new access tokens are current"""
+    token_class = RoleRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        try:
+            user = User.objects.only('id', 'name', 'role', 'is_active').get(
+                **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}
+            )
+        except User.DoesNotExist:
+            user = None
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        refresh.set_user_claims(user)
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                # Each refresh token can be exchanged exactly once
+                if not get_revocation_store().consume(refresh[api_settings.JTI_CLAIM], refresh['exp']):
+                    raise InvalidToken('Token has already been used')
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .authentication import invalidate_user
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    invalidate_user(user_id)
+    # Invalidate again after commit so a request that re-cached the old row
+    # mid-transaction can't keep it
+    transaction.on_commit(lambda: invalidate_user(user_id))
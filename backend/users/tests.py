@@ -0,0 +1,252 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from common.testing import APITest, access_token, make_user
+from users import authentication
+from users.authentication import GENERATION_CLAIM, CachedJWTAuthentication
+from users.hashing import BoundedHasher, HashingSaturated
+from users.models import RevokedToken, User
+from users.tokens import RoleRefreshToken
+
+
+class CachedJWTAuthenticationTests(APITest):
+
+    def setUp(self):
+        self.admin = make_user('admin')
+        # As for a user created by another process (LocMemCache) or before a restart
+        cache.clear()
+        self.token = access_token(self.admin)
+        authentication.reset_stats()
+
+    def get_user(self):
+        return CachedJWTAuthentication().get_user(AccessToken(self.token))
+
+    def test_tokens_carry_a_non_zero_generation(self):
+        self.assertTrue(AccessToken(self.token)[GENERATION_CLAIM])
+
+    def test_unchanged_user_is_served_from_claims(self):
+        with self.assertNumQueries(0):
+            user = self.get_user()
+        self.assertEqual((user.pk, user.role, user.name), (self.admin.pk, 'admin', self.admin.name))
+        self.assertEqual(authentication.stats()['claims'], 1)
+
+    def test_claims_are_not_trusted_once_the_generation_is_gone(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            user = self.get_user()
+        self.assertEqual(authentication.stats()['claims'], 0)
+        self.assertEqual(user.pk, self.admin.pk)
+        # The lookup is cached for the token from then on
+        with self.assertNumQueries(0):
+            self.get_user()
+        self.assertEqual(authentication.stats()['hit'], 1)
+
+    def test_revoked_claims_stay_revoked_after_a_cache_flush(self):
+        url = '/api/admin/users/'
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.admin.is_active = False
+        self.admin.role = 'customer'
+        self.admin.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        cache.clear()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_lookups_are_cached_per_token_with_a_hit_ratio(self):
+        cache.clear()
+        for _ in range(4):
+            self.get_user()
+        other = AccessToken(access_token(self.admin))
+        del other[GENERATION_CLAIM]
+        CachedJWTAuthentication().get_user(other)
+        stats = authentication.stats()
+        self.assertEqual((stats['hit'], stats['miss']), (3, 2))
+        self.assertEqual(stats['hit_ratio'], 0.6)
+
+    def test_role_change_is_seen_on_the_next_request(self):
+        for lookup in ('claims', 'cache'):
+            with self.subTest(lookup):
+                if lookup == 'cache':
+                    cache.clear()
+                self.get_user()
+                self.admin.role = 'agent' if self.admin.role == 'admin' else 'admin'
+                self.admin.save()
+                self.assertEqual(self.get_user().role, self.admin.role)
+
+    def test_deactivated_user_is_locked_out_at_once(self):
+        for lookup in ('claims', 'cache'):
+            for write in ('save', 'update'):
+                with self.subTest(lookup=lookup, write=write):
+                    User.objects.filter(pk=self.admin.pk).update(is_active=True)
+                    self.admin.refresh_from_db()
+                    self.token = access_token(self.admin)
+                    if lookup == 'cache':
+                        cache.clear()
+                    self.get_user()
+                    if write == 'save':
+                        self.admin.is_active = False
+                        self.admin.save()
+                    else:
+                        User.objects.filter(pk=self.admin.pk).update(is_active=False)
+                    with self.assertRaises(AuthenticationFailed):
+                        self.get_user()
+
+    def test_raw_writes_are_picked_up_within_the_ttl(self):
+        cache.clear()
+        token = AccessToken(self.token)
+        self.get_user()
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE users SET is_active = %s WHERE id = %s', [False, self.admin.pk])
+        self.assertEqual(self.get_user().pk, self.admin.pk)
+        ttl = authentication._timeout()
+        with mock.patch('time.time', return_value=time.time() + ttl + 1):
+            with self.assertRaises(AuthenticationFailed):
+                CachedJWTAuthentication().get_user(token)
+
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    @override_settings(WEB_CONCURRENCY=4)
+    def test_several_workers_need_a_shared_cache(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'WEB_CONCURRENCY is 4'):
+            authentication.check_shared_cache()
+
+    def test_one_worker_may_use_locmem(self):
+        authentication.check_shared_cache()
+
+    @override_settings(
+        WEB_CONCURRENCY=4,
+        AUTH_USER_CACHE_ALIAS='shared',
+        CACHES={**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    )
+    def test_several_workers_with_another_backend(self):
+        authentication.check_shared_cache()
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginRegisterTests(APITest):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user(email='ada@example.com', password='correct horse 42')
+
+    def setUp(self):
+        cache.clear()  # throttle buckets
+
+    def test_login(self):
+        response = self.client.post('/api/auth/login/', {'email': 'ada@example.com', 'password': 'correct horse 42'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user'], {
+            'id': self.user.pk, 'name': self.user.name, 'email': 'ada@example.com', 'role': 'customer',
+        })
+        self.assertEqual(AccessToken(response.json()['access'])['role'], 'customer')
+
+    def test_login_errors(self):
+        url = '/api/auth/login/'
+        for data, status, body in (
+            ({'email': 'ada@example.com', 'password': 'wrong'}, 401, {'error': 'Invalid credentials'}),
+            ({'email': 'nobody@example.com', 'password': 'wrong'}, 401, {'error': 'Invalid credentials'}),
+            ({'email': 'ada@example.com'}, 400, {'error': 'Please provide both email and password'}),
+        ):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual((response.status_code, response.json()), (status, body))
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response.json()), (405, {'detail': 'Method "GET" not allowed.'}))
+
+    def test_register(self):
+        data = {
+            'name': 'Grace', 'email': 'grace@example.com', 'role': 'customer',
+            'password': 'correct horse 42', 'password2': 'correct horse 42',
+        }
+        response = self.client.post('/api/auth/register/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(email='grace@example.com')
+        self.assertTrue(user.check_password('correct horse 42'))
+        self.assertEqual(response.json()['user']['id'], user.pk)
+
+        response = self.client.post('/api/auth/register/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'email': ['user with this email already exists.']})
+
+    def test_login_throttle(self):
+        statuses = [
+            self.client.post('/api/auth/login/', {'email': 'ada@example.com', 'password': 'wrong'}).status_code
+            for _ in range(8)
+        ]
+        self.assertEqual(statuses[-1], 429)
+
+
+class BoundedHasherTests(SimpleTestCase):
+
+    async def test_saturated_pool_rejects_without_blocking_the_loop(self):
+        hasher = BoundedHasher(workers=1, queue_size=0, timeout=5)
+        release = threading.Event()
+        first = asyncio.ensure_future(hasher.arun(release.wait))
+        await asyncio.sleep(0.05)
+        self.assertEqual(hasher.stats()['in_flight'], 1)
+        with self.assertRaises(HashingSaturated):
+            await hasher.arun(lambda: None)
+        release.set()
+        self.assertTrue(await first)
+        self.assertEqual(await hasher.arun(lambda: 'done'), 'done')
+        stats = hasher.stats()
+        self.assertEqual((stats['in_flight'], stats['completed'], stats['rejected']), (0, 2, 1))
+
+
+    def test_slow_hash_times_out_as_saturated(self):
+        hasher = BoundedHasher(workers=1, queue_size=0, timeout=0.05)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaises(HashingSaturated):
+            hasher.run(release.wait)
+        self.assertEqual(hasher.stats()['timed_out'], 1)
+        release.set()
+
+    async def test_slow_async_hash_times_out_as_saturated(self):
+        hasher = BoundedHasher(workers=1, queue_size=0, timeout=0.05)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaises(HashingSaturated):
+            await hasher.arun(release.wait)
+        self.assertEqual(hasher.stats()['timed_out'], 1)
+
+class RefreshRotationTests(APITest):
+    url = '/api/auth/refresh/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.refresh = str(RoleRefreshToken.for_user(self.user))
+
+    def use(self, token):
+        return self.client.post(self.url, {'refresh': token}, format='json')
+
+    def test_rotated_token_is_retired_durably(self):
+        response = self.use(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['refresh'], self.refresh)
+        self.assertTrue(RevokedToken.objects.filter(jti=RefreshToken(self.refresh)['jti']).exists())
+
+        self.assertEqual(self.use(self.refresh).status_code, 401)
+        # A restart or eviction loses the cache key; the row still refuses the replay
+        cache.clear()
+        response = self.use(self.refresh)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Token has already been used')
+
+    def test_refreshed_access_token_carries_current_claims(self):
+        User.objects.filter(pk=self.user.pk).update(role='agent')
+        access = AccessToken(self.use(self.refresh).json()['access'])
+        self.assertEqual(access['role'], 'agent')
@@ -0,0 +1,23 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import GENERATION_CLAIM, current_generation
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the user's ``role`` and ``name``.
+
+    Permission classes and role branches can then work from the token alone;
+    see ``users.authentication.CachedJWTAuthentication``.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_user_claims(user)
+        return token
+
+    def set_user_claims(self, user):
+        self['role'] = user.role
+        self['name'] = user.name
+        # Claims are only trusted while this (never zero) generation is current
+        self[GENERATION_CLAIM] = current_generation(user.pk)
@@ -1,23 +1,32 @@
-from rest_framework import status, generics
+from asgiref.sync import sync_to_async
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
+from rest_framework.settings import api_settings
+from django.contrib.auth import aauthenticate
+from django.contrib.auth.hashers import make_password
+from common.async_views import AsyncAPIView
+from common.throttling import EmailTokenBucketThrottle
+from .hashing import arun_hashing
 from .serializers import RegisterSerializer, UserSerializer, LoginResponseSerializer
+from .tokens import RoleRefreshToken
 
 
-class RegisterView(generics.CreateAPIView):
-    """User Registration"""
+class RegisterView(AsyncAPIView):
+    """User Registration (async: the request awaits the hashing pool)"""
     permission_classes = [AllowAny]
     serializer_class = RegisterSerializer
+    throttle_scope = 'auth'
     
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        user = serializer.save()
+    async def post(self, request):
+        serializer = self.serializer_class(data=request.data, context={'request': request, 'view': self})
+        # The email uniqueness check queries
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        password_hash = await arun_hashing(make_password, serializer.validated_data['password'])
+        user = await sync_to_async(serializer.save)(password_hash=password_hash)
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = await sync_to_async(RoleRefreshToken.for_user)(user)
         
         return Response({
             'message': 'User registered successfully',
@@ -27,11 +36,13 @@ class RegisterView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
-class LoginView(generics.GenericAPIView):
-    """User Login"""
+class LoginView(AsyncAPIView):
+    """User Login (async: the request awaits the hashing pool)"""
     permission_classes = [AllowAny]
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, EmailTokenBucketThrottle]
+    throttle_scope = 'auth'
     
-    def post(self, request):
+    async def post(self, request):
         email = request.data.get('email')
         password = request.data.get('password')
         
@@ -41,7 +52,7 @@ class LoginView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        user = authenticate(request, username=email, password=password)
+        user = await aauthenticate(request, username=email, password=password)
         
         if user is None:
             return Response(
@@ -50,7 +61,7 @@ class LoginView(generics.GenericAPIView):
             )
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = await sync_to_async(RoleRefreshToken.for_user)(user)
         
         response_data = {
             'access': str(refresh.access_token),